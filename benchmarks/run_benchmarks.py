@@ -0,0 +1,365 @@
+﻿''' Benchmarks of path loading, recording, evaluation and offline accumulation on synthetic animation paths.
+
+Each case runs in its own process (one process per benchmark and path size), such that the reported peak memory
+belongs to that case alone. Vizard isn't required: unless it is installed, the viz and vizact modules are replaced
+by stand_in_viz. The results of a run are appended as one JSON line to the results file, such that runs
+(e.g. before and after a change) can be compared with --compare.
+
+usage: run_benchmarks.py [--sizes 1000,10000,...] [--only loader,recorder,...] [--output results.jsonl] [--compare] '''
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+import multiprocessing
+import numpy as np
+
+# make the dependencies package importable the way its modules import each other
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, "dependencies"))
+
+import stand_in_viz
+_STAND_IN = stand_in_viz.install()
+
+try:
+	import resource
+except ImportError:
+	# not available on Windows, peak memory isn't reported there
+	resource = None
+
+# path sizes benchmarked by default
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000, 10000000)
+
+# default results file, one JSON object per run
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# frames per second of the synthetic recordings
+SAMPLE_RATE = 60.0
+
+def syntheticPath(n, seed = 0):
+	''' returns a recording of n samples at SAMPLE_RATE as map of arrays (see path_arrays.recordsToArrays):
+	a person walking on the ground plane, looking around with smoothly changing yaw and pitch '''
+	rng = np.random.RandomState(seed)
+	time = np.arange(n) / SAMPLE_RATE
+
+	velocity = rng.randn(n, 3) * 0.02
+	velocity[:,1] = 0.0
+	position = np.cumsum(velocity, axis = 0)
+	position[:,1] += 1.8
+
+	rotation = np.zeros((n, 3))
+	rotation[:,0] = np.mod(np.cumsum(rng.randn(n) * 0.5) + 180.0, 360.0) - 180.0
+	rotation[:,1] = 25.0 * np.sin(time * 0.3) + rng.randn(n) * 0.5
+
+	return {
+		"time" : time,
+		"position" : position.astype(np.float32),
+		"rotation" : rotation.astype(np.float32),
+		"scale" : np.ones((n, 3), dtype = np.float32)
+	}
+
+def _timer():
+	return time.time() if sys.platform != 'win32' else time.clock()
+
+def _peakMemory():
+	''' returns the peak resident memory of this process in MB, or None if unknown '''
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+def _fileSize(file_name):
+	return os.path.getsize(file_name) if os.path.isfile(file_name) else None
+
+def _rate(count, seconds):
+	return count / seconds if seconds > 0.0 else None
+
+### benchmarks, each called in a separate process with (path size, working directory, options)
+### and returning a list of results (case name and measured values)
+
+def benchLoader(n, directory, options):
+	''' parse throughput of text and binary path files '''
+	import path_store
+	import path_arrays
+	from animation_path_loader import AnimationPathLoader
+
+	json_file = os.path.join(directory, "path_%d.txt" % n)
+	binary_file = os.path.join(directory, "path_%d%s" % (n, path_store.BINARY_EXTENSION))
+	size = _fileSize(json_file)
+	results = []
+
+	if n <= options.limits["loader_json"]:
+		start = _timer()
+		AnimationPathLoader(json_file)
+		seconds = _timer() - start
+		results.append({"case" : "loader_json", "seconds" : seconds, "samples_per_second" : _rate(n, seconds), "bytes_per_second" : _rate(size, seconds)})
+
+		start = _timer()
+		AnimationPathLoader(json_file, stream = True)
+		seconds = _timer() - start
+		results.append({"case" : "loader_json_stream", "seconds" : seconds, "samples_per_second" : _rate(n, seconds), "bytes_per_second" : _rate(size, seconds)})
+
+		start = _timer()
+		path_arrays.loadPathArrays(json_file)
+		seconds = _timer() - start
+		results.append({"case" : "arrays_json", "seconds" : seconds, "samples_per_second" : _rate(n, seconds), "bytes_per_second" : _rate(size, seconds)})
+
+	start = _timer()
+	arrays = path_store.openBinary(binary_file)
+	checksum = float(arrays["time"].sum() + arrays["rotation"].sum())
+	seconds = _timer() - start
+	results.append({"case" : "arrays_binary", "seconds" : seconds, "samples_per_second" : _rate(n, seconds), "checksum" : checksum})
+
+	if n <= options.limits["loader_binary"]:
+		start = _timer()
+		AnimationPathLoader(binary_file)
+		seconds = _timer() - start
+		results.append({"case" : "loader_binary", "seconds" : seconds, "samples_per_second" : _rate(n, seconds)})
+	return results
+
+def benchRecorder(n, directory, options):
+	''' per frame capture cost of AnimationPathRecorder and the cost of writing the recording '''
+	from animation_path_recorder import AnimationPathRecorder
+
+	results = []
+	path = syntheticPath(n)
+	if n <= options.limits["recorder_capture"]:
+		positions = path["position"].tolist()
+		rotations = path["rotation"].tolist()
+		stand_in_viz.reset()
+		recorder = AnimationPathRecorder()
+
+		start = _timer()
+		for position, rotation in zip(positions, rotations):
+			recorder.setPosition(position)
+			recorder.setEuler(rotation)
+			stand_in_viz.step(1.0 / SAMPLE_RATE)
+		seconds = _timer() - start
+		recorder.stop()
+		results.append({"case" : "capture", "seconds" : seconds, "us_per_sample" : 1e6 * seconds / n,
+			"stand_in" : _STAND_IN})
+	else:
+		# beyond the capture limit the recording is filled directly
+		recorder = AnimationPathRecorder(start = False)
+		recorder._data.extend(path)
+
+	if n <= options.limits["recorder_json"]:
+		json_file = os.path.join(directory, "recorded_%d" % n)
+		start = _timer()
+		recorder.writeToFile(json_file)
+		seconds = _timer() - start
+		results.append({"case" : "write_json", "seconds" : seconds, "us_per_sample" : 1e6 * seconds / n, "bytes" : _fileSize(json_file + ".txt")})
+
+	binary_file = os.path.join(directory, "recorded_%d" % n)
+	start = _timer()
+	recorder.writeToBinaryFile(binary_file)
+	seconds = _timer() - start
+	results.append({"case" : "write_binary", "seconds" : seconds, "us_per_sample" : 1e6 * seconds / n, "bytes" : _fileSize(binary_file + ".path")})
+	return results
+
+def benchEvaluation(n, directory, options):
+	''' pose queries of PathEvaluator: batches of times and single times through a cursor '''
+	from path_evaluator import PathEvaluator, LOOP
+
+	path = syntheticPath(n)
+	results = []
+
+	start = _timer()
+	evaluator = PathEvaluator(path, LOOP)
+	seconds = _timer() - start
+	results.append({"case" : "build", "seconds" : seconds, "samples_per_second" : _rate(n, seconds)})
+
+	# queries at twice the recording rate, running over the end once
+	times = np.arange(2 * n) / (2.0 * SAMPLE_RATE) * 1.5
+	start = _timer()
+	for offset in range(0, len(times), 1 << 20):
+		evaluator.evaluate(times[offset:offset + (1 << 20)])
+	seconds = _timer() - start
+	results.append({"case" : "batch", "seconds" : seconds, "queries" : len(times), "queries_per_second" : _rate(len(times), seconds)})
+
+	count = min(len(times), options.limits["evaluation_cursor"])
+	cursor = evaluator.cursor()
+	queries = times[:count].tolist()
+	start = _timer()
+	for t in queries:
+		cursor.evaluate(t)
+	seconds = _timer() - start
+	results.append({"case" : "cursor", "seconds" : seconds, "queries" : count, "queries_per_second" : _rate(count, seconds)})
+	return results
+
+def benchAccumulation(n, directory, options):
+	''' offline accumulation of all samples into a cube of the configured resolution '''
+	from view_accumulator_offline import OfflineViewAccumulatorCube
+	from view_math import FACE_NAMES
+
+	if n > options.limits["accumulation"]:
+		return []
+
+	path = syntheticPath(n)
+	accumulator = OfflineViewAccumulatorCube(resolution = options.resolution)
+	start = _timer()
+	accumulator.accumulateRotations(path["rotation"])
+	seconds = _timer() - start
+	texels = len(FACE_NAMES) * options.resolution * options.resolution
+	return [{"case" : "cube", "seconds" : seconds, "resolution" : options.resolution,
+		"us_per_sample" : 1e6 * seconds / n, "ns_per_sample_texel" : 1e9 * seconds / (n * float(texels))}]
+
+BENCHMARKS = (
+	("loader", benchLoader),
+	("recorder", benchRecorder),
+	("evaluation", benchEvaluation),
+	("accumulation", benchAccumulation)
+)
+
+# largest path size per case (cases in pure Python or with text files take minutes beyond)
+DEFAULT_LIMITS = {
+	"loader_json" : 1000000,
+	"loader_binary" : 1000000,
+	"recorder_capture" : 1000000,
+	"recorder_json" : 1000000,
+	"evaluation_cursor" : 1000000,
+	"accumulation" : 100000
+}
+
+class _Options(object):
+	''' settings handed to the benchmark processes '''
+	pass
+
+def _runCase(queue, func, n, directory, options):
+	''' process entry point: runs a benchmark and reports its results and peak memory '''
+	try:
+		baseline = _peakMemory()
+		results = func(n, directory, options)
+		peak = _peakMemory()
+		for result in results:
+			result["peak_memory_mb"] = peak
+			result["baseline_memory_mb"] = baseline
+		queue.put((True, results))
+	except Exception as e:
+		queue.put((False, "%s: %s" % (type(e).__name__, e)))
+
+def runIsolated(func, n, directory, options):
+	''' runs a benchmark in a new process, returns its list of results '''
+	queue = multiprocessing.Queue()
+	process = multiprocessing.Process(target = _runCase, args = (queue, func, n, directory, options))
+	process.start()
+	ok, results = queue.get()
+	process.join()
+	if not ok:
+		raise RuntimeError(results)
+	return results
+
+def _prepareFiles(n, directory):
+	''' writes the synthetic path of size n as text and binary file, returns the time it took '''
+	import path_store
+
+	start = _timer()
+	path = syntheticPath(n)
+	path_store.writeJson(os.path.join(directory, "path_%d" % n), path)
+	path_store.writeBinary(os.path.join(directory, "path_%d" % n), path)
+	return _timer() - start
+
+def _gitCommit():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd = _ROOT, stderr = subprocess.STDOUT).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def runBenchmarks(sizes = DEFAULT_SIZES, names = None, resolution = 64, limits = None, verbose = True):
+	''' runs the selected benchmarks (all by default) for each path size.
+	Returns the run as dict (environment and list of results). '''
+	options = _Options()
+	options.resolution = resolution
+	options.limits = dict(DEFAULT_LIMITS)
+	options.limits.update(limits or {})
+
+	selected = [(name, func) for name, func in BENCHMARKS if names is None or name in names]
+	run = {
+		"timestamp" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"commit" : _gitCommit(),
+		"python" : platform.python_version(),
+		"numpy" : np.__version__,
+		"platform" : platform.platform(),
+		"viz" : "stand-in" if _STAND_IN else "vizard",
+		"results" : []
+	}
+
+	directory = tempfile.mkdtemp(prefix = "heatmap_bench_")
+	try:
+		for n in sizes:
+			if any(name == "loader" for name, func in selected):
+				seconds = _prepareFiles(n, directory)
+				if verbose:
+					print "prepared %d samples (%.1f s)" % (n, seconds)
+			for name, func in selected:
+				for result in runIsolated(func, n, directory, options):
+					result["benchmark"] = name
+					result["samples"] = n
+					run["results"].append(result)
+					if verbose:
+						print "%-12s %-20s %10d  %9.4f s  %s MB" % (name, result["case"], n, result["seconds"],
+							"%.0f" % result["peak_memory_mb"] if result["peak_memory_mb"] is not None else "-")
+			for name in os.listdir(directory):
+				os.remove(os.path.join(directory, name))
+	finally:
+		shutil.rmtree(directory, ignore_errors = True)
+	return run
+
+def appendRun(run, file_name = DEFAULT_OUTPUT):
+	''' appends a run to the results file (one JSON object per line) '''
+	with open(file_name, 'a') as results_file:
+		results_file.write(json.dumps(run, sort_keys = True) + "\n")
+
+def loadRuns(file_name = DEFAULT_OUTPUT):
+	''' returns all runs of a results file, oldest first '''
+	if not os.path.isfile(file_name):
+		return []
+	with open(file_name) as results_file:
+		return [json.loads(line) for line in results_file if len(line.strip()) > 0]
+
+def compareRuns(previous, current):
+	''' returns (benchmark, case, samples, previous seconds, current seconds, speedup) for all cases measured in both runs '''
+	def key(result):
+		return (result["benchmark"], result["case"], result["samples"])
+	before = dict((key(result), result) for result in previous["results"])
+	rows = []
+	for result in current["results"]:
+		if key(result) in before and result["seconds"] > 0.0:
+			old = before[key(result)]["seconds"]
+			rows.append(key(result) + (old, result["seconds"], old / result["seconds"]))
+	return rows
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "benchmarks on synthetic animation paths")
+	parser.add_argument("--sizes", default = ",".join(str(n) for n in DEFAULT_SIZES), help = "comma separated path sizes")
+	parser.add_argument("--only", default = None, help = "comma separated benchmarks (%s)" % ", ".join(name for name, func in BENCHMARKS))
+	parser.add_argument("--resolution", type = int, default = 64, help = "face resolution of the accumulation benchmark")
+	parser.add_argument("--no-limits", action = "store_true", help = "run every case at every size")
+	parser.add_argument("--output", default = DEFAULT_OUTPUT, help = "results file (JSON lines)")
+	parser.add_argument("--compare", action = "store_true", help = "only compare the last two runs of the results file")
+	args = parser.parse_args()
+
+	if args.compare:
+		runs = loadRuns(args.output)
+		if len(runs) < 2:
+			print "need at least two runs in " + args.output
+			sys.exit(1)
+		print "%s (%s) -> %s (%s)" % (runs[-2]["timestamp"], runs[-2]["commit"], runs[-1]["timestamp"], runs[-1]["commit"])
+		for benchmark, case, samples, old, new, speedup in compareRuns(runs[-2], runs[-1]):
+			print "%-12s %-20s %10d  %9.4f s -> %9.4f s  x%.2f" % (benchmark, case, samples, old, new, speedup)
+		sys.exit(0)
+
+	limits = None
+	if args.no_limits:
+		limits = dict((name, sys.maxsize) for name in DEFAULT_LIMITS)
+	names = args.only.split(",") if args.only else None
+
+	run = runBenchmarks([int(n) for n in args.sizes.split(",")], names, args.resolution, limits)
+	appendRun(run, args.output)
+	print "Results of %d cases appended to %s" % (len(run["results"]), args.output)
@@ -0,0 +1,170 @@
+﻿''' Minimal stand-ins for the Vizard modules viz and vizact, such that the recorder, loader and player
+can be benchmarked headless. Only the calls made by the dependencies package are provided.
+Frames are advanced explicitly with step(), which calls all update events like Vizard does once per frame. '''
+
+import sys
+import types
+
+# loop modes (values only need to be distinct)
+OFF = 0
+LOOP = 1
+SWING = 2
+
+class _Clock(object):
+	''' frame time and number of the simulated session '''
+	frame_time = 0.0
+	frame_number = 0
+
+# registered update events, list of (priority, order, event)
+_events = []
+
+class _UpdateEvent(object):
+	''' counterpart of the object returned by vizact.onupdate '''
+
+	def __init__(self, priority, func, args):
+		self._func = func
+		self._args = args
+		self._enabled = True
+		_events.append((priority, len(_events), self))
+		_events.sort(key = lambda entry: entry[:2])
+
+	def __call__(self):
+		if self._enabled:
+			self._func(*self._args)
+
+	def setEnabled(self, enabled):
+		self._enabled = bool(enabled)
+
+	def getEnabled(self):
+		return self._enabled
+
+	def remove(self):
+		_events[:] = [entry for entry in _events if entry[2] is not self]
+
+def onupdate(priority, func, *args):
+	return _UpdateEvent(priority, func, args)
+
+def step(dt = 1.0 / 60.0):
+	''' advances the frame time by dt and calls all enabled update events (ordered by priority) '''
+	_Clock.frame_time += dt
+	_Clock.frame_number += 1
+	for priority, order, event in list(_events):
+		event()
+
+def reset():
+	''' removes all update events and resets the frame time '''
+	del _events[:]
+	_Clock.frame_time = 0.0
+	_Clock.frame_number = 0
+
+def getFrameTime():
+	return _Clock.frame_time
+
+def getFrameNumber():
+	return _Clock.frame_number
+
+class _Node(object):
+	''' transform holder standing in for viz nodes '''
+
+	_next_id = 1
+
+	def __init__(self):
+		self.id = _Node._next_id
+		_Node._next_id += 1
+		self._position = [0.0, 0.0, 0.0]
+		self._euler = [0.0, 0.0, 0.0]
+		self._scale = [1.0, 1.0, 1.0]
+
+	def setPosition(self, *position):
+		self._position = list(position[0] if len(position) == 1 else position)
+
+	def getPosition(self):
+		return list(self._position)
+
+	def setEuler(self, *euler):
+		self._euler = list(euler[0] if len(euler) == 1 else euler)
+
+	def getEuler(self):
+		return list(self._euler)
+
+	def setScale(self, *scale):
+		self._scale = list(scale[0] if len(scale) == 1 else scale)
+
+	def getScale(self):
+		return list(self._scale)
+
+	def remove(self):
+		pass
+
+class VizNode(_Node):
+	''' base class of nodes implemented in Python (viz.VizNode) '''
+
+	def __init__(self, id = None, **kwargs):
+		_Node.__init__(self)
+		if id is not None:
+			self.id = id
+
+class _AnimationPath(object):
+	''' keeps control points in insertion order, like viz.addAnimationPath '''
+
+	def __init__(self):
+		self._times = []
+		self._points = []
+		self._time = 0.0
+		self._loop_mode = OFF
+
+	def addControlPoint(self, time, point):
+		self._times.append(time)
+		self._points.append(point)
+
+	def getControlPointCount(self):
+		return len(self._points)
+
+	def getDuration(self):
+		if len(self._times) == 0:
+			return 0.0
+		return max(self._times)
+
+	def setTime(self, time):
+		self._time = time
+
+	def getTime(self):
+		return self._time
+
+	def setLoopMode(self, mode):
+		self._loop_mode = mode
+
+	def getLoopMode(self):
+		return self._loop_mode
+
+def addGroup():
+	return _Node()
+
+def addControlPoint():
+	return _Node()
+
+def addAnimationPath():
+	return _AnimationPath()
+
+def install(force = False):
+	''' registers the stand-ins as modules viz and vizact, unless Vizard is available (or force is set).
+	Returns True if the stand-ins are used. '''
+	if not force:
+		try:
+			import viz
+			return False
+		except ImportError:
+			pass
+
+	this = sys.modules[__name__]
+	viz = types.ModuleType('viz')
+	for name in ('OFF', 'LOOP', 'SWING', 'VizNode', 'getFrameTime', 'getFrameNumber', 'addGroup', 'addControlPoint', 'addAnimationPath'):
+		setattr(viz, name, getattr(this, name))
+	viz.MainView = _Node()
+
+	vizact = types.ModuleType('vizact')
+	vizact.onupdate = onupdate
+
+	sys.modules['viz'] = viz
+	sys.modules['vizact'] = vizact
+	return True
@@ -0,0 +1,238 @@
+﻿''' Checkpoints of accumulated view intensities, which new sessions can be folded into without recomputing old ones.
+
+Accumulation only ever adds intensity, so the faces of several sessions captured with the same parameters
+(frame_weight, aperture_scale, resolution) sum up to the faces of capturing all of them at once.
+A checkpoint keeps these raw sums (float32, unclamped) together with the sample count, the parameters
+and the sources (recording hashes) folded in so far. It is stored as HDR cube file (see cube_hdr),
+so it can be displayed directly (displayHeatmap(hdr_file = ...)).
+
+Folding a recording (foldFile) accumulates the new recording only and adds its faces.
+Live captures (ViewAccumulatorCube) are folded from their 8 bit output textures (foldLive), which clamp at 1.0.
+As clamped and unclamped sums don't add up, the kind of capture is a parameter as well ("clamped"):
+a checkpoint holds either live or offline sessions.
+Checkpoints with the same parameters merge pairwise (merge), mergeCheckpointFiles reduces many of them as a tree
+on a process pool. '''
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+
+from view_math import FACE_NAMES
+from cube_io import loadFaces
+from cube_hdr import writeHDR, readHDR, HDR_EXTENSION
+from view_accumulator_offline import OfflineViewAccumulatorCube
+from result_cache import hashFile
+
+# format version stored in the header of checkpoint files
+CHECKPOINT_VERSION = 1
+
+# parameters which have to match for checkpoints to merge
+# ("clamped" is True for live captures, sessions and headers without it are unclamped)
+PARAMETERS = ("frame_weight", "aperture_scale", "resolution", "clamped")
+
+class Checkpoint(object):
+	''' Raw accumulated intensities per face, sample count, parameters and sources of one or more sessions. '''
+
+	def __init__(self, frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024, clamped = False):
+		self._parameters = {"frame_weight" : frame_weight, "aperture_scale" : aperture_scale, "resolution" : resolution, "clamped" : clamped}
+		self._faces = dict((face, np.zeros((resolution, resolution), dtype = np.float32)) for face in FACE_NAMES)
+		self._sample_count = 0
+		self._sources = []
+
+	@classmethod
+	def load(cls, file_name):
+		''' reads a checkpoint file (faces are copied, such that further sessions can be folded in) '''
+		faces, header = readHDR(file_name)
+		if "checkpoint" not in header:
+			raise IOError("not a checkpoint file: " + file_name)
+		checkpoint = cls(header["frame_weight"], header["aperture_scale"], header["resolution"], header.get("clamped", False))
+		for face in FACE_NAMES:
+			checkpoint._faces[face][:] = faces[face]
+		checkpoint._sample_count = header["sample_count"]
+		checkpoint._sources = [str(source) for source in header["sources"]]
+		return checkpoint
+
+	@classmethod
+	def fromAccumulator(cls, accumulator, source = None):
+		''' returns a checkpoint of an OfflineViewAccumulatorCube '''
+		checkpoint = cls(accumulator.getFrameWeight(), accumulator.getApertureScale(), accumulator.getResolution())
+		checkpoint.foldFaces(accumulator.getOutputFaces(), accumulator.getSampleCount(), source)
+		return checkpoint
+
+	def save(self, file_name):
+		''' writes the checkpoint to an HDR cube file, returns its file name '''
+		if not file_name.endswith(HDR_EXTENSION):
+			file_name += HDR_EXTENSION
+		metadata = dict(self._parameters)
+		metadata.update({"checkpoint" : CHECKPOINT_VERSION, "sample_count" : self._sample_count, "sources" : self._sources})
+		writeHDR(file_name, self._faces, metadata)
+		return file_name
+
+	def getParameters(self):
+		return dict(self._parameters)
+
+	def getFaces(self):
+		''' returns map of face name to float32 intensity array '''
+		return self._faces
+
+	def getSampleCount(self):
+		return self._sample_count
+
+	def isClamped(self):
+		''' returns True if the checkpoint holds live captures (clamped at 1.0) '''
+		return self._parameters["clamped"]
+
+	def getSources(self):
+		return list(self._sources)
+
+	def contains(self, source):
+		''' returns True if source has been folded in '''
+		return source in self._sources
+
+	def isCompatible(self, parameters):
+		''' returns True if sessions accumulated with parameters (dict) can be folded in '''
+		parameters = dict(parameters)
+		parameters.setdefault("clamped", False)
+		return all(parameters[name] == self._parameters[name] for name in PARAMETERS)
+
+	def _checkSources(self, sources):
+		duplicates = set(self._sources).intersection(sources)
+		if len(duplicates) > 0:
+			raise ValueError("sources already folded into checkpoint: " + ", ".join(sorted(duplicates)))
+
+	def foldFaces(self, faces, sample_count, source = None, parameters = None):
+		''' adds the faces (map of face name to intensity array) of a session accumulated with the same parameters.
+		If the parameters of the session are given (dict, e.g. an HDR cube header), they are checked. '''
+		if parameters != None and not self.isCompatible(parameters):
+			raise ValueError("session parameters don't match checkpoint %s" % self._parameters)
+		if source != None:
+			self._checkSources([source])
+		for face in FACE_NAMES:
+			self._faces[face] += faces[face]
+		self._sample_count += sample_count
+		if source != None:
+			self._sources.append(source)
+
+	def foldFile(self, file_name, rate = None):
+		''' accumulates a recording (see OfflineViewAccumulatorCube.accumulateFile) and adds it.
+		Recordings are identified by the hash of their contents and can only be folded in once. '''
+		if self.isClamped():
+			raise ValueError("recordings can't be folded into a checkpoint of live captures")
+		source = hashFile(file_name)
+		self._checkSources([source])
+		accumulator = OfflineViewAccumulatorCube(self._parameters["frame_weight"], self._parameters["aperture_scale"], self._parameters["resolution"])
+		accumulator.accumulateFile(file_name, rate)
+		self.foldFaces(accumulator.getOutputFaces(), accumulator.getSampleCount(), source)
+		return accumulator.getSampleCount()
+
+	def foldLive(self, accumulator, sample_count, source = None):
+		''' adds the output of a ViewAccumulatorCube (requires Vizard), which captured sample_count frames.
+		Its 8 bit textures are read back, so intensities above 1.0 are clamped (requires a clamped checkpoint). '''
+		parameters = {
+			"frame_weight" : accumulator.getFrameWeight(),
+			"aperture_scale" : accumulator.getApertureScale(),
+			"resolution" : accumulator.getResolution(),
+			"clamped" : True
+		}
+		if not self.isCompatible(parameters):
+			raise ValueError("session parameters don't match checkpoint %s" % self._parameters)
+
+		directory = tempfile.mkdtemp()
+		try:
+			accumulator.saveAll("live", directory, mip_min_size = None)
+			self.foldFaces(loadFaces("live", directory), sample_count, source, parameters)
+		finally:
+			shutil.rmtree(directory, ignore_errors = True)
+
+	def merge(self, other):
+		''' adds another checkpoint with the same parameters and disjoint sources (in place) '''
+		self._checkSources(other._sources)
+		self.foldFaces(other._faces, other._sample_count, parameters = other._parameters)
+		self._sources += other._sources
+
+def openCheckpoint(file_name, frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024, clamped = False):
+	''' loads a checkpoint file, or returns an empty checkpoint with the given parameters if there is none '''
+	if os.path.isfile(file_name) or os.path.isfile(file_name + HDR_EXTENSION):
+		return Checkpoint.load(file_name)
+	return Checkpoint(frame_weight, aperture_scale, resolution, clamped)
+
+def mergeCheckpoints(checkpoints):
+	''' merges checkpoints pairwise as a tree (the first checkpoint of each pair is updated in place).
+	Returns the resulting checkpoint. '''
+	level = list(checkpoints)
+	if len(level) == 0:
+		raise ValueError("no checkpoints to merge")
+	while len(level) > 1:
+		for i in range(0, len(level) - 1, 2):
+			level[i].merge(level[i + 1])
+		level = level[::2]
+	return level[0]
+
+def _mergePair(task):
+	''' process pool task: merges two checkpoint files into out_file, returns out_file '''
+	first, second, out_file = task
+	checkpoint = Checkpoint.load(first)
+	checkpoint.merge(Checkpoint.load(second))
+	return checkpoint.save(out_file)
+
+def mergeCheckpointFiles(file_names, out_file, processes = None):
+	''' merges checkpoint files pairwise as a tree on a process pool, such that each worker holds two checkpoints.
+	processes specifies the size of the process pool (default: number of CPUs, 1 runs in this process).
+	Returns the file name of the merged checkpoint. '''
+	level = list(file_names)
+	if len(level) == 0:
+		raise ValueError("no checkpoints to merge")
+	if len(level) == 1:
+		return Checkpoint.load(level[0]).save(out_file)
+
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	processes = max(1, min(processes, len(level) // 2))
+
+	# intermediate levels are written next to the output
+	directory = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(out_file)))
+	pool = None
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+	try:
+		depth = 0
+		while len(level) > 1:
+			tasks = [(level[i], level[i + 1], os.path.join(directory, "level%d_%d" % (depth, i // 2)))
+				for i in range(0, len(level) - 1, 2)]
+			merged = pool.map(_mergePair, tasks) if pool is not None else [_mergePair(task) for task in tasks]
+			if len(level) % 2 == 1:
+				merged.append(level[-1])
+			level = merged
+			depth += 1
+
+		if not out_file.endswith(HDR_EXTENSION):
+			out_file += HDR_EXTENSION
+		shutil.move(level[0], out_file)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		shutil.rmtree(directory, ignore_errors = True)
+	return out_file
+
+if __name__ == '__main__':
+	import sys
+
+	if len(sys.argv) < 4 or sys.argv[1] not in ('fold', 'merge'):
+		print "usage: accumulation_checkpoint.py fold <checkpoint" + HDR_EXTENSION + "> <recording> [<recording> ...]"
+		print "       accumulation_checkpoint.py merge <output" + HDR_EXTENSION + "> <checkpoint> <checkpoint> [...]"
+		sys.exit(1)
+
+	if sys.argv[1] == 'fold':
+		file_name = sys.argv[2]
+		checkpoint = openCheckpoint(file_name)
+		for recording in sys.argv[3:]:
+			if checkpoint.contains(hashFile(recording)):
+				print "%s: already folded in" % recording
+				continue
+			print "%s: %d samples" % (recording, checkpoint.foldFile(recording))
+		print "Saved %d sessions (%d samples) to %s" % (len(checkpoint.getSources()), checkpoint.getSampleCount(), checkpoint.save(file_name))
+	else:
+		print "Merged into %s" % mergeCheckpointFiles(sys.argv[3:], sys.argv[2])
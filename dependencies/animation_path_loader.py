@@ -1,19 +1,28 @@
 ﻿import viz
 import json
 
+import path_arrays
+import path_store
+
 class AnimationPathLoader:
 	"""can load JSON files containing animation path descriptions 
-	   to create the corresponding animation path"""
+	   to create the corresponding animation path.
+	   If 'stream' is set to True records are parsed incrementally and the raw JSON data is not kept,
+	   such that memory usage does not grow with the length of the recording.
+	   Binary path files (file name ending with path_store.BINARY_EXTENSION) are opened via mmap."""
 	   
 	## constructor
-	def __init__(self, file_name = ""):
+	def __init__(self, file_name = "", stream = False):
 		# the name of the current file being parsed
 		self._file_name = ""
 		self.setFileName(file_name)
 
-		# raw JSON data read
+		# raw JSON data read (not used in stream mode)
 		self._raw = None
 
+		# flag that states if records are parsed incrementally
+		self._stream = stream
+
 		# <animationpath> read extracted from json data
 		self._animation_path = None		
 		
@@ -24,9 +33,22 @@ class AnimationPathLoader:
 		"""loads an animation path from a JSON serialized txt file, which is specified by the set file name"""
 		if len(self._file_name) == 0:
 			return
+		
+		if self._file_name.endswith(path_store.BINARY_EXTENSION):
+			self._extractPathFromArrays(path_store.openBinary(self._file_name))
+			return
+		
+		if self._stream:
+			self._extractPathFromStream()
+			return
 			
-		with open(self._file_name) as data_file:
-			self._raw = json.load(data_file)
+		try:
+			with open(self._file_name) as data_file:
+				self._raw = json.load(data_file)
+		except ValueError:
+			# line delimited or appended files hold more than one JSON value
+			self._extractPathFromStream()
+			return
 		
 		self._extractPathFromRaw()
 			
@@ -34,13 +56,21 @@ class AnimationPathLoader:
 		"""sets the file name for the file containing the animation path information"""
 		self._file_name = file_name
 		
-		if not self._file_name.endswith(".txt"):
+		if not self._file_name.endswith(".txt") and not self._file_name.endswith(path_store.BINARY_EXTENSION):
 			self._file_name += ".txt"
 	
 	def getAnimationPath(self):
 		"""returns the parsed animation path"""
 		return self._animation_path
 	
+	def iterRecords(self):
+		"""yields the records of the set file one by one, without keeping them in memory"""
+		return path_arrays.iterRecords(self._file_name)
+	
+	def iterChunks(self, chunk_size = path_arrays.CHUNK_SIZE):
+		"""yields the records of the set file as numeric arrays of at most chunk_size records (see path_arrays.recordsToArrays)"""
+		return path_arrays.iterChunks(self._file_name, chunk_size)
+	
 	def _extractPathFromRaw(self):
 		"""helper function to setup animation path from JSON object"""
 		if 'path' not in self._raw:
@@ -51,6 +81,26 @@ class AnimationPathLoader:
 		
 		for record in self._raw['path']:
 			self._addControlPointFromObject(record)
+	
+	def _extractPathFromStream(self):
+		"""helper function to setup animation path from incrementally parsed records"""
+		self._raw = None
+		self._animation_path = viz.addAnimationPath()
+		
+		for record in self.iterRecords():
+			self._addControlPointFromObject(record)
+		
+	def _extractPathFromArrays(self, arrays):
+		"""helper function to setup animation path from columns of time, position, rotation and scale"""
+		self._raw = None
+		self._animation_path = viz.addAnimationPath()
+		
+		for i in range(len(arrays["time"])):
+			cp = viz.addControlPoint()
+			cp.setPosition(*arrays["position"][i].tolist())
+			cp.setEuler(*arrays["rotation"][i].tolist())
+			cp.setScale(*arrays["scale"][i].tolist())
+			self._animation_path.addControlPoint(float(arrays["time"][i]), cp)
 		
 	def _addControlPointFromObject(self, obj):
 		"""helper function to add a control point to the animation path"""		
@@ -1,10 +1,18 @@
 ﻿import viz
-import vizact
+
+import update_profiler
+from path_evaluator import stepTime, STOP, LOOP, SWING
+
+# path_evaluator loop modes of the viz loop modes
+_LOOP_MODES = {viz.LOOP : LOOP, viz.SWING : SWING}
 
 class AnimationPathPlayer:
-	"""plays an animation path"""
+	"""plays an animation path.
+	If fixed_step (seconds) is given, each frame advances the path by fixed_step instead of the elapsed frame time,
+	such that playback runs as fast as frames are rendered and yields the same poses on every run.
+	on_complete is called once playback reached the end of a path which doesn't loop."""
 	
-	def __init__(self, path = None, playback_speed = 1.0, start = True):
+	def __init__(self, path = None, playback_speed = 1.0, start = True, fixed_step = None, on_complete = None):
 		# path to play
 		self._path = path
 		
@@ -19,9 +27,15 @@ class AnimationPathPlayer:
 		
 		# stores frame time of last update call
 		self._last_frame_time = viz.getFrameTime()
+		
+		# path time advanced per frame (None = elapsed frame time)
+		self._fixed_step = fixed_step
+		
+		# function called when playback reached the end
+		self._on_complete = on_complete
 
 		# reference to event function called each frame
-		self._on_update = vizact.onupdate(0, self._onUpdate)
+		self._on_update = update_profiler.onupdate(0, self._onUpdate)
 		
 	def _onUpdate(self):
 		"""function called each frame"""
@@ -39,36 +53,37 @@ class AnimationPathPlayer:
 		# Set last frame time
 		step = viz.getFrameTime() - self._last_frame_time
 		self._last_frame_time = viz.getFrameTime()
+		if self._fixed_step != None:
+			step = self._fixed_step
 		
-		# Calculate new time from step and current time
-		time = self._path.getTime()
-		time += self._playback_direction * step * self._playback_speed
-		
-		# handle over stepped duration
-		if time > self._path.getDuration():
-			loop_mode = self._path.getLoopMode()
-			if loop_mode == viz.LOOP:
-				time = 0
-			elif loop_mode == viz.SWING:
-				self._playback_direction = -1
-				time = self._path.getTime() + self._playback_direction * step
-			else:
-				self.stop()
-				return
-		elif time < 0.0:
-			loop_mode = self._path.getLoopMode()
-			if loop_mode == viz.LOOP:
-				time = self._path.getDuration()
-			elif loop_mode == viz.SWING:
-				self._playback_direction = 1
-				time = self._path.getTime() + self._playback_direction * step
-			else:
-				self.stop()
-				return
+		# Calculate new time from step and current time,
+		# handle over stepped duration according to the loop mode
+		time, self._playback_direction = stepTime(self._path.getTime(), self._playback_direction,
+			step * self._playback_speed, self._path.getDuration(), _LOOP_MODES.get(self._path.getLoopMode(), STOP))
+		if time == None:
+			self._complete()
+			return
 		
 		# set final time
 		self._path.setTime(time);
 	
+	def _complete(self):
+		"""stops playback at the end of the path and notifies the completion callback"""
+		self.stop()
+		if self._on_complete != None:
+			self._on_complete()
+	
+	def setFixedStep(self, step):
+		"""sets the path time (seconds) advanced per frame, None advances by the elapsed frame time"""
+		self._fixed_step = step
+	
+	def getFixedStep(self):
+		return self._fixed_step
+	
+	def setCompletionCallback(self, func):
+		"""sets the function called (without arguments) when playback reached the end of the path"""
+		self._on_complete = func
+	
 	def isPlaying(self):
 		"""returns if player is currently active"""
 		return not self._stop
@@ -76,6 +91,7 @@ class AnimationPathPlayer:
 	def play(self):
 		"""starts playing the attached path"""
 		self._stop = False
+		self._last_frame_time = viz.getFrameTime()
 		
 	def stop(self):
 		"""stops playing the attached path and resets it back to time 0"""
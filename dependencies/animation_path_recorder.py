@@ -1,7 +1,17 @@
 ﻿import viz
 import vizact
 import time
-import json
+import math
+
+import path_store
+import update_profiler
+from path_store import PathColumns
+from path_writer import PathStreamWriter
+from path_simplify import simplifyArrays, compressionRatio
+from view_math import eulerToQuat, quatAngle
+
+# number of samples handed to the stream writer at once
+STREAM_BLOCK_SIZE = 256
 
 class AnimationPathRecorder(viz.VizNode):
 	"""records its position and rotation (and time captured)"""
@@ -16,8 +26,8 @@ class AnimationPathRecorder(viz.VizNode):
 	
 		viz.VizNode.__init__(self, id = self._node.id, **kwargs)
 		
-		# container to save recorded data
-		self._data = []
+		# container to save recorded data (columns of time, position, rotation and scale)
+		self._data = PathColumns()
 		
 		# flag that states if animation path capture is currently stopped
 		self._stop = not start
@@ -28,8 +38,31 @@ class AnimationPathRecorder(viz.VizNode):
 		# average fps of the recording
 		self._avg_fps = -1.0
 		
+		# background writer streaming samples to file (see streamToFile)
+		self._stream_writer = None
+		
+		# index of the first sample not yet handed to the stream writer
+		self._stream_index = 0
+		
+		# number of samples per block handed to the stream writer
+		self._stream_block_size = STREAM_BLOCK_SIZE
+		
+		# adaptive capture tolerances (see setAdaptiveCapture), None stores every frame
+		self._adaptive = None
+		
+		# last stored sample (time, position, rotation quaternion, scale) and the last frame held back
+		self._last_stored = None
+		self._pending = None
+		
+		# number of frames captured and samples stored (see getCaptureStats)
+		self._captured_frames = 0
+		self._stored_samples = 0
+		
+		# frame time of the previous captured frame (see _updatAvgFps)
+		self._last_frame_time = None
+		
 		# reference to event function called each frame
-		self._onUpdate = vizact.onupdate(0, self._onUpdate)
+		self._onUpdate = update_profiler.onupdate(0, self._onUpdate)
 		
 	def _onUpdate(self):
 		"""function called each frame"""
@@ -52,17 +85,70 @@ class AnimationPathRecorder(viz.VizNode):
 		pos = self.getPosition()
 		rot = self.getEuler()
 		scale = self.getScale()
-		self._data.append({"time" : t, "position" : pos, "rotation" : rot, "scale" : scale})
+		self._captured_frames += 1
+		self._updatAvgFps(t)
+		
+		if self._adaptive == None:
+			self._store(t, pos, rot, scale)
+		else:
+			self._captureAdaptive(t, pos, rot, scale)
+		
+		if len(self._data) - self._stream_index >= self._stream_block_size:
+			self._flushStream()
+		
+	def _store(self, t, pos, rot, scale, quat = None):
+		"""appends a sample to the recorded data"""
+		self._data.append(t, pos, rot, scale)
+		self._stored_samples += 1
+		if self._adaptive != None:
+			if quat is None:
+				quat = eulerToQuat(rot)
+			self._last_stored = (t, pos, quat, scale)
+		
+	def _captureAdaptive(self, t, pos, rot, scale):
+		"""stores a frame only if its pose left the dead band around the last stored sample or max_gap passed.
+		The last frame held back before the pose left the dead band is stored as well, such that
+		interpolating between stored samples stays within the tolerances (twice at most)."""
+		quat = eulerToQuat(rot)
+		if self._last_stored != None:
+			last_t, last_pos, last_quat, last_scale = self._last_stored
+			position_tolerance, angle_tolerance, scale_tolerance, max_gap = self._adaptive
+			moved = (math.sqrt(sum((a - b) ** 2 for a, b in zip(pos, last_pos))) > position_tolerance
+				or math.degrees(quatAngle(quat, last_quat)) > angle_tolerance
+				or max(abs(a - b) for a, b in zip(scale, last_scale)) > scale_tolerance)
+			if not moved and t - last_t < max_gap:
+				self._pending = (t, pos, rot, scale)
+				return
+			if moved and self._pending != None:
+				self._store(*self._pending)
+		self._pending = None
+		self._store(t, pos, rot, scale, quat)
+		
+	def _flushPending(self):
+		"""stores the last frame held back by the adaptive capture (end of the recording)"""
+		if self._pending != None:
+			self._store(*self._pending)
+			self._pending = None
+		self._last_stored = None
+		
+	def _flushStream(self):
+		"""hands all samples not yet streamed to the stream writer"""
+		if self._stream_writer == None:
+			return
 		
-		self._updatAvgFps()
+		self._stream_writer.write(self._data.copyRange(self._stream_index))
+		self._stream_index = len(self._data)
 		
-	def _updatAvgFps(self):
-		"""updates the average fps of the recording"""
-		if len(self._data) < 2:
+	def _updatAvgFps(self, t):
+		"""updates the average fps of the recording from the captured frames
+		(not the stored samples, which the adaptive capture thins out)"""
+		last = self._last_frame_time
+		self._last_frame_time = t
+		if last == None or t <= last:
 			return
 
 		fps = -1.0
-		fps = 1 / (self._data[-1]["time"] - self._data[-2]["time"])
+		fps = 1 / (t - last)
 		if fps > 60:
 			fps = 60.0
 			
@@ -70,7 +156,7 @@ class AnimationPathRecorder(viz.VizNode):
 			self._avg_fps = fps
 			return
 		
-		s = (len(self._data)-2)/float(len(self._data)-1)
+		s = (self._captured_frames-2)/float(self._captured_frames-1)
 		self._avg_fps = s * self._avg_fps + (1-s) * fps
 	
 	def getAverageFps(self):
@@ -78,9 +164,12 @@ class AnimationPathRecorder(viz.VizNode):
 		return self._avg_fps
 	
 	def stop(self):
-		"""stops the recording"""
+		"""stops the recording (samples not yet streamed are handed to the stream writer)"""
 		self._start_time = -1
 		self._stop = True
+		self._last_frame_time = None
+		self._flushPending()
+		self._flushStream()
 		
 	def start(self):
 		"""starts the recording"""
@@ -91,24 +180,86 @@ class AnimationPathRecorder(viz.VizNode):
 		return not self._stop
 	
 	def clear(self):
-		"""clears all recorded data"""
-		self._data = []
+		"""clears all recorded data (samples not yet streamed are handed to the stream writer first)"""
+		self._flushPending()
+		self._flushStream()
+		self._data.clear()
+		self._stream_index = 0
+		self._captured_frames = 0
+		self._stored_samples = 0
 	
-	def writeToFile(self, name, append = False):
-		"""writes all recorded data into a Json serialized txt file"""
-		if name.endswith(".txt"):
-			name = str[:-4]
+	def setAdaptiveCapture(self, enabled, position_tolerance = 0.01, angle_tolerance = 1.0, scale_tolerance = 0.001, max_gap = 1.0):
+		"""enables (True) or disables (False) the adaptive capture: a frame is only stored if position, orientation or scale
+		moved beyond the tolerances (scene units, degrees) from the last stored sample, or max_gap seconds passed since.
+		Disabled, every frame is stored."""
+		self._flushPending()
+		self._adaptive = None
+		if enabled:
+			self._adaptive = (position_tolerance, angle_tolerance, scale_tolerance, max_gap)
+	
+	def getAdaptiveCapture(self):
+		"""returns the adaptive capture tolerances (position, angle, scale, max_gap) or None if disabled"""
+		return self._adaptive
+	
+	def getCaptureStats(self):
+		"""returns number of captured frames, stored samples and the reduction (frames / samples) since the last clear"""
+		return {
+			"frames" : self._captured_frames,
+			"samples" : self._stored_samples,
+			"reduction" : compressionRatio(self._captured_frames, self._stored_samples)
+		}
+	
+	def streamToFile(self, name, append = False, block_size = STREAM_BLOCK_SIZE):
+		"""continuously writes samples recorded from now on into a line delimited txt file.
+		Blocks of block_size samples are written from a background thread while recording,
+		such that stop() doesn't need to serialize the whole recording.
+		If 'append' is set to True, samples are added to an existing file."""
+		self.closeStream()
+		self._stream_writer = PathStreamWriter(name, append)
+		self._stream_index = len(self._data)
+		self._stream_block_size = block_size
+	
+	def closeStream(self, wait = False):
+		"""hands remaining samples to the stream writer and closes it once everything is written.
+		If 'wait' is set to True, this call blocks until the file is closed."""
+		if self._stream_writer == None:
+			return
 		
-		if append:
-			data_file = open(name + '.txt', 'a')
-		else:
-			data_file = open(name + '.txt', 'w')
+		self._flushStream()
+		self._stream_writer.close(wait)
+		self._stream_writer = None
+	
+	def getStreamWriter(self):
+		"""returns the active stream writer (see streamToFile) or None"""
+		return self._stream_writer
+	
+	def getRecordedArrays(self):
+		"""returns map of column name ("time", "position", "rotation", "scale") to arrays of the recorded data"""
+		return self._data.getArrays()
+	
+	def simplify(self, position_tolerance = 0.01, angle_tolerance = 1.0, scale_tolerance = 0.001):
+		"""drops recorded samples, which can be interpolated from their neighbours within the given tolerances
+		(distances in scene units, angle in degrees). See path_simplify.
+		Returns the compression ratio (number of samples before / after)."""
+		self._flushStream()
 		
-		data_obj = {"path" : self._data} 
+		reduced, ratio = simplifyArrays(self._data.getArrays(), position_tolerance, angle_tolerance, scale_tolerance)
+		self._data = PathColumns(len(reduced["time"]))
+		self._data.extend(reduced)
+		self._stream_index = len(self._data)
 		
-		data_file.write(json.dumps(data_obj)) 
+		return ratio
+	
+	def writeToFile(self, name, append = False):
+		"""writes all recorded data into a Json serialized txt file"""
+		if name.endswith(".txt"):
+			name = name[:-4]
 		
-		data_file.flush()
+		path_store.writeJson(name, self._data.getArrays(), append)
+	
+	def writeToBinaryFile(self, name):
+		"""writes all recorded data into a binary path file (see path_store), which can be opened via mmap"""
+		path_store.writeBinary(name, self._data.getArrays())
 		
 if __name__ == '__main__':
 	import vizcam
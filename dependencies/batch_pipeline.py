@@ -0,0 +1,239 @@
+﻿''' Turns a directory of recordings (AnimationPathRecorder txt or binary path files) into view intensities,
+one session per recording, accumulated on a process pool (see OfflineViewAccumulatorCube).
+
+Each session is written to <output directory>/<recording path>/ (e.g. sessions/day1/rec.txt/):
+	accumulated.hcube (and its mip pyramid, see cube_hdr, cube_mip)
+	session.json      (recording size and modification time, parameters, sample count)
+Sessions are built in a sibling directory ending in ".partial" and renamed once complete,
+so an interrupted batch leaves no half written session behind and simply continues when run again.
+Sessions whose session.json matches the recording and parameters are skipped.
+
+The output directory can be aggregated directly (see heatmap_aggregator, displayHeatmap(sessions_directory = ...)). '''
+
+import os
+import json
+import shutil
+import signal
+import timeit
+import multiprocessing
+
+import path_store
+from view_accumulator_offline import OfflineViewAccumulatorCube
+from cube_mip import MIN_SIZE
+
+# file extensions of recordings
+RECORDING_EXTENSIONS = (".txt", path_store.BINARY_EXTENSION)
+
+# name of the file describing a finished session
+MANIFEST_NAME = "session.json"
+
+# file name prefix of the accumulated intensities within a session
+SESSION_PREFIX = "accumulated"
+
+_PARTIAL_SUFFIX = ".partial"
+
+# seconds waited for a pool result at a time, such that Ctrl-C interrupts the batch
+RESULT_TIMEOUT = 0.5
+
+def accumulationParameters(frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024, rate = None, mip_min_size = MIN_SIZE):
+	''' returns the parameters of a batch as dict (stored in each session.json) '''
+	return {
+		"frame_weight" : frame_weight,
+		"aperture_scale" : aperture_scale,
+		"resolution" : resolution,
+		"rate" : rate,
+		"mip_min_size" : mip_min_size
+	}
+
+def findRecordings(directory, exclude = None):
+	''' returns the file names of all recordings below directory (sorted), skipping the directory exclude '''
+	if exclude != None:
+		exclude = os.path.abspath(exclude)
+	recordings = []
+	for root, dirs, files in os.walk(directory):
+		dirs[:] = sorted(name for name in dirs if exclude == None or os.path.abspath(os.path.join(root, name)) != exclude)
+		for name in sorted(files):
+			if name.endswith(RECORDING_EXTENSIONS):
+				recordings.append(os.path.join(root, name))
+	return recordings
+
+def sessionDirectory(recording, directory, output_directory):
+	''' returns the output directory of a recording found below directory.
+	It keeps the extension, such that rec.txt and rec.path written by the same recorder get separate sessions. '''
+	return os.path.join(output_directory, os.path.relpath(recording, directory))
+
+def _source(recording):
+	''' returns size and modification time of a recording, which decide if a session is up to date '''
+	status = os.stat(recording)
+	return {"size" : status.st_size, "mtime" : status.st_mtime}
+
+def readManifest(session_directory):
+	''' returns the session.json of a finished session or None '''
+	try:
+		with open(os.path.join(session_directory, MANIFEST_NAME)) as manifest_file:
+			return json.load(manifest_file)
+	except (IOError, OSError, ValueError):
+		return None
+
+def isUpToDate(recording, session_directory, parameters):
+	''' returns True if the session of recording was completed with the given parameters after its last change '''
+	manifest = readManifest(session_directory)
+	if manifest == None:
+		return False
+	return manifest.get("source") == _source(recording) and manifest.get("parameters") == parameters
+
+def _processSession(task):
+	''' process pool task: accumulates one recording into its session directory.
+	Returns (recording, sample count, seconds, error message or None). '''
+	recording, session_directory, parameters = task
+	start = timeit.default_timer()
+	partial = session_directory + _PARTIAL_SUFFIX
+	try:
+		source = _source(recording)
+		if os.path.isdir(partial):
+			shutil.rmtree(partial)
+		os.makedirs(partial)
+
+		accumulator = OfflineViewAccumulatorCube(parameters["frame_weight"], parameters["aperture_scale"], parameters["resolution"])
+		accumulator.accumulateFile(recording, parameters["rate"])
+		if accumulator.getSampleCount() == 0:
+			raise ValueError("no samples in recording")
+		accumulator.saveHDR(os.path.join(partial, SESSION_PREFIX), mip_min_size = parameters["mip_min_size"])
+
+		seconds = timeit.default_timer() - start
+		manifest = {
+			"recording" : os.path.abspath(recording),
+			"source" : source,
+			"parameters" : parameters,
+			"sample_count" : accumulator.getSampleCount(),
+			"seconds" : seconds
+		}
+		with open(os.path.join(partial, MANIFEST_NAME), 'w') as manifest_file:
+			json.dump(manifest, manifest_file, indent = 1, sort_keys = True)
+
+		if os.path.isdir(session_directory):
+			shutil.rmtree(session_directory)
+		os.rename(partial, session_directory)
+		return recording, accumulator.getSampleCount(), seconds, None
+	except Exception as error:
+		if os.path.isdir(partial):
+			shutil.rmtree(partial, ignore_errors = True)
+		return recording, 0, timeit.default_timer() - start, "%s: %s" % (type(error).__name__, error)
+	except BaseException:
+		# interrupted in this process (processes = 1)
+		if os.path.isdir(partial):
+			shutil.rmtree(partial, ignore_errors = True)
+		raise
+
+def _ignoreInterrupt():
+	''' process pool initializer: Ctrl-C is handled by the parent, which terminates the workers '''
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _poolResults(results):
+	''' yields the results of pool.imap_unordered. Waits with a timeout,
+	as an untimed wait can't be interrupted by Ctrl-C (Python 2). '''
+	while True:
+		try:
+			yield results.next(RESULT_TIMEOUT)
+		except multiprocessing.TimeoutError:
+			continue
+		except StopIteration:
+			return
+
+def _printProgress(done, total, recording, samples, seconds, elapsed, total_samples):
+	rate = done / elapsed if elapsed > 0.0 else 0.0
+	remaining = (total - done) / rate if rate > 0.0 else 0.0
+	print "[%d/%d] %s: %d samples in %.1f s | %.1f sessions/min, %.0f samples/s, %.0f s left" % (
+		done, total, recording, samples, seconds, rate * 60.0, total_samples / elapsed if elapsed > 0.0 else 0.0, remaining)
+
+def processDirectory(directory, output_directory = None, processes = None, force = False, verbose = True, **kwargs):
+	''' accumulates all recordings below directory into sessions below output_directory (default: <directory>/sessions).
+	processes specifies the size of the process pool (default: number of CPUs, 1 runs in this process).
+	Sessions which are up to date are skipped, unless force is set.
+	Further keyword arguments are accumulation parameters (see accumulationParameters).
+	Returns {"done" : [...], "skipped" : [...], "failed" : {recording : error message}}. '''
+	if output_directory == None:
+		output_directory = os.path.join(directory, "sessions")
+	parameters = accumulationParameters(**kwargs)
+
+	tasks = []
+	skipped = []
+	for recording in findRecordings(directory, exclude = output_directory):
+		session_directory = sessionDirectory(recording, directory, output_directory)
+		if not force and isUpToDate(recording, session_directory, parameters):
+			skipped.append(recording)
+			if os.path.isdir(session_directory + _PARTIAL_SUFFIX):
+				shutil.rmtree(session_directory + _PARTIAL_SUFFIX)
+		else:
+			tasks.append((recording, session_directory, parameters))
+
+	if verbose:
+		print "%d recordings, %d up to date, %d to process" % (len(tasks) + len(skipped), len(skipped), len(tasks))
+
+	done = []
+	failed = {}
+	if len(tasks) == 0:
+		return {"done" : done, "skipped" : skipped, "failed" : failed}
+
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	processes = max(1, min(processes, len(tasks)))
+
+	pool = None
+	if processes > 1:
+		pool = multiprocessing.Pool(processes, _ignoreInterrupt)
+		results = _poolResults(pool.imap_unordered(_processSession, tasks))
+	else:
+		results = (_processSession(task) for task in tasks)
+
+	start = timeit.default_timer()
+	total_samples = 0
+	try:
+		for recording, samples, seconds, error in results:
+			if error != None:
+				failed[recording] = error
+				if verbose:
+					print "[%d/%d] %s failed: %s" % (len(done) + len(failed), len(tasks), recording, error)
+				continue
+			done.append(recording)
+			total_samples += samples
+			if verbose:
+				_printProgress(len(done) + len(failed), len(tasks), recording, samples, seconds, timeit.default_timer() - start, total_samples)
+	except BaseException:
+		# interrupted: finished sessions are kept, unfinished ones are redone on the next run
+		if pool is not None:
+			pool.terminate()
+			pool.join()
+			pool = None
+			for recording, session_directory, parameters in tasks:
+				if os.path.isdir(session_directory + _PARTIAL_SUFFIX):
+					shutil.rmtree(session_directory + _PARTIAL_SUFFIX, ignore_errors = True)
+		raise
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if verbose:
+		print "Processed %d sessions (%d failed) in %.1f s." % (len(done), len(failed), timeit.default_timer() - start)
+	return {"done" : done, "skipped" : skipped, "failed" : failed}
+
+if __name__ == '__main__':
+	import sys
+	import argparse
+
+	parser = argparse.ArgumentParser(description = "accumulate view intensities of all recordings below a directory")
+	parser.add_argument("directory", help = "directory of recordings (txt or binary path files)")
+	parser.add_argument("output", nargs = "?", default = None, help = "sessions directory (default: <directory>/sessions)")
+	parser.add_argument("--processes", type = int, default = None, help = "number of worker processes (default: number of CPUs)")
+	parser.add_argument("--resolution", type = int, default = 1024)
+	parser.add_argument("--frame-weight", type = float, default = 0.5)
+	parser.add_argument("--aperture-scale", type = float, default = 0.5)
+	parser.add_argument("--rate", type = float, default = None, help = "resample paths with this number of frames per second")
+	parser.add_argument("--force", action = "store_true", help = "process sessions which are up to date as well")
+	args = parser.parse_args()
+
+	result = processDirectory(args.directory, args.output, args.processes, args.force,
+		frame_weight = args.frame_weight, aperture_scale = args.aperture_scale, resolution = args.resolution, rate = args.rate)
+	if len(result["failed"]) > 0:
+		sys.exit(1)
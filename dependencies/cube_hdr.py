@@ -0,0 +1,101 @@
+﻿''' High dynamic range storage for accumulated cube faces.
+Unlike the 8 bit .bmp files written by ViewAccumulatorCube.saveAll, intensities are not clamped.
+
+File layout (little endian):
+	magic "HCUBE\0", uint16 version, uint32 header length
+	JSON header (resolution, dtype, face order, sample count and capture parameters)
+	padding up to a multiple of 64 bytes
+	face data (resolution x resolution values per face, in header face order) '''
+
+import json
+import mmap
+import struct
+import numpy as np
+
+from view_math import FACE_NAMES
+
+# file extension of HDR cube files
+HDR_EXTENSION = ".hcube"
+
+_MAGIC = b'HCUBE\0'
+_VERSION = 1
+_PREFIX = struct.Struct('<6sHI')
+_ALIGNMENT = 64
+
+def writeHDR(file_name, faces, metadata = None, dtype = np.float32):
+	''' writes map of face name to intensity array to an HDR cube file.
+	metadata (e.g. sample_count, frame_weight, aperture_scale) is stored in the header.
+	dtype may be np.float32 or np.float16. '''
+	if not file_name.endswith(HDR_EXTENSION):
+		file_name += HDR_EXTENSION
+
+	dtype = np.dtype(dtype)
+	resolution = faces[FACE_NAMES[0]].shape[0]
+
+	header = dict(metadata or {})
+	header.update({
+		"resolution" : resolution,
+		"dtype" : dtype.name,
+		"faces" : list(FACE_NAMES)
+	})
+	header_data = json.dumps(header, sort_keys = True).encode('utf-8')
+	padding = -(_PREFIX.size + len(header_data)) % _ALIGNMENT
+
+	with open(file_name, 'wb') as data_file:
+		data_file.write(_PREFIX.pack(_MAGIC, _VERSION, len(header_data) + padding))
+		data_file.write(header_data + b' ' * padding)
+		for face in FACE_NAMES:
+			data_file.write(np.ascontiguousarray(faces[face], dtype = dtype.newbyteorder('<')).tobytes())
+
+def _readHeader(data_file, file_name):
+	magic, version, header_size = _PREFIX.unpack(data_file.read(_PREFIX.size))
+	if magic != _MAGIC or version != _VERSION:
+		raise IOError("not an HDR cube file: " + file_name)
+	return json.loads(data_file.read(header_size).decode('utf-8')), _PREFIX.size + header_size
+
+def readHDRHeader(file_name):
+	''' returns the header of an HDR cube file as dict '''
+	if not file_name.endswith(HDR_EXTENSION):
+		file_name += HDR_EXTENSION
+
+	with open(file_name, 'rb') as data_file:
+		return _readHeader(data_file, file_name)[0]
+
+def readHDR(file_name):
+	''' opens an HDR cube file via mmap.
+	Returns map of face name to read only array backed by the file, and the header dict. '''
+	if not file_name.endswith(HDR_EXTENSION):
+		file_name += HDR_EXTENSION
+
+	with open(file_name, 'rb') as data_file:
+		header, offset = _readHeader(data_file, file_name)
+		mapped = mmap.mmap(data_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+	resolution = header["resolution"]
+	dtype = np.dtype(str(header["dtype"])).newbyteorder('<')
+
+	faces = {}
+	for face in header["faces"]:
+		faces[str(face)] = np.frombuffer(mapped, dtype = dtype, count = resolution * resolution, offset = offset).reshape(resolution, resolution)
+		offset += resolution * resolution * dtype.itemsize
+	return faces, header
+
+def hdrExposure(faces, percentile = 99.9):
+	''' returns the scale mapping the given percentile of all non zero intensities to 1.0 '''
+	values = np.concatenate([np.asarray(faces[face], dtype = np.float32).ravel() for face in FACE_NAMES])
+	values = values[values > 0.0]
+	if len(values) == 0:
+		return 1.0
+	return 1.0 / float(np.percentile(values, percentile))
+
+def hdrToVizTextures(file_name, exposure = None, percentile = 99.9, directory = None):
+	''' loads an HDR cube file as map of viz cube face constant to texture for HeatmapVisualizer (requires Vizard).
+	Intensities are multiplied by exposure (by default chosen with hdrExposure) before being converted to 8 bit textures,
+	so long recordings don't saturate and short ones keep their resolution.
+	directory is passed to toVizTextures (default: a temporary directory removed after loading). '''
+	from cube_io import toVizTextures
+
+	faces, header = readHDR(file_name)
+	if exposure is None:
+		exposure = hdrExposure(faces, percentile)
+	return toVizTextures(dict((face, faces[face] * np.float32(exposure)) for face in FACE_NAMES), directory = directory)
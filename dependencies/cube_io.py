@@ -0,0 +1,106 @@
+﻿''' File helpers for cube face intensity images, which don't require a Vizard session.
+Faces are handled as 2D float arrays (row 0 = top row of the image). '''
+
+import struct
+import numpy as np
+
+from view_math import FACE_NAMES
+
+def facePaths(prefix = "accumulated", directory = "", extension = ".bmp"):
+	''' returns map of face name to file path using the naming scheme of ViewAccumulatorCube.saveAll. '''
+	if len(directory) > 0 and not directory.endswith('/'):
+		directory += "/"
+	return dict((face, directory + prefix + '_' + face + extension) for face in FACE_NAMES)
+
+def writeBmp(file_name, image):
+	''' writes a 2D intensity array as 24 bit greyscale .bmp file, or an array of shape (height, width, 3) as RGB image.
+	Values are clamped to range [0.0,1.0] like an 8 bit render texture. '''
+	image = np.asarray(image)
+	height, width = image.shape[:2]
+	values = np.round(np.clip(image, 0.0, 1.0) * 255.0).astype(np.uint8)
+	if values.ndim == 2:
+		bgr = np.repeat(values[...,None], 3, axis = 2)
+	else:
+		bgr = values[...,2::-1]
+
+	# rows are stored bottom up and padded to multiples of 4 bytes
+	row_size = (width * 3 + 3) & ~3
+	pixels = np.zeros((height, row_size), dtype = np.uint8)
+	pixels[:, :width*3] = bgr[::-1].reshape(height, width * 3)
+
+	header_size = 14 + 40
+	with open(file_name, 'wb') as bmp_file:
+		bmp_file.write(struct.pack('<2sIHHI', b'BM', header_size + pixels.size, 0, 0, header_size))
+		bmp_file.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, pixels.size, 2835, 2835, 0, 0))
+		bmp_file.write(pixels.tobytes())
+
+def readBmp(file_name):
+	''' reads an uncompressed 24 or 32 bit .bmp file as 2D float32 intensity array in range [0.0,1.0].
+	Color channels are averaged. '''
+	with open(file_name, 'rb') as bmp_file:
+		data = bmp_file.read()
+
+	if data[:2] != b'BM':
+		raise IOError("not a bmp file: " + file_name)
+
+	offset = struct.unpack_from('<I', data, 10)[0]
+	width, height, planes, bits, compression = struct.unpack_from('<iiHHI', data, 18)
+	if bits not in (24, 32) or compression not in (0, 3):
+		raise IOError("unsupported bmp format (%d bit, compression %d): %s" % (bits, compression, file_name))
+
+	channels = bits // 8
+	row_size = (abs(width) * channels + 3) & ~3
+	pixels = np.frombuffer(data, dtype = np.uint8, count = row_size * abs(height), offset = offset)
+	pixels = pixels.reshape(abs(height), row_size)[:, :abs(width)*channels].reshape(abs(height), abs(width), channels)
+
+	# positive height means bottom up storage
+	if height > 0:
+		pixels = pixels[::-1]
+
+	return pixels[...,:3].mean(axis = -1, dtype = np.float32) / np.float32(255.0)
+
+def saveFaces(faces, prefix = "accumulated", directory = ""):
+	''' saves map of face name to intensity array to .bmp files named like ViewAccumulatorCube.saveAll.
+	Returns map of face name to file path. '''
+	paths = facePaths(prefix, directory)
+	for face in FACE_NAMES:
+		writeBmp(paths[face], faces[face])
+	return paths
+
+def loadFaces(prefix = "accumulated", directory = ""):
+	''' loads the six .bmp files written by ViewAccumulatorCube.saveAll.
+	Returns map of face name to float32 intensity array. '''
+	paths = facePaths(prefix, directory)
+	return dict((face, readBmp(paths[face])) for face in FACE_NAMES)
+
+def vizFaceKeys():
+	''' returns map of face name to the corresponding viz cube face constant (requires Vizard) '''
+	import viz
+	return {
+		'p_x' : viz.POSITIVE_X,
+		'n_x' : viz.NEGATIVE_X,
+		'p_y' : viz.POSITIVE_Y,
+		'n_y' : viz.NEGATIVE_Y,
+		'p_z' : viz.POSITIVE_Z,
+		'n_z' : viz.NEGATIVE_Z
+	}
+
+def toVizTextures(faces, prefix = "faces", directory = None):
+	''' converts map of face name to intensity array into a map of viz cube face constant to texture,
+	as expected by HeatmapVisualizer. Faces are stored as .bmp files in directory and loaded from there (requires Vizard).
+	By default a temporary directory is used, which is removed once the textures are loaded. '''
+	import viz
+	import shutil
+	import tempfile
+
+	temporary = directory is None
+	if temporary:
+		directory = tempfile.mkdtemp(prefix = "heatmap_")
+
+	try:
+		paths = saveFaces(faces, prefix, directory)
+		keys = vizFaceKeys()
+		return dict((keys[face], viz.addTexture(paths[face])) for face in FACE_NAMES)
+	finally:
+		if temporary:
+			shutil.rmtree(directory, ignore_errors = True)
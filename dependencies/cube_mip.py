@@ -0,0 +1,59 @@
+﻿''' Mip pyramids of accumulated cube faces, for coarse previews (dashboards, thumbnails)
+which shouldn't decode the full resolution faces.
+Each level halves the resolution using a 2x2 box filter and is stored as separate set of face files,
+named like ViewAccumulatorCube.saveAll with the level resolution appended (e.g. accumulated_128_p_x.bmp). '''
+
+import numpy as np
+
+from view_math import FACE_NAMES
+from cube_io import saveFaces, loadFaces
+from cube_hdr import writeHDR, readHDR
+
+# smallest level resolution written by default
+MIN_SIZE = 16
+
+def downsample(face):
+	''' returns the next smaller mip level of a face (2x2 box filter, odd sizes drop the last row/column) '''
+	face = np.asarray(face, dtype = np.float32)
+	size = face.shape[0] // 2
+	face = face[:size*2, :size*2]
+	return 0.25 * (face[0::2, 0::2] + face[1::2, 0::2] + face[0::2, 1::2] + face[1::2, 1::2])
+
+def buildPyramid(faces, min_size = MIN_SIZE):
+	''' returns list of maps of face name to intensity array, one per level below the full resolution,
+	from largest to smallest (down to min_size). '''
+	levels = []
+	level = faces
+	while level[FACE_NAMES[0]].shape[0] // 2 >= max(min_size, 1):
+		level = dict((face, downsample(level[face])) for face in FACE_NAMES)
+		levels.append(level)
+	return levels
+
+def levelPrefix(prefix, size):
+	''' returns the file prefix of the pyramid level with the given resolution '''
+	return "%s_%d" % (prefix, size)
+
+def savePyramid(faces, prefix = "accumulated", directory = "", min_size = MIN_SIZE, hdr = False):
+	''' computes and saves the mip pyramid of the given faces.
+	Levels are saved as .bmp files (see cube_io.saveFaces), or as HDR cube files if hdr is True.
+	Returns list of level resolutions saved. '''
+	if len(directory) > 0 and not directory.endswith('/'):
+		directory += "/"
+
+	sizes = []
+	for level in buildPyramid(faces, min_size):
+		size = level[FACE_NAMES[0]].shape[0]
+		if hdr:
+			writeHDR(directory + levelPrefix(prefix, size), level, {"mip_level_of" : prefix})
+		else:
+			saveFaces(level, levelPrefix(prefix, size), directory)
+		sizes.append(size)
+	return sizes
+
+def loadLevel(size, prefix = "accumulated", directory = "", hdr = False):
+	''' loads a single pyramid level saved by savePyramid. Returns map of face name to float32 array. '''
+	if hdr:
+		if len(directory) > 0 and not directory.endswith('/'):
+			directory += "/"
+		return readHDR(directory + levelPrefix(prefix, size))[0]
+	return loadFaces(levelPrefix(prefix, size), directory)
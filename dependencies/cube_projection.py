@@ -0,0 +1,221 @@
+﻿''' Conversion of cube faces to single image layouts and back, which don't require a Vizard session.
+
+equirectangular: width = 2 * height, longitude from -180 (left) to 180 degrees (right) around the y axis,
+	the image center looks along +z, row 0 is straight up.
+octahedral: square image, the center looks straight up (+y), the image corners straight down,
+	right is +x and up is +z.
+
+All conversions use bilinear filtering. Lookup tables (4 source indices and weights per output pixel)
+are computed once per layout and resolution and cached, such that batches of sessions are converted
+with a few gathers per image. '''
+
+import numpy as np
+
+from view_math import FACE_NAMES, FACE_EULER, eulerToMatrix, normalize, faceDirections
+
+LAYOUTS = ('equirect', 'octahedral')
+
+_lut_cache = {}
+
+def equirectDirections(width, height):
+	''' returns directions for each pixel center of an equirectangular image (shape (height, width, 3)) '''
+	lon = ((np.arange(width) + 0.5) / width * 2.0 - 1.0) * np.pi
+	lat = (0.5 - (np.arange(height) + 0.5) / height) * np.pi
+	directions = np.empty((height, width, 3))
+	directions[...,0] = np.cos(lat)[:,None] * np.sin(lon)[None,:]
+	directions[...,1] = np.sin(lat)[:,None]
+	directions[...,2] = np.cos(lat)[:,None] * np.cos(lon)[None,:]
+	return directions
+
+def octahedralDirections(size):
+	''' returns directions for each pixel center of an octahedral image (shape (size, size, 3)) '''
+	coords = (np.arange(size) + 0.5) / size * 2.0 - 1.0
+	u = np.repeat(coords[None,:], size, axis = 0)
+	v = np.repeat(-coords[:,None], size, axis = 1)
+	up = 1.0 - np.abs(u) - np.abs(v)
+
+	# the lower hemisphere is folded onto the outer triangles
+	lower = up < 0.0
+	u_folded = (1.0 - np.abs(v)) * np.where(u >= 0.0, 1.0, -1.0)
+	v_folded = (1.0 - np.abs(u)) * np.where(v >= 0.0, 1.0, -1.0)
+	u = np.where(lower, u_folded, u)
+	v = np.where(lower, v_folded, v)
+
+	return normalize(np.stack([u, up, v], axis = -1))
+
+def _equirectCoords(directions, width, height):
+	''' returns continuous pixel coordinates (column, row) of directions in an equirectangular image '''
+	lon = np.arctan2(directions[...,0], directions[...,2])
+	lat = np.arcsin(np.clip(directions[...,1], -1.0, 1.0))
+	column = (lon / np.pi + 1.0) * 0.5 * width - 0.5
+	row = (0.5 - lat / np.pi) * height - 0.5
+	return column, row
+
+def _octahedralCoords(directions, size):
+	''' returns continuous pixel coordinates (column, row) of directions in an octahedral image '''
+	norm = np.sum(np.abs(directions), axis = -1)
+	u = directions[...,0] / norm
+	v = directions[...,2] / norm
+	lower = directions[...,1] < 0.0
+	u_folded = (1.0 - np.abs(v)) * np.where(u >= 0.0, 1.0, -1.0)
+	v_folded = (1.0 - np.abs(u)) * np.where(v >= 0.0, 1.0, -1.0)
+	u = np.where(lower, u_folded, u)
+	v = np.where(lower, v_folded, v)
+	return (u + 1.0) * 0.5 * size - 0.5, (1.0 - v) * 0.5 * size - 0.5
+
+def _cubeCoords(directions, resolution):
+	''' returns face index (see FACE_NAMES) and continuous texel coordinates (column, row) of directions '''
+	axes = np.abs(directions)
+	major = np.argmax(axes, axis = -1)
+	positive = np.take_along_axis(directions, major[...,None], axis = -1)[...,0] >= 0.0
+	face_index = major * 2 + np.where(positive, 0, 1)
+
+	column = np.empty(directions.shape[:-1])
+	row = np.empty(directions.shape[:-1])
+	for index, face in enumerate(FACE_NAMES):
+		mask = face_index == index
+		local = np.dot(directions[mask], eulerToMatrix(FACE_EULER[face]))
+		column[mask] = (local[:,0] / local[:,2] + 1.0) * 0.5 * resolution - 0.5
+		row[mask] = (1.0 - local[:,1] / local[:,2]) * 0.5 * resolution - 0.5
+	return face_index, column, row
+
+def _bilinear(column, row, width, height, offset = 0, wrap = False):
+	''' returns flat source indices and weights (shape (4, n) each) for bilinear filtering at
+	continuous pixel coordinates of an image of the given size stored at offset.
+	Columns wrap around if wrap is True, otherwise coordinates are clamped to the image. '''
+	column = np.ravel(column)
+	row = np.ravel(row)
+	x0 = np.floor(column)
+	y0 = np.floor(row)
+	fx = column - x0
+	fy = row - y0
+	x0 = x0.astype(np.int64)
+	y0 = y0.astype(np.int64)
+
+	if wrap:
+		xs = (x0 % width, (x0 + 1) % width)
+	else:
+		xs = (np.clip(x0, 0, width - 1), np.clip(x0 + 1, 0, width - 1))
+	ys = (np.clip(y0, 0, height - 1), np.clip(y0 + 1, 0, height - 1))
+
+	offset = np.ravel(offset)
+	indices = np.stack([
+		offset + ys[0] * width + xs[0],
+		offset + ys[0] * width + xs[1],
+		offset + ys[1] * width + xs[0],
+		offset + ys[1] * width + xs[1]
+	])
+	weights = np.stack([(1.0 - fx) * (1.0 - fy), fx * (1.0 - fy), (1.0 - fx) * fy, fx * fy])
+	return indices.astype(np.int32), weights.astype(np.float32)
+
+def _layoutShape(layout, size):
+	''' returns (height, width) of a layout image with the given size (width for equirect, edge length for octahedral) '''
+	if layout == 'equirect':
+		return size // 2, size
+	if layout == 'octahedral':
+		return size, size
+	raise ValueError("unknown layout: %s (expected one of %s)" % (layout, ", ".join(LAYOUTS)))
+
+def cubeToLayoutTable(layout, resolution, size):
+	''' returns the cached lookup table (indices, weights) sampling six stacked faces of the given resolution
+	for each pixel of a layout image '''
+	key = ('from_cube', layout, resolution, size)
+	if key not in _lut_cache:
+		height, width = _layoutShape(layout, size)
+		if layout == 'equirect':
+			directions = equirectDirections(width, height)
+		else:
+			directions = octahedralDirections(size)
+		face_index, column, row = _cubeCoords(directions.reshape(-1, 3), resolution)
+		table = _bilinear(column, row, resolution, resolution, face_index * resolution * resolution)
+		for array in table:
+			array.flags.writeable = False
+		_lut_cache[key] = table
+	return _lut_cache[key]
+
+def layoutToCubeTable(layout, size, resolution):
+	''' returns the cached lookup table (indices, weights) sampling a layout image
+	for each texel of six stacked faces of the given resolution '''
+	key = ('to_cube', layout, size, resolution)
+	if key not in _lut_cache:
+		height, width = _layoutShape(layout, size)
+		directions = np.concatenate([faceDirections(face, resolution).reshape(-1, 3) for face in FACE_NAMES])
+		if layout == 'equirect':
+			column, row = _equirectCoords(directions, width, height)
+			table = _bilinear(column, row, width, height, wrap = True)
+		else:
+			column, row = _octahedralCoords(directions, size)
+			table = _bilinear(column, row, width, height)
+		for array in table:
+			array.flags.writeable = False
+		_lut_cache[key] = table
+	return _lut_cache[key]
+
+def clearTables():
+	''' drops all cached lookup tables '''
+	_lut_cache.clear()
+
+def cubeSampleTable(directions, resolution, offset = 0):
+	''' returns a lookup table (indices, weights) sampling six stacked faces of the given resolution
+	(stored at offset, scalar or per direction) in the given directions '''
+	face_index, column, row = _cubeCoords(np.asarray(directions, dtype = np.float64).reshape(-1, 3), resolution)
+	return _bilinear(column, row, resolution, resolution, np.ravel(offset) + face_index * resolution * resolution)
+
+def applyTable(source, table):
+	''' returns the filtered values for a lookup table applied to a flat float32 source array '''
+	indices, weights = table
+	result = source[indices[0]] * weights[0]
+	for i in range(1, 4):
+		result += source[indices[i]] * weights[i]
+	return result
+
+def cubeToLayout(faces, layout = 'equirect', size = None):
+	''' resamples map of face name to intensity array into a single float32 image.
+	size is the image width for 'equirect' (default 4 * face resolution)
+	and the edge length for 'octahedral' (default 2 * face resolution). '''
+	resolution = faces[FACE_NAMES[0]].shape[0]
+	if size is None:
+		size = resolution * (4 if layout == 'equirect' else 2)
+	source = np.concatenate([np.asarray(faces[face], dtype = np.float32).ravel() for face in FACE_NAMES])
+	return applyTable(source, cubeToLayoutTable(layout, resolution, size)).reshape(_layoutShape(layout, size))
+
+def layoutToCube(image, layout = 'equirect', resolution = None):
+	''' resamples a single image (see cubeToLayout) into map of face name to float32 intensity array.
+	resolution defaults to a quarter of the width for 'equirect' and half the edge length for 'octahedral'. '''
+	image = np.asarray(image, dtype = np.float32)
+	height, width = image.shape
+	size = width
+	if _layoutShape(layout, size) != (height, width):
+		raise ValueError("image of shape %s doesn't match layout %s" % (str(image.shape), layout))
+	if resolution is None:
+		resolution = size // (4 if layout == 'equirect' else 2)
+
+	values = applyTable(image.ravel(), layoutToCubeTable(layout, size, resolution))
+	values = values.reshape(len(FACE_NAMES), resolution, resolution)
+	return dict((face, values[index]) for index, face in enumerate(FACE_NAMES))
+
+if __name__ == '__main__':
+	import sys
+	import os
+	from cube_io import writeBmp
+	from heatmap_aggregator import findSessions, loadSession
+
+	if len(sys.argv) < 2:
+		print "usage: cube_projection.py <sessions directory> [equirect|octahedral] [size]"
+		sys.exit(1)
+
+	layout = 'equirect'
+	if len(sys.argv) > 2:
+		layout = sys.argv[2]
+	size = None
+	if len(sys.argv) > 3:
+		size = int(sys.argv[3])
+
+	sessions = findSessions(sys.argv[1])
+	for session in sessions:
+		if isinstance(session, tuple):
+			out_file_name = os.path.join(session[0], session[1] + "_" + layout + ".bmp")
+		else:
+			out_file_name = os.path.splitext(session)[0] + "_" + layout + ".bmp"
+		writeBmp(out_file_name, cubeToLayout(loadSession(session), layout, size))
+	print "Converted %d sessions to %s images" % (len(sessions), layout)
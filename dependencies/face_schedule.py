@@ -0,0 +1,41 @@
+﻿''' Selects the cube faces a view can contribute intensity to, such that ViewAccumulatorCube
+only renders those. The test is conservative: a face is only skipped if no point of the view cone
+(beyond min_distance from the eye) can be seen through it from the cube center. '''
+
+import math
+import numpy as np
+
+from view_math import FACE_NAMES, FACE_EULER, FACE_ANGLE, eulerToMatrix, normalize
+from view_accumulator_offline import coneAngle
+
+# near clip distance of the projector frustum (see ViewAccumulator), closer surfaces receive no intensity
+NEAR_CLIP = 0.1
+
+def viewSpread(cone_angle, offset = 0.0, min_distance = NEAR_CLIP):
+	''' returns the largest angle (radians) between the view direction and the direction from the cube center
+	to any point of the view cone. offset is the distance between eye and cube center,
+	points closer than min_distance to the eye are ignored. '''
+	if offset <= 0.0:
+		return cone_angle
+	if offset >= min_distance:
+		return math.pi
+	return min(cone_angle + math.asin(offset / min_distance), math.pi)
+
+def faceOverlap(face, direction, cone_angle, offset = 0.0, min_distance = NEAR_CLIP):
+	''' returns whether the view cone with the given direction (in cube coordinates)
+	and half angle cone_angle (radians) may add intensity to the face (see viewSpread). '''
+	spread = viewSpread(cone_angle, offset, min_distance)
+	if FACE_ANGLE + spread >= math.pi:
+		return True
+	axis = eulerToMatrix(FACE_EULER[face])[:,2]
+	return float(np.dot(normalize(direction), axis)) > math.cos(FACE_ANGLE + spread)
+
+def visibleFaces(direction, aperture_scale, offset = 0.0, min_distance = NEAR_CLIP):
+	''' returns list of face names (see view_math.FACE_NAMES) the view may add intensity to,
+	for a view direction given in cube coordinates and the projector aperture_scale. '''
+	cone_angle = coneAngle(aperture_scale)
+	return [face for face in FACE_NAMES if faceOverlap(face, direction, cone_angle, offset, min_distance)]
+
+def toCubeDirection(direction, cube_euler):
+	''' transforms a world direction into the coordinates of a cube with the given orientation (euler angles) '''
+	return np.dot(eulerToMatrix(cube_euler).T, np.asarray(direction, dtype = np.float64))
@@ -0,0 +1,240 @@
+﻿''' Conversion of view intensities to heat map colors, which doesn't require a Vizard session.
+
+Colors are looked up in a table of LUT_SIZE entries computed once per colormap. HeatmapVisualizer uploads
+the same tables as textures (see colormapTextures) and its shader looks them up with the same index
+(see lutIndex), so CPU renderings match what is projected onto the scene. Like the shader, each color has an
+alpha value, and a color is blended over the background with weight BLEND * alpha (see blendColors). '''
+
+import os
+import multiprocessing
+import numpy as np
+
+from view_math import FACE_NAMES
+
+# default number of table entries (intensity textures hold 8 bit values)
+LUT_SIZE = 256
+
+# weight of an opaque heat color when mixed with the model color
+BLEND = 0.5
+
+# intensities up to this value keep the model color
+INTENSITY_EPSILON = 0.00001
+
+# background of rendered images (RGB)
+DEFAULT_BACKGROUND = (1.0, 1.0, 1.0)
+
+def heatColors(i):
+	''' blue -> green -> red, fading out below 1/3 (the original HeatmapVisualizer transfer function).
+	Returns RGBA values (shape (n, 4)) for intensities i (shape (n,)) in range [0.0,1.0]. '''
+	i = np.asarray(i, dtype = np.float64)
+	rgba = np.zeros(i.shape + (4,))
+	rgba[...,3] = 1.0
+
+	high = i > 0.66666
+	mid = ~high & (i > 0.33333)
+	low = ~high & ~mid & (i > 0.0)
+
+	red = (i - 1.0) * -1.0 / (0.66666 - 1.0) + 1.0
+	rgba[high,0] = red[high]
+	rgba[high,1] = 1.0 - red[high]
+
+	green = (i - 0.66666) * -1.0 / (0.33333 - 0.66666) + 1.0
+	rgba[mid,1] = green[mid]
+	rgba[mid,2] = 1.0 - green[mid]
+
+	blue = (i - 0.33333) * -1.0 / (0.0 - 0.33333) + 1.0
+	rgba[low,2] = blue[low]
+	rgba[low,3] = blue[low]
+	return rgba
+
+def greyColors(i):
+	''' black -> white, opaque '''
+	i = np.asarray(i, dtype = np.float64)
+	return np.stack([i, i, i, np.ones(i.shape)], axis = -1)
+
+def hotColors(i):
+	''' black -> red -> yellow -> white, fading in over the lowest quarter '''
+	i = np.asarray(i, dtype = np.float64)
+	return np.stack([
+		np.clip(3.0 * i, 0.0, 1.0),
+		np.clip(3.0 * i - 1.0, 0.0, 1.0),
+		np.clip(3.0 * i - 2.0, 0.0, 1.0),
+		np.clip(4.0 * i, 0.0, 1.0)
+	], axis = -1)
+
+_colormaps = {
+	'heat' : heatColors,
+	'grey' : greyColors,
+	'hot' : hotColors
+}
+
+# tables computed so far, key (name, size)
+_lut_cache = {}
+
+def registerColormap(name, function):
+	''' adds (or replaces) a colormap. function maps intensities (shape (n,), range [0.0,1.0]) to RGBA values (shape (n, 4)). '''
+	_colormaps[name] = function
+	for key in [key for key in _lut_cache if key[0] == name]:
+		del _lut_cache[key]
+
+def getColormapNames():
+	return sorted(_colormaps.keys())
+
+def colormapTable(name = 'heat', size = LUT_SIZE):
+	''' returns the lookup table (float32, shape (size, 4)) of a colormap.
+	Entry k holds the color of intensity k / (size - 1), entry 0 the color just above INTENSITY_EPSILON. '''
+	key = (name, size)
+	if key not in _lut_cache:
+		if name not in _colormaps:
+			raise ValueError("unknown colormap '%s', expected one of %s" % (name, ", ".join(getColormapNames())))
+		i = np.arange(size) / float(size - 1)
+		i[0] = INTENSITY_EPSILON
+		table = np.clip(_colormaps[name](i), 0.0, 1.0).astype(np.float32)
+		table.flags.writeable = False
+		_lut_cache[key] = table
+	return _lut_cache[key]
+
+def lutIndex(i, size = LUT_SIZE):
+	''' returns the table index of intensities in range [0.0,1.0] (nearest entry) '''
+	return np.floor(np.asarray(i) * (size - 1) + 0.5).astype(np.int64)
+
+def scaledIntensity(values, intensity_scale = 1.0):
+	''' returns intensities scaled and clamped like in the shader '''
+	return np.clip(np.asarray(values, dtype = np.float32) * np.float32(intensity_scale), 0.0, 1.0)
+
+def colorize(values, colormap = 'heat', intensity_scale = 1.0, table = None):
+	''' returns RGBA values (float32, shape values.shape + (4,)) of intensities.
+	table may be given instead of a colormap name (see colormapTable). '''
+	if table is None:
+		table = colormapTable(colormap)
+	return table[lutIndex(scaledIntensity(values, intensity_scale), len(table))]
+
+def blendColors(values, colormap = 'heat', intensity_scale = 1.0, background = DEFAULT_BACKGROUND, table = None):
+	''' returns RGB values (float32, shape values.shape + (3,)) of intensities mixed over background
+	(RGB triple or array of shape values.shape + (3,), e.g. a capture of the scene) the way the shader mixes the model color. '''
+	i = scaledIntensity(values, intensity_scale)
+	rgba = colorize(i, colormap, 1.0, table)
+	alpha = rgba[...,3:] * np.float32(BLEND)
+	background = np.broadcast_to(np.asarray(background, dtype = np.float32), i.shape + (3,))
+	mixed = (1.0 - alpha) * background + alpha * rgba[...,:3]
+	return np.where((i > INTENSITY_EPSILON)[...,None], mixed, background).astype(np.float32)
+
+def renderFaces(faces, colormap = 'heat', intensity_scale = 1.0, background = DEFAULT_BACKGROUND, table = None):
+	''' returns map of face name to RGB image (see blendColors) for map of face name to intensity array '''
+	return dict((face, blendColors(faces[face], colormap, intensity_scale, background, table)) for face in FACE_NAMES)
+
+def renderPanorama(faces, layout = 'equirect', size = None, colormap = 'heat', intensity_scale = 1.0, background = DEFAULT_BACKGROUND, table = None):
+	''' returns a single RGB image of all faces (see cube_projection.cubeToLayout).
+	Intensities are interpolated before they are colored, as the shader filters the intensity textures. '''
+	from cube_projection import cubeToLayout
+	return blendColors(cubeToLayout(faces, layout, size), colormap, intensity_scale, background, table)
+
+def _sessionPrefix(session):
+	''' returns the file name prefix of images rendered for a session (see heatmap_aggregator.loadSession) '''
+	if isinstance(session, tuple):
+		return os.path.join(session[0], session[1])
+	return os.path.splitext(session)[0]
+
+def _renderSession(task):
+	''' process pool task: renders faces and panorama of a session, returns the written file names '''
+	from cube_io import writeBmp
+	from heatmap_aggregator import loadSession
+
+	session, table, intensity_scale, layout, size = task
+	faces = loadSession(session)
+	prefix = _sessionPrefix(session) + "_heat"
+
+	written = []
+	images = renderFaces(faces, intensity_scale = intensity_scale, table = table)
+	for face in FACE_NAMES:
+		written.append(prefix + "_" + face + ".bmp")
+		writeBmp(written[-1], images[face])
+	if layout is not None:
+		written.append(prefix + "_" + layout + ".bmp")
+		writeBmp(written[-1], renderPanorama(faces, layout, size, intensity_scale = intensity_scale, table = table))
+	return written
+
+def exportSessions(sessions, colormap = 'heat', intensity_scale = 1.0, layout = 'equirect', size = None, processes = None):
+	''' renders the faces (and a panorama in the given layout, None for none) of each session
+	(see heatmap_aggregator.findSessions) to .bmp files next to the session, named <prefix>_heat_<face>.bmp.
+	Sessions are rendered on a process pool of the given size (default: number of CPUs, 1 runs in this process).
+	Returns the list of written file names. '''
+	sessions = list(sessions)
+	if len(sessions) == 0:
+		return []
+
+	# the table is passed to the workers, such that registered colormaps work in any process
+	table = np.array(colormapTable(colormap))
+	tasks = [(session, table, intensity_scale, layout, size) for session in sessions]
+
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	processes = max(1, min(processes, len(sessions)))
+
+	written = []
+	if processes == 1:
+		for task in tasks:
+			written.extend(_renderSession(task))
+		return written
+
+	pool = multiprocessing.Pool(processes)
+	try:
+		for files in pool.imap(_renderSession, tasks):
+			written.extend(files)
+	finally:
+		pool.close()
+		pool.join()
+	return written
+
+def colormapTextures(name = 'heat', size = LUT_SIZE, directory = None):
+	''' returns the table of a colormap as two size x 1 viz textures (RGB and alpha),
+	sampled without filtering by HeatmapVisualizer (requires Vizard).
+	The tables are written to directory, by default a temporary directory removed once the textures are loaded. '''
+	import viz
+	import shutil
+	import tempfile
+	from cube_io import writeBmp
+
+	temporary = directory is None
+	if temporary:
+		directory = tempfile.mkdtemp(prefix = "colormap_")
+
+	try:
+		table = colormapTable(name, size)
+		paths = [os.path.join(directory, name + "_rgb.bmp"), os.path.join(directory, name + "_alpha.bmp")]
+		writeBmp(paths[0], table[None,:,:3])
+		writeBmp(paths[1], table[None,:,3])
+
+		textures = []
+		for path in paths:
+			texture = viz.addTexture(path)
+			texture.filter(viz.MIN_FILTER, viz.NEAREST)
+			texture.filter(viz.MAG_FILTER, viz.NEAREST)
+			texture.wrap(viz.WRAP_S, viz.CLAMP_TO_EDGE)
+			textures.append(texture)
+		return textures
+	finally:
+		if temporary:
+			shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == '__main__':
+	import sys
+	from heatmap_aggregator import findSessions
+
+	if len(sys.argv) < 2:
+		print "usage: heat_colors.py <sessions directory> [%s] [intensity scale] [equirect|octahedral]" % "|".join(getColormapNames())
+		sys.exit(1)
+
+	colormap = 'heat'
+	if len(sys.argv) > 2:
+		colormap = sys.argv[2]
+	intensity_scale = 1.0
+	if len(sys.argv) > 3:
+		intensity_scale = float(sys.argv[3])
+	layout = 'equirect'
+	if len(sys.argv) > 4:
+		layout = sys.argv[4]
+
+	sessions = findSessions(sys.argv[1])
+	written = exportSessions(sessions, colormap, intensity_scale, layout)
+	print "Rendered %d sessions to %d images" % (len(sessions), len(written))
@@ -0,0 +1,135 @@
+﻿''' Combines the cube face intensities of many capture sessions into a single cubemap.
+Sessions are loaded and reduced on a process pool. Each task reduces a group of sessions
+into one partial result, so memory per worker is bounded by two cubemaps. '''
+
+import os
+import multiprocessing
+import numpy as np
+
+from view_math import FACE_NAMES
+from cube_io import loadFaces, facePaths
+from cube_hdr import readHDR, readHDRHeader, HDR_EXTENSION
+
+# supported reductions
+MODES = ('mean', 'sum', 'max')
+
+# suffix of directories still being written (see batch_pipeline, result_cache)
+PARTIAL_SUFFIX = ".partial"
+
+def findSessions(directory, prefix = "accumulated"):
+	''' returns all sessions below directory: (directory, prefix) for complete sets of face files written by saveAll
+	and file names of HDR cube files (see cube_hdr). Mip pyramid levels (see cube_mip)
+	and unfinished sessions (directories ending in ".partial") are skipped. '''
+	sessions = []
+	for root, dirs, files in os.walk(directory):
+		dirs[:] = sorted(name for name in dirs if not name.endswith(PARTIAL_SUFFIX))
+		paths = facePaths(prefix, root)
+		if all(os.path.isfile(paths[face]) for face in FACE_NAMES):
+			sessions.append((root, prefix))
+		for name in sorted(files):
+			if name.endswith(HDR_EXTENSION):
+				path = os.path.join(root, name)
+				if "mip_level_of" not in readHDRHeader(path):
+					sessions.append(path)
+	return sessions
+
+def loadSession(session):
+	''' loads the faces of a session given as HDR cube file name, directory or (directory, prefix) tuple.
+	Returns map of face name to float32 intensity array. '''
+	if not isinstance(session, tuple) and session.endswith(HDR_EXTENSION):
+		return readHDR(session)[0]
+	if isinstance(session, tuple):
+		directory, prefix = session
+	else:
+		directory, prefix = session, "accumulated"
+	return loadFaces(prefix, directory)
+
+def _combine(result, faces, mode):
+	''' folds faces into result (in place) using 'sum' or 'max' '''
+	for face in FACE_NAMES:
+		if mode == 'max':
+			np.maximum(result[face], faces[face], out = result[face])
+		else:
+			result[face] += faces[face]
+
+def _reduceSessions(task):
+	''' process pool task: reduces a group of sessions, returns (partial result, number of sessions) '''
+	sessions, mode = task
+	result = None
+	for session in sessions:
+		faces = loadSession(session)
+		if result is None:
+			result = dict((face, np.array(faces[face], dtype = np.float32)) for face in FACE_NAMES)
+		else:
+			_combine(result, faces, mode)
+	return result, len(sessions)
+
+def aggregateSessions(sessions, mode = 'mean', processes = None, group_size = None):
+	''' reduces the faces of all sessions (see loadSession) into one float32 cubemap using 'mean', 'sum' or 'max'.
+	processes specifies the size of the process pool (default: number of CPUs, 1 runs in this process).
+	group_size specifies the number of sessions reduced per task.
+	Returns map of face name to float32 intensity array (see cube_io.toVizTextures). '''
+	if mode not in MODES:
+		raise ValueError("unknown aggregation mode '%s', expected one of %s" % (mode, ", ".join(MODES)))
+
+	sessions = list(sessions)
+	if len(sessions) == 0:
+		raise ValueError("no sessions to aggregate")
+
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	processes = max(1, min(processes, len(sessions)))
+
+	if group_size is None:
+		group_size = max(1, len(sessions) // (processes * 4))
+
+	reduce_mode = 'max' if mode == 'max' else 'sum'
+	tasks = [(sessions[i:i+group_size], reduce_mode) for i in range(0, len(sessions), group_size)]
+
+	result = None
+	count = 0
+
+	pool = None
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+		partials = pool.imap_unordered(_reduceSessions, tasks)
+	else:
+		partials = (_reduceSessions(task) for task in tasks)
+
+	try:
+		for partial, partial_count in partials:
+			if result is None:
+				result = partial
+			else:
+				_combine(result, partial, reduce_mode)
+			count += partial_count
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if mode == 'mean':
+		for face in FACE_NAMES:
+			result[face] /= np.float32(count)
+
+	return result
+
+if __name__ == '__main__':
+	import sys
+	from cube_hdr import writeHDR
+
+	if len(sys.argv) < 2:
+		print "usage: heatmap_aggregator.py <sessions directory> [mean|sum|max] [output prefix]"
+		sys.exit(1)
+
+	mode = 'mean'
+	if len(sys.argv) > 2:
+		mode = sys.argv[2]
+	prefix = "aggregated"
+	if len(sys.argv) > 3:
+		prefix = sys.argv[3]
+
+	sessions = findSessions(sys.argv[1])
+	faces = aggregateSessions(sessions, mode)
+	writeHDR(prefix, faces, {"session_count" : len(sessions), "mode" : mode})
+	print "Aggregated %d sessions (%s) into %s" % (len(sessions), mode, prefix + HDR_EXTENSION)
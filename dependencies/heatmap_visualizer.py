@@ -2,6 +2,10 @@
 import vizfx
 import vizact
 
+from transform_cache import TransformCache
+import update_profiler
+from heat_colors import colormapTextures, LUT_SIZE, BLEND, INTENSITY_EPSILON
+
 def toGL(mat = viz.Matrix()):
 	''' Converts a vizard matrix to a GL matrix. '''
 	temp_mat = viz.Matrix(mat)
@@ -29,9 +33,11 @@ class HeatmapVisualizer(viz.VizNode):
 		viz.NEGATIVE_Y : viz.<Texture>,
 		viz.POSITIVE_Z : viz.<Texture>,
 		viz.NEGATIVE_Z : viz.<Texture>
-	}'''
+	}
+	Intensities are converted to colors with a colormap table (see heat_colors), such that
+	images rendered offline with heat_colors show the same colors.'''
 
-	def __init__(self, textures, auto_update = True, node = None, **kwargs):
+	def __init__(self, textures, auto_update = True, node = None, colormap = 'heat', **kwargs):
 
 		# node to reference this instance in the scenegraph
 		self._node = node
@@ -45,6 +51,10 @@ class HeatmapVisualizer(viz.VizNode):
 
 		# save projective textures
 		self._textures = textures
+		
+		# name and lookup textures (RGB, alpha) of the colormap
+		self._colormap = None
+		self._colormap_textures = []
 
 		## Initialize depth cameras.
 		# They are used to capture a depth buffer for each face.
@@ -78,6 +88,19 @@ class HeatmapVisualizer(viz.VizNode):
 			viz.NEGATIVE_Z : [-180,0,0]
 		}
 		
+		# constant rotations of the texture view matrices, relative to this node
+		self._face_rotations = [
+			("Tex_ViewMat_px", eulerMat(90,0,0)),
+			("Tex_ViewMat_nx", eulerMat(-90,0,0)),
+			("Tex_ViewMat_py", eulerMat(0,-90,0)),
+			("Tex_ViewMat_ny", eulerMat(0,90,0)),
+			("Tex_ViewMat_pz", eulerMat(0,0,0)),
+			("Tex_ViewMat_nz", eulerMat(180,0,0))
+		]
+		
+		# skips matrix conversions and property uploads while node and main view don't move
+		self._cache = TransformCache()
+		
 		proj_mat = viz.Matrix.perspective(90.0,1.0,0.1,100.0)
 
 		for cam in self._depth_cams:
@@ -99,34 +122,54 @@ class HeatmapVisualizer(viz.VizNode):
 		
 		# set initial property values
 		self._effect.setProperty("Tex_ProjMat", proj_mat)
-		self._effect.setProperty("Inv_ViewMat", toGL(viz.MainView.getMatrix().inverse()))
-		self._effect.setProperty("Tex_ViewMat_px", toGL(eulerMat(90,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_nx", toGL(eulerMat(-90,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_py", toGL(eulerMat(0,-90,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_ny", toGL(eulerMat(0,90,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_pz", toGL(eulerMat(0,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_nz", toGL(eulerMat(180,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_px", self._textures[viz.POSITIVE_X])
-		self._effect.setProperty("Tex_nx", self._textures[viz.NEGATIVE_X])
-		self._effect.setProperty("Tex_py", self._textures[viz.POSITIVE_Y])
-		self._effect.setProperty("Tex_ny", self._textures[viz.NEGATIVE_Y])
-		self._effect.setProperty("Tex_pz", self._textures[viz.POSITIVE_Z])
-		self._effect.setProperty("Tex_nz", self._textures[viz.NEGATIVE_Z])
+		self.update()
+		self.setTextures(self._textures)
 		self._effect.setProperty("TexDepth_px", self._depth_textures[viz.POSITIVE_X])
 		self._effect.setProperty("TexDepth_nx", self._depth_textures[viz.NEGATIVE_X])
 		self._effect.setProperty("TexDepth_py", self._depth_textures[viz.POSITIVE_Y])
 		self._effect.setProperty("TexDepth_ny", self._depth_textures[viz.NEGATIVE_Y])
 		self._effect.setProperty("TexDepth_pz", self._depth_textures[viz.POSITIVE_Z])
 		self._effect.setProperty("TexDepth_nz", self._depth_textures[viz.NEGATIVE_Z])
+		self.setColormap(colormap)
 		
 		# init auto update
-		self._auto_update = vizact.onupdate(0, self.update)
+		self._auto_update = update_profiler.onupdate(0, self.update)
 		self._auto_update.setEnabled(auto_update)
 
 	def setEnableAutoUpdate(self, enabled):
 		''' sets whether or not auto update is enabled for the shader effect '''
 		self._auto_update.setEnabled(enabled)
 		
+	def setTextures(self, textures):
+		''' replaces the projected intensity textures (map of viz cube face constant to texture, see constructor),
+		e.g. to show another time window (see time_store.TimeWindowSource) '''
+		self._textures = textures
+		self._effect.setProperty("Tex_px", self._textures[viz.POSITIVE_X])
+		self._effect.setProperty("Tex_nx", self._textures[viz.NEGATIVE_X])
+		self._effect.setProperty("Tex_py", self._textures[viz.POSITIVE_Y])
+		self._effect.setProperty("Tex_ny", self._textures[viz.NEGATIVE_Y])
+		self._effect.setProperty("Tex_pz", self._textures[viz.POSITIVE_Z])
+		self._effect.setProperty("Tex_nz", self._textures[viz.NEGATIVE_Z])
+		
+	def getTextures(self):
+		''' returns the projected intensity textures '''
+		return self._textures
+		
+	def setColormap(self, name, size = LUT_SIZE):
+		''' sets the colormap converting intensities to colors (see heat_colors.getColormapNames) '''
+		textures = colormapTextures(name, size)
+		self._effect.setProperty("Tex_Colormap", textures[0])
+		self._effect.setProperty("Tex_ColormapAlpha", textures[1])
+		self._effect.setProperty("colormap_size", float(size))
+		for texture in self._colormap_textures:
+			texture.remove()
+		self._colormap = name
+		self._colormap_textures = textures
+		
+	def getColormap(self):
+		''' returns the name of the colormap '''
+		return self._colormap
+		
 	def setIntensityScale(self, intensity_scale):
 		''' sets the scale factor which varies the overall intensity of the view accumulation. '''
 		self._effect.setProperty("intensity_scale", intensity_scale)
@@ -139,15 +182,29 @@ class HeatmapVisualizer(viz.VizNode):
 		''' returns the shader effect '''
 		return self._effect
 
+	def getTransformCache(self):
+		''' returns the cache tracking node and main view changes between updates (see transform_cache) '''
+		return self._cache
+
+	def _setProperty(self, name):
+		''' returns a setter for the given effect property '''
+		return lambda value: self._effect.setProperty(name, value)
+
 	def update(self):
-		''' updates properties '''
-		self._effect.setProperty("Tex_ViewMat_px", toGL(eulerMat(90,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_nx", toGL(eulerMat(-90,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_py", toGL(eulerMat(0,-90,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_ny", toGL(eulerMat(0,90,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_pz", toGL(eulerMat(0,0,0)*self.getMatrix()))
-		self._effect.setProperty("Tex_ViewMat_nz", toGL(eulerMat(180,0,0)*self.getMatrix()))
-		self._effect.setProperty("Inv_ViewMat", toGL(viz.MainView.getMatrix().inverse()))
+		''' updates properties (only those depending on a matrix which changed since the last update) '''
+		self._cache.beginFrame(viz.getFrameNumber())
+
+		node_mat = self.getMatrix()
+		for name, rotation in self._face_rotations:
+			value, _ = self._cache.derive(name, [node_mat], lambda: toGL(rotation*node_mat))
+			self._cache.upload(name, value, self._setProperty(name))
+
+		view_mat = viz.MainView.getMatrix()
+		value, _ = self._cache.derive("Inv_ViewMat", [view_mat], lambda: toGL(view_mat.inverse()))
+		self._cache.upload("Inv_ViewMat", value, self._setProperty("Inv_ViewMat"))
+		
+		# depth pass of each face
+		update_profiler.countPasses("HeatmapVisualizer", len(self._depth_cams))
 
 	def affect(self, model):
 		''' sets effect for node '''
@@ -162,6 +219,8 @@ class HeatmapVisualizer(viz.VizNode):
 		for face in self._depth_cams:
 			self._depth_cams[face].remove()
 			self._depth_textures[face].remove()
+		for texture in self._colormap_textures:
+			texture.remove()
 		viz.VizNode.remove(self)
 		
 	def _getShaderCode(self):
@@ -218,6 +277,14 @@ class HeatmapVisualizer(viz.VizNode):
 					unit 22
 				}
 
+				Texture2D Tex_Colormap {
+					unit 23
+				}
+
+				Texture2D Tex_ColormapAlpha {
+					unit 24
+				}
+
 				Matrix4 Tex_ViewMat_px {
 					value 1.0 0.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0 0.0 1.0
 				}
@@ -253,6 +320,10 @@ class HeatmapVisualizer(viz.VizNode):
 				Float intensity_scale {
 					value 1.0
 				}
+				
+				Float colormap_size {
+					value %(lut_size)r
+				}
 
 				Shader {
 					BEGIN VertexHeader
@@ -389,36 +460,14 @@ class HeatmapVisualizer(viz.VizNode):
 						// should be same, but let's interpolate to be sure
 						float i = 0.33333 * proj_clr.r + 0.33333 * proj_clr.g + 0.33333 * proj_clr.b;
 						i = clamp(i*intensity_scale, 0.0, 1.0);
-						if(i > 0.00001 && clr.a > 0.00001) {
-							float r=0.0,g=0.0,b=0.0,a=1.0;
-							float x1,x2,x3,y1,y2,y3;
-							y1 = 1.0;
-							y3 = 0.0;
-							x2 = i;
-							if(i > 0.66666) {
-								x1 = 1.0;
-								x3 = 0.66666;
-								y2 = ( ((x2-x1)*(y3-y1))/(x3-x1) ) + y1;
-								r = y2;
-								g = 1.0 - r;
-							}
-							else if(i > 0.33333) {
-								x1 = 0.66666;
-								x3 = 0.33333;
-								y2 = ( ((x2-x1)*(y3-y1))/(x3-x1) ) + y1;
-								g = y2;
-								b = 1.0 - g;
-							}
-							else if(i > 0.0) {
-								x1 = 0.33333;
-								x3 = 0.0;
-								y2 = ( ((x2-x1)*(y3-y1))/(x3-x1) ) + y1;
-								b = y2;
-								a = b;
-							}
+						if(i > %(epsilon)r && clr.a > 0.00001) {
+							// nearest colormap entry (see heat_colors.lutIndex)
+							vec2 lut = vec2((floor(i * (colormap_size - 1.0) + 0.5) + 0.5) / colormap_size, 0.5);
+							vec3 heat_clr = texture2D(Tex_Colormap, lut).rgb;
+							float a = texture2D(Tex_ColormapAlpha, lut).r;
 
 							// mix with model color
-							gl_FragColor = (0.5 + 0.5*(1-a)) * clr + (0.5 * a) * vec4(r, g, b, 1.0);
+							gl_FragColor = (1.0 - %(blend)r*a) * clr + (%(blend)r * a) * vec4(heat_clr, 1.0);
 						}
 						else {
 							gl_FragColor = clr;
@@ -426,7 +475,7 @@ class HeatmapVisualizer(viz.VizNode):
 					END
 				}
 			}
-		"""
+		""" % {"lut_size" : float(LUT_SIZE), "blend" : BLEND, "epsilon" : INTENSITY_EPSILON}
 
 if __name__ == '__main__':
 	import vizcam
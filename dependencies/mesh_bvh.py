@@ -0,0 +1,170 @@
+﻿''' Bounding volume hierarchy over triangle meshes for CPU ray casting, which doesn't require a Vizard session.
+Rays are traversed in batches: all (ray, node) pairs of a tree level are tested at once with NumPy,
+such that the Python overhead depends on the tree depth rather than the number of rays. '''
+
+import numpy as np
+
+# maximum number of triangles per leaf
+LEAF_SIZE = 8
+
+# number of rays traversed at once (bounds the memory used for (ray, node) pairs)
+RAY_BATCH = 32768
+
+class MeshBVH(object):
+	''' BVH built by median splits along the largest axis of the triangle centroids.
+	Nodes are stored in flat arrays, triangles are reordered such that each leaf covers a contiguous range. '''
+
+	def __init__(self, vertices, triangles, leaf_size = LEAF_SIZE):
+		vertices = np.asarray(vertices, dtype = np.float64)
+		triangles = np.asarray(triangles, dtype = np.int64)
+		corners = vertices[triangles]
+		centroids = corners.mean(axis = 1)
+		tri_min = corners.min(axis = 1)
+		tri_max = corners.max(axis = 1)
+
+		order = np.arange(len(triangles))
+		bounds_min = []
+		bounds_max = []
+		children = []
+		ranges = []
+
+		# explicit stack of (node index, start, end) into order
+		bounds_min.append(None)
+		bounds_max.append(None)
+		children.append([-1, -1])
+		ranges.append([0, 0])
+		stack = [(0, 0, len(triangles))]
+		while len(stack) > 0:
+			node, start, end = stack.pop()
+			members = order[start:end]
+			if len(members) > 0:
+				bounds_min[node] = tri_min[members].min(axis = 0)
+				bounds_max[node] = tri_max[members].max(axis = 0)
+			else:
+				bounds_min[node] = np.full(3, np.inf)
+				bounds_max[node] = np.full(3, -np.inf)
+
+			if end - start <= leaf_size:
+				ranges[node] = [start, end - start]
+				continue
+
+			extent = centroids[members].max(axis = 0) - centroids[members].min(axis = 0)
+			axis = int(np.argmax(extent))
+			half = (end - start) // 2
+			split = np.argpartition(centroids[members, axis], half)
+			order[start:end] = members[split]
+
+			for child_start, child_end in ((start, start + half), (start + half, end)):
+				children[node][0 if child_start == start else 1] = len(children)
+				bounds_min.append(None)
+				bounds_max.append(None)
+				children.append([-1, -1])
+				ranges.append([0, 0])
+				stack.append((len(children) - 1, child_start, child_end))
+
+		self._bounds_min = np.array(bounds_min)
+		self._bounds_max = np.array(bounds_max)
+		self._children = np.array(children, dtype = np.int64)
+		self._start = np.array([r[0] for r in ranges], dtype = np.int64)
+		self._count = np.array([r[1] for r in ranges], dtype = np.int64)
+
+		# triangles in leaf order, prepared for the intersection test
+		corners = corners[order]
+		self._triangle_order = order
+		self._v0 = corners[:,0]
+		self._e1 = corners[:,1] - corners[:,0]
+		self._e2 = corners[:,2] - corners[:,0]
+
+	def getNodeCount(self):
+		return len(self._count)
+
+	def getTriangleCount(self):
+		return len(self._v0)
+
+	def _intersect(self, origins, directions, triangles):
+		''' returns ray parameters t of (ray, triangle) pairs, inf where they don't intersect (Moller-Trumbore) '''
+		e1 = self._e1[triangles]
+		e2 = self._e2[triangles]
+		p = np.cross(directions, e2)
+		det = np.sum(e1 * p, axis = 1)
+		valid = np.abs(det) > 1e-12
+		inv_det = 1.0 / np.where(valid, det, 1.0)
+
+		s = origins - self._v0[triangles]
+		u = np.sum(s * p, axis = 1) * inv_det
+		q = np.cross(s, e1)
+		v = np.sum(directions * q, axis = 1) * inv_det
+		t = np.sum(e2 * q, axis = 1) * inv_det
+
+		valid &= (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0)
+		return np.where(valid, t, np.inf)
+
+	def _occludedBatch(self, origins, directions, t_min, t_max):
+		occluded = np.zeros(len(origins), dtype = bool)
+		if len(self._v0) == 0:
+			return occluded
+
+		# zero components are replaced by a tiny value, which keeps the slab test free of NaNs
+		inv_directions = 1.0 / np.where(directions == 0.0, 1e-300, directions)
+
+		rays = np.arange(len(origins))
+		nodes = np.zeros(len(origins), dtype = np.int64)
+		while len(rays) > 0:
+			# pairs of rays already occluded are dropped
+			keep = ~occluded[rays]
+			rays = rays[keep]
+			nodes = nodes[keep]
+
+			# slab test against the node bounds
+			ray_origins = origins[rays]
+			ray_inv = inv_directions[rays]
+			t0 = (self._bounds_min[nodes] - ray_origins) * ray_inv
+			t1 = (self._bounds_max[nodes] - ray_origins) * ray_inv
+			t_near = np.minimum(t0, t1).max(axis = 1)
+			t_far = np.maximum(t0, t1).min(axis = 1)
+			hit = (t_near <= t_far) & (t_far >= t_min[rays]) & (t_near <= t_max[rays])
+			rays = rays[hit]
+			nodes = nodes[hit]
+
+			# leaves: test all (ray, triangle) pairs
+			leaf = self._count[nodes] > 0
+			leaf_rays = rays[leaf]
+			leaf_nodes = nodes[leaf]
+			if len(leaf_rays) > 0:
+				counts = self._count[leaf_nodes]
+				pair_rays = np.repeat(leaf_rays, counts)
+				first = np.repeat(np.cumsum(counts) - counts, counts)
+				pair_triangles = np.repeat(self._start[leaf_nodes], counts) + np.arange(len(pair_rays)) - first
+				t = self._intersect(origins[pair_rays], directions[pair_rays], pair_triangles)
+				blocked = (t > t_min[pair_rays]) & (t < t_max[pair_rays])
+				occluded[pair_rays[blocked]] = True
+
+			# inner nodes: continue with both children
+			inner = ~leaf
+			rays = np.concatenate([rays[inner], rays[inner]])
+			nodes = np.concatenate([self._children[nodes[inner], 0], self._children[nodes[inner], 1]])
+
+		return occluded
+
+	def occluded(self, origins, directions, t_min = 0.0, t_max = np.inf):
+		''' returns for each ray (origins + t * directions) whether any triangle is hit with t_min < t < t_max.
+		origins may be a single point shared by all rays, t_min and t_max scalars or per ray arrays. '''
+		directions = np.asarray(directions, dtype = np.float64)
+		count = len(directions)
+		origins = np.broadcast_to(np.asarray(origins, dtype = np.float64), (count, 3))
+		t_min = np.broadcast_to(np.asarray(t_min, dtype = np.float64), (count,))
+		t_max = np.broadcast_to(np.asarray(t_max, dtype = np.float64), (count,))
+
+		result = np.zeros(count, dtype = bool)
+		for start in range(0, count, RAY_BATCH):
+			end = min(start + RAY_BATCH, count)
+			result[start:end] = self._occludedBatch(origins[start:end], directions[start:end], t_min[start:end], t_max[start:end])
+		return result
+
+	def visible(self, eye, points, bias = 1e-3):
+		''' returns for each point whether the segment from eye to the point is free of triangles.
+		Hits closer than bias (scene units) to the point are ignored, such that points on the mesh see the eye. '''
+		directions = np.asarray(points, dtype = np.float64) - np.asarray(eye, dtype = np.float64)
+		distance = np.sqrt(np.sum(directions * directions, axis = 1))
+		t_max = 1.0 - bias / np.maximum(distance, bias)
+		return ~self.occluded(eye, directions, 0.0, t_max)
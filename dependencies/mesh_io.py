@@ -0,0 +1,229 @@
+﻿''' Loading and saving of triangle meshes (scene geometry exported to OBJ or PLY), which don't require a Vizard session.
+Meshes are handled as map of arrays:
+{
+	"vertices" : (n, 3) float64,
+	"triangles" : (m, 3) int64 indices into vertices,
+	"uvs" : (k, 2) float64 texture coordinates or None,
+	"uv_triangles" : (m, 3) int64 indices into uvs or None
+}
+Polygons are split into triangle fans. '''
+
+import numpy as np
+
+def _emptyMesh():
+	return {
+		"vertices" : np.zeros((0, 3)),
+		"triangles" : np.zeros((0, 3), dtype = np.int64),
+		"uvs" : None,
+		"uv_triangles" : None
+	}
+
+def _fan(indices):
+	''' returns the triangles of a polygon fan '''
+	return [(indices[0], indices[i], indices[i+1]) for i in range(1, len(indices) - 1)]
+
+def loadObj(file_name):
+	''' loads vertices, faces and texture coordinates of a Wavefront OBJ file '''
+	vertices = []
+	uvs = []
+	triangles = []
+	uv_triangles = []
+	has_uvs = True
+
+	with open(file_name, 'r') as obj_file:
+		for line in obj_file:
+			values = line.split()
+			if len(values) == 0:
+				continue
+			if values[0] == 'v':
+				vertices.append([float(v) for v in values[1:4]])
+			elif values[0] == 'vt':
+				uvs.append([float(v) for v in values[1:3]])
+			elif values[0] == 'f':
+				corners = [corner.split('/') for corner in values[1:]]
+
+				# negative indices are relative to the end of the lists read so far
+				index = [int(c[0]) for c in corners]
+				index = [i - 1 if i > 0 else len(vertices) + i for i in index]
+				triangles.extend(_fan(index))
+
+				if all(len(c) > 1 and len(c[1]) > 0 for c in corners):
+					uv_index = [int(c[1]) for c in corners]
+					uv_index = [i - 1 if i > 0 else len(uvs) + i for i in uv_index]
+					uv_triangles.extend(_fan(uv_index))
+				else:
+					has_uvs = False
+
+	mesh = _emptyMesh()
+	if len(vertices) > 0:
+		mesh["vertices"] = np.array(vertices, dtype = np.float64)
+	if len(triangles) > 0:
+		mesh["triangles"] = np.array(triangles, dtype = np.int64)
+	if has_uvs and len(uv_triangles) > 0:
+		mesh["uvs"] = np.array(uvs, dtype = np.float64)
+		mesh["uv_triangles"] = np.array(uv_triangles, dtype = np.int64)
+	return mesh
+
+_PLY_TYPES = {
+	'char' : 'i1', 'int8' : 'i1', 'uchar' : 'u1', 'uint8' : 'u1',
+	'short' : 'i2', 'int16' : 'i2', 'ushort' : 'u2', 'uint16' : 'u2',
+	'int' : 'i4', 'int32' : 'i4', 'uint' : 'u4', 'uint32' : 'u4',
+	'float' : 'f4', 'float32' : 'f4', 'double' : 'f8', 'float64' : 'f8'
+}
+
+_PLY_UV_NAMES = (('u', 'v'), ('s', 't'), ('texture_u', 'texture_v'), ('texture_s', 'texture_t'))
+
+def _readPlyHeader(ply_file, file_name):
+	''' returns format and list of elements (name, count, properties) of a PLY header.
+	Properties are (name, type) or (name, (count type, item type)) for lists. '''
+	if ply_file.readline().strip() != b'ply':
+		raise IOError("not a ply file: " + file_name)
+
+	ply_format = None
+	elements = []
+	while True:
+		line = ply_file.readline()
+		if len(line) == 0:
+			raise IOError("unexpected end of ply header: " + file_name)
+		values = line.decode('ascii').split()
+		if len(values) == 0:
+			continue
+		if values[0] == 'format':
+			ply_format = values[1]
+		elif values[0] == 'element':
+			elements.append((values[1], int(values[2]), []))
+		elif values[0] == 'property':
+			if values[1] == 'list':
+				elements[-1][2].append((values[4], (_PLY_TYPES[values[2]], _PLY_TYPES[values[3]])))
+			else:
+				elements[-1][2].append((values[2], _PLY_TYPES[values[1]]))
+		elif values[0] == 'end_header':
+			break
+
+	if ply_format not in ('ascii', 'binary_little_endian', 'binary_big_endian'):
+		raise IOError("unsupported ply format %s: %s" % (ply_format, file_name))
+	return ply_format, elements
+
+def _readPlyElement(ply_file, ply_format, count, properties):
+	''' returns map of property name to array (lists: list of arrays) for one element '''
+	byte_order = '>' if ply_format == 'binary_big_endian' else '<'
+	has_lists = any(isinstance(kind, tuple) for name, kind in properties)
+
+	if ply_format == 'ascii':
+		rows = [ply_file.readline().split() for i in range(count)]
+		result = dict((name, []) for name, kind in properties)
+		for row in rows:
+			pos = 0
+			for name, kind in properties:
+				if isinstance(kind, tuple):
+					length = int(row[pos])
+					result[name].append(np.array(row[pos+1:pos+1+length], dtype = kind[1]))
+					pos += 1 + length
+				else:
+					result[name].append(row[pos])
+					pos += 1
+		for name, kind in properties:
+			if not isinstance(kind, tuple):
+				result[name] = np.array(result[name], dtype = kind)
+		return result
+
+	if not has_lists:
+		dtype = np.dtype([(name, byte_order + kind) for name, kind in properties])
+		data = np.frombuffer(ply_file.read(dtype.itemsize * count), dtype = dtype)
+		return dict((name, data[name]) for name, kind in properties)
+
+	# a single list of triangles (the common case) is read as fixed size records
+	if len(properties) == 1:
+		name, kind = properties[0]
+		dtype = np.dtype([('count', byte_order + kind[0]), ('items', byte_order + kind[1], (3,))])
+		start = ply_file.tell()
+		data = np.frombuffer(ply_file.read(dtype.itemsize * count), dtype = dtype)
+		if len(data) == count and np.all(data['count'] == 3):
+			return {name : data['items']}
+		ply_file.seek(start)
+
+	# variable length records are read one by one
+	result = dict((name, []) for name, kind in properties)
+	for i in range(count):
+		for name, kind in properties:
+			if isinstance(kind, tuple):
+				count_type = np.dtype(byte_order + kind[0])
+				length = int(np.frombuffer(ply_file.read(count_type.itemsize), dtype = count_type)[0])
+				item_type = np.dtype(byte_order + kind[1])
+				result[name].append(np.frombuffer(ply_file.read(item_type.itemsize * length), dtype = item_type))
+			else:
+				value_type = np.dtype(byte_order + kind)
+				result[name].append(np.frombuffer(ply_file.read(value_type.itemsize), dtype = value_type)[0])
+	for name, kind in properties:
+		if not isinstance(kind, tuple):
+			result[name] = np.array(result[name])
+	return result
+
+def loadPly(file_name):
+	''' loads vertices, faces and per vertex texture coordinates of an ascii or binary PLY file '''
+	mesh = _emptyMesh()
+	with open(file_name, 'rb') as ply_file:
+		ply_format, elements = _readPlyHeader(ply_file, file_name)
+		for name, count, properties in elements:
+			data = _readPlyElement(ply_file, ply_format, count, properties)
+			if name == 'vertex':
+				mesh["vertices"] = np.stack([data['x'], data['y'], data['z']], axis = -1).astype(np.float64)
+				for u, v in _PLY_UV_NAMES:
+					if u in data and v in data:
+						mesh["uvs"] = np.stack([data[u], data[v]], axis = -1).astype(np.float64)
+						break
+			elif name == 'face':
+				key = 'vertex_indices' if 'vertex_indices' in data else 'vertex_index'
+				if isinstance(data[key], np.ndarray):
+					mesh["triangles"] = data[key].astype(np.int64)
+					continue
+				triangles = []
+				for polygon in data[key]:
+					triangles.extend(_fan([int(i) for i in polygon]))
+				if len(triangles) > 0:
+					mesh["triangles"] = np.array(triangles, dtype = np.int64)
+
+	if mesh["uvs"] is not None:
+		mesh["uv_triangles"] = mesh["triangles"]
+	return mesh
+
+def loadMesh(file_name):
+	''' loads an OBJ or PLY file (chosen by extension) '''
+	if file_name.lower().endswith('.obj'):
+		return loadObj(file_name)
+	if file_name.lower().endswith('.ply'):
+		return loadPly(file_name)
+	raise IOError("unsupported mesh format (expected .obj or .ply): " + file_name)
+
+def writePly(file_name, mesh, values = None, colors = None):
+	''' writes a binary PLY file of the mesh, with optional per vertex float values (property "intensity")
+	and per vertex colors ((n, 3) uint8), which Vizard displays without any shader. '''
+	vertices = np.asarray(mesh["vertices"])
+	triangles = np.asarray(mesh["triangles"])
+
+	fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+	if values is not None:
+		fields.append(('intensity', '<f4'))
+	if colors is not None:
+		fields.extend([('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+
+	data = np.zeros(len(vertices), dtype = fields)
+	data['x'], data['y'], data['z'] = vertices[:,0], vertices[:,1], vertices[:,2]
+	if values is not None:
+		data['intensity'] = values
+	if colors is not None:
+		data['red'], data['green'], data['blue'] = colors[:,0], colors[:,1], colors[:,2]
+
+	faces = np.zeros(len(triangles), dtype = [('count', 'u1'), ('indices', '<i4', (3,))])
+	faces['count'] = 3
+	faces['indices'] = triangles
+
+	names = {'<f4' : 'float', 'u1' : 'uchar'}
+	header = ["ply", "format binary_little_endian 1.0", "element vertex %d" % len(vertices)]
+	header.extend("property %s %s" % (names[kind], name) for name, kind in fields)
+	header.extend(["element face %d" % len(triangles), "property list uchar int vertex_indices", "end_header"])
+
+	with open(file_name, 'wb') as ply_file:
+		ply_file.write(("\n".join(header) + "\n").encode('ascii'))
+		ply_file.write(data.tobytes())
+		ply_file.write(faces.tobytes())
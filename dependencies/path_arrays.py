@@ -0,0 +1,205 @@
+﻿''' Reads recorded animation paths into NumPy arrays, without requiring a Vizard session.
+
+Two file layouts are understood, both stored as .txt:
+	- the JSON object written by AnimationPathRecorder.writeToFile: {"path" : [record, record, ...]}
+	  (several of these objects may follow each other, as written with append = True)
+	- a line delimited variant holding one record object per line
+Records are parsed incrementally, so memory usage is bounded by the chunk size
+and not by the length of the recording.
+Binary path files (see path_store) are opened via mmap instead. '''
+
+import re
+import json
+import numpy as np
+
+# number of characters read from file at once
+READ_SIZE = 1 << 16
+
+# default number of records per chunk
+CHUNK_SIZE = 4096
+
+_PATH_START = re.compile(r'\{\s*"path"\s*:\s*\[')
+_SEPARATORS = re.compile(r'[\s,]*')
+
+class _JsonStreamReader(object):
+	''' incrementally decodes JSON values from a file object '''
+
+	def __init__(self, data_file):
+		self._file = data_file
+		self._decoder = json.JSONDecoder()
+		self._buffer = ""
+		self._pos = 0
+		self._eof = False
+
+	def _fill(self, count = READ_SIZE):
+		''' reads more data, returns False at end of file '''
+		if self._eof:
+			return False
+		data = self._file.read(count)
+		if len(data) == 0:
+			self._eof = True
+			return False
+		# drop consumed data, such that the buffer stays small
+		self._buffer = self._buffer[self._pos:] + data
+		self._pos = 0
+		return True
+
+	def skipSeparators(self):
+		''' skips whitespace and commas, returns next character or None at end of file '''
+		while True:
+			self._pos = _SEPARATORS.match(self._buffer, self._pos).end()
+			if self._pos < len(self._buffer):
+				return self._buffer[self._pos]
+			if not self._fill():
+				return None
+
+	def consume(self, count = 1):
+		self._pos += count
+
+	def matchPathStart(self):
+		''' consumes '{"path":[' if it is next in the stream '''
+		while len(self._buffer) - self._pos < 64 and self._fill():
+			pass
+		match = _PATH_START.match(self._buffer, self._pos)
+		if match is None:
+			return False
+		self._pos = match.end()
+		return True
+
+	def isLastLine(self):
+		''' returns if the remaining data holds at most a single line (only valid at end of file) '''
+		return self._eof and '\n' not in self._buffer[self._pos:].strip()
+
+	def decode(self):
+		''' decodes the next JSON value '''
+		while True:
+			try:
+				value, end = self._decoder.raw_decode(self._buffer, self._pos)
+				# a number at the end of the buffer might be incomplete
+				if end < len(self._buffer) or self._eof:
+					self._pos = end
+					return value
+			except ValueError:
+				if self._eof:
+					raise
+			self._fill()
+
+def iterRecords(file_name):
+	''' yields the recorded objects ({"time", "position", "rotation", "scale"}) of a path file one by one '''
+	if not file_name.endswith(".txt"):
+		file_name += ".txt"
+
+	with open(file_name) as data_file:
+		reader = _JsonStreamReader(data_file)
+
+		while reader.skipSeparators() is not None:
+			if not reader.matchPathStart():
+				# line delimited record (or path object without leading "path" key)
+				try:
+					obj = reader.decode()
+				except ValueError:
+					# incomplete last record, e.g. if writing was interrupted
+					if reader.isLastLine():
+						return
+					raise
+				if "path" in obj:
+					for record in obj["path"]:
+						yield record
+				else:
+					yield obj
+				continue
+
+			# records of a path object
+			while reader.skipSeparators() != ']':
+				yield reader.decode()
+			reader.consume()
+
+			# skip any other members until the end of the path object
+			while reader.skipSeparators() != '}':
+				reader.decode()
+				reader.skipSeparators()
+				reader.consume()
+				reader.skipSeparators()
+				reader.decode()
+			reader.consume()
+
+def _isBinary(file_name):
+	import path_store
+	return file_name.endswith(path_store.BINARY_EXTENSION)
+
+def _openBinary(file_name):
+	import path_store
+	return path_store.openBinary(file_name)
+
+def _emptyArrays(n):
+	return {
+		"time" : np.empty(n),
+		"position" : np.zeros((n, 3)),
+		"rotation" : np.zeros((n, 3)),
+		"scale" : np.ones((n, 3))
+	}
+
+def recordsToArrays(records):
+	''' converts a list of recorded objects ({"time", "position", "rotation", "scale"})
+	into a map of arrays:
+	{
+		"time" : (n,),
+		"position" : (n, 3),
+		"rotation" : (n, 3),
+		"scale" : (n, 3)
+	}
+	Records without time stamp are skipped (same as AnimationPathLoader).
+	Missing or malformed components are filled with the control point defaults. '''
+	records = [r for r in records if "time" in r]
+	arrays = _emptyArrays(len(records))
+
+	for i, record in enumerate(records):
+		arrays["time"][i] = record["time"]
+		for key in ("position", "rotation", "scale"):
+			if key in record and len(record[key]) == 3:
+				arrays[key][i] = record[key]
+
+	return arrays
+
+def iterChunks(file_name, chunk_size = CHUNK_SIZE):
+	''' yields the records of a path file as maps of arrays (see recordsToArrays)
+	holding at most chunk_size records each. '''
+	if _isBinary(file_name):
+		arrays = _openBinary(file_name)
+		for start in range(0, len(arrays["time"]), chunk_size):
+			yield dict((key, arrays[key][start:start+chunk_size]) for key in arrays)
+		return
+
+	chunk = []
+	for record in iterRecords(file_name):
+		if "time" not in record:
+			continue
+		chunk.append(record)
+		if len(chunk) == chunk_size:
+			yield recordsToArrays(chunk)
+			chunk = []
+	if len(chunk) > 0:
+		yield recordsToArrays(chunk)
+
+def concatenateArrays(chunks):
+	''' joins maps of arrays (see recordsToArrays) into one '''
+	chunks = list(chunks)
+	if len(chunks) == 0:
+		return _emptyArrays(0)
+	return dict((key, np.concatenate([chunk[key] for chunk in chunks])) for key in chunks[0])
+
+def loadPathArrays(file_name):
+	''' loads a path file written by AnimationPathRecorder into a map of arrays (see recordsToArrays). '''
+	if _isBinary(file_name):
+		return _openBinary(file_name)
+	return concatenateArrays(iterChunks(file_name))
+
+def convertToLines(file_name, out_file_name):
+	''' converts a path file into the line delimited variant (one record per line).
+	Records are streamed, so files of any length can be converted. '''
+	if not out_file_name.endswith(".txt"):
+		out_file_name += ".txt"
+
+	with open(out_file_name, 'w') as out_file:
+		for record in iterRecords(file_name):
+			out_file.write(json.dumps(record) + "\n")
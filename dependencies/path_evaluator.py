@@ -0,0 +1,180 @@
+﻿''' Evaluates recorded animation paths in process, without the Vizard animation path object.
+
+Play time follows AnimationPathPlayer: the path runs from time 0 to its duration (last control point time),
+times before the first control point show the first pose. At the ends playback either stops, loops to the
+other end or swings back (see stepTime). Random access uses binary search over the sorted control point times,
+PathCursor walks monotone playback in amortized constant time per query, and PathEvaluator.evaluate
+computes whole time arrays at once (see path_resample.PathSampler). '''
+
+import bisect
+import math
+import numpy as np
+
+from path_resample import PathSampler
+
+# loop modes, counterparts of viz.OFF, viz.LOOP and viz.SWING
+STOP = 0
+LOOP = 1
+SWING = 2
+
+def stepTime(time, direction, step, duration, loop_mode = STOP):
+	''' advances play time by step (seconds, already scaled by the playback speed) in direction (1 or -1).
+	Returns the new time and direction. Time is None if playback stopped at an end of the path. '''
+	next_time = time + direction * step
+	if next_time > duration:
+		if loop_mode == LOOP:
+			return 0.0, direction
+		elif loop_mode == SWING:
+			return time - step, -1
+		return None, direction
+	elif next_time < 0.0:
+		if loop_mode == LOOP:
+			return duration, direction
+		elif loop_mode == SWING:
+			return time + step, 1
+		return None, direction
+	return next_time, direction
+
+def wrapTimes(times, duration, loop_mode = STOP):
+	''' maps play times (seconds since the start of playback, any range) to path times in [0, duration]:
+	clamped for STOP, repeated for LOOP and reflected at both ends for SWING. '''
+	times = np.asarray(times, dtype = np.float64)
+	if duration <= 0.0:
+		return np.zeros(times.shape)
+	if loop_mode == LOOP:
+		return np.mod(times, duration)
+	if loop_mode == SWING:
+		return duration - np.abs(np.mod(times, 2.0 * duration) - duration)
+	return np.clip(times, 0.0, duration)
+
+class PathEvaluator(PathSampler):
+	''' Evaluates a path given as map of arrays (see path_arrays.recordsToArrays) at arbitrary play times. '''
+
+	def __init__(self, arrays, loop_mode = STOP):
+		PathSampler.__init__(self, arrays)
+		self._loop_mode = loop_mode
+
+		# plain lists for the bisect based single time queries
+		self._time_list = self._time.tolist()
+
+	def setLoopMode(self, loop_mode):
+		self._loop_mode = loop_mode
+
+	def getLoopMode(self):
+		return self._loop_mode
+
+	def getDuration(self):
+		''' returns the play time of the last control point '''
+		if len(self._time_list) == 0:
+			return 0.0
+		return max(self._time_list[-1], 0.0)
+
+	def segmentAt(self, time):
+		''' returns the index i of the control point segment [i, i + 1] containing time (binary search) '''
+		return min(max(bisect.bisect_right(self._time_list, time) - 1, 0), max(len(self._time_list) - 2, 0))
+
+	def evaluate(self, times):
+		''' returns the poses (see PathSampler.sample) at play times, wrapped by the loop mode (see wrapTimes).
+		The "time" array holds the wrapped path times. '''
+		return self.sample(wrapTimes(times, self.getDuration(), self._loop_mode))
+
+	def cursor(self):
+		''' returns a PathCursor for incremental queries '''
+		return PathCursor(self)
+
+class PathCursor(object):
+	''' Evaluates single poses of a PathEvaluator in pure Python.
+	The segment of the previous query is kept, such that monotone play times (forward or backward)
+	only move a few segments per query. Larger jumps fall back to binary search. '''
+
+	# number of segments walked before switching to binary search
+	MAX_WALK = 8
+
+	def __init__(self, evaluator):
+		self._evaluator = evaluator
+		self._time = evaluator._time_list
+		self._position = evaluator._position.tolist()
+		self._scale = evaluator._scale.tolist()
+		self._quat = evaluator._quat.tolist()
+		self._segment = 0
+
+		if len(self._time) == 0:
+			raise ValueError("can't evaluate an empty path")
+
+	def getSegment(self):
+		return self._segment
+
+	def seek(self, time):
+		''' moves the cursor to the segment containing the path time and returns its index '''
+		times = self._time
+		last = len(times) - 2
+		if last < 0:
+			return 0
+
+		i = self._segment
+		walked = 0
+		while i < last and time >= times[i + 1]:
+			i += 1
+			walked += 1
+			if walked > self.MAX_WALK:
+				i = self._evaluator.segmentAt(time)
+				break
+		while i > 0 and time < times[i]:
+			i -= 1
+			walked += 1
+			if walked > self.MAX_WALK:
+				i = self._evaluator.segmentAt(time)
+				break
+		self._segment = i
+		return i
+
+	def evaluate(self, time):
+		''' returns position, quaternion [x, y, z, w], view direction and scale (tuples) at a play time,
+		wrapped by the loop mode of the evaluator '''
+		evaluator = self._evaluator
+		duration = evaluator.getDuration()
+		loop_mode = evaluator.getLoopMode()
+		if duration <= 0.0:
+			time = 0.0
+		elif loop_mode == LOOP:
+			time = time % duration
+		elif loop_mode == SWING:
+			time = duration - abs(time % (2.0 * duration) - duration)
+		else:
+			time = min(max(time, 0.0), duration)
+
+		i = self.seek(time)
+		j = min(i + 1, len(self._time) - 1)
+		span = self._time[j] - self._time[i]
+		u = 0.0
+		if span > 0.0:
+			u = min(max((time - self._time[i]) / span, 0.0), 1.0)
+
+		p0, p1 = self._position[i], self._position[j]
+		s0, s1 = self._scale[i], self._scale[j]
+		quat = _slerp(self._quat[i], self._quat[j], u)
+		x, y, z, w = quat
+		return {
+			"time" : time,
+			"position" : tuple(a + u * (b - a) for a, b in zip(p0, p1)),
+			"quaternion" : quat,
+			"direction" : (2.0 * (x*z + y*w), 2.0 * (y*z - x*w), 1.0 - 2.0 * (x*x + y*y)),
+			"scale" : tuple(a + u * (b - a) for a, b in zip(s0, s1))
+		}
+
+def _slerp(q0, q1, u):
+	''' scalar version of view_math.slerp for quaternions given as sequences '''
+	dot = q0[0]*q1[0] + q0[1]*q1[1] + q0[2]*q1[2] + q0[3]*q1[3]
+	if dot < 0.0:
+		q1 = [-c for c in q1]
+		dot = -dot
+	angle = math.acos(min(dot, 1.0))
+	sin_angle = math.sin(angle)
+	if sin_angle < 1e-6:
+		w0, w1 = 1.0 - u, u
+	else:
+		w0 = math.sin((1.0 - u) * angle) / sin_angle
+		w1 = math.sin(u * angle) / sin_angle
+	quat = [w0 * a + w1 * b for a, b in zip(q0, q1)]
+	norm = math.sqrt(sum(c * c for c in quat))
+	return tuple(c / norm for c in quat)
@@ -0,0 +1,89 @@
+﻿''' Resamples recorded animation paths at a fixed rate into contiguous arrays,
+as input for offline accumulation or analysis. Interpolation matches the animation path:
+linear for position and scale, slerp for rotation. '''
+
+import numpy as np
+
+from view_math import eulerToQuat, slerp, forwardFromQuat
+
+# default number of output samples per chunk (see iterResampled)
+CHUNK_SIZE = 65536
+
+def sampleTimes(arrays, rate, start = None, end = None):
+	''' returns the times of a fixed rate sampling (samples per second) of the path from start to end
+	(defaults: first and last recorded time) '''
+	time = np.asarray(arrays["time"], dtype = np.float64)
+	if len(time) == 0:
+		return np.zeros(0)
+	if start is None:
+		start = time.min()
+	if end is None:
+		end = time.max()
+	count = int(np.floor((end - start) * rate + 1e-9)) + 1
+	return start + np.arange(max(count, 0)) / float(rate)
+
+class PathSampler(object):
+	''' Evaluates a path given as map of arrays (see path_arrays.recordsToArrays) at arbitrary times.
+	Quaternions are computed once for all control points. Times outside the recording are clamped. '''
+
+	def __init__(self, arrays):
+		time = np.asarray(arrays["time"], dtype = np.float64)
+		order = np.argsort(time, kind = 'mergesort')
+
+		self._time = time[order]
+		self._position = np.asarray(arrays["position"], dtype = np.float64)[order]
+		self._scale = np.asarray(arrays["scale"], dtype = np.float64)[order]
+		self._quat = eulerToQuat(np.asarray(arrays["rotation"])[order])
+
+		# flip signs such that neighbouring quaternions lie in the same hemisphere
+		if len(self._quat) > 1:
+			flip = np.sum(self._quat[1:] * self._quat[:-1], axis = 1) < 0.0
+			sign = np.cumprod(np.r_[1.0, np.where(flip, -1.0, 1.0)])
+			self._quat *= sign[:,None]
+
+	def __len__(self):
+		return len(self._time)
+
+	def sample(self, times):
+		''' returns map of arrays for the given times:
+		{
+			"time" : (n,),
+			"position" : (n, 3),
+			"quaternion" : (n, 4),
+			"direction" : (n, 3),
+			"scale" : (n, 3)
+		} '''
+		times = np.asarray(times, dtype = np.float64)
+		n = len(self._time)
+		if n == 0:
+			raise ValueError("can't sample an empty path")
+
+		if n == 1:
+			i = np.zeros(len(times), dtype = np.int64)
+			j = i
+			u = np.zeros(len(times))
+		else:
+			i = np.clip(np.searchsorted(self._time, times, side = 'right') - 1, 0, n - 2)
+			j = i + 1
+			duration = self._time[j] - self._time[i]
+			u = np.clip((times - self._time[i]) / np.where(duration > 0.0, duration, 1.0), 0.0, 1.0)
+
+		quat = slerp(self._quat[i], self._quat[j], u)
+		return {
+			"time" : times,
+			"position" : self._position[i] + u[:,None] * (self._position[j] - self._position[i]),
+			"quaternion" : quat,
+			"direction" : forwardFromQuat(quat),
+			"scale" : self._scale[i] + u[:,None] * (self._scale[j] - self._scale[i])
+		}
+
+def resamplePath(arrays, rate, start = None, end = None):
+	''' returns the path sampled at a fixed rate (samples per second), see PathSampler.sample '''
+	return PathSampler(arrays).sample(sampleTimes(arrays, rate, start, end))
+
+def iterResampled(arrays, rate, start = None, end = None, chunk_size = CHUNK_SIZE):
+	''' yields the fixed rate sampling of the path in chunks of at most chunk_size samples '''
+	sampler = PathSampler(arrays)
+	times = sampleTimes(arrays, rate, start, end)
+	for offset in range(0, len(times), chunk_size):
+		yield sampler.sample(times[offset:offset+chunk_size])
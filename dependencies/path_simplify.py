@@ -0,0 +1,109 @@
+﻿''' Error bounded keyframe reduction for recorded animation paths.
+
+Control points are dropped as long as the path interpolated between the remaining ones
+(linear for position and scale, slerp for rotation) stays within the given tolerances
+at every dropped sample. Points are selected with the Ramer-Douglas-Peucker scheme:
+a segment is split at the sample with the largest error relative to its tolerance. '''
+
+import math
+import numpy as np
+
+from view_math import eulerToQuat, quatAngle, slerp
+from path_arrays import loadPathArrays
+import path_store
+
+# samples per independently simplified window (bounds the cost of the first splits)
+WINDOW_SIZE = 65536
+
+def simplifyIndices(arrays, position_tolerance = 0.01, angle_tolerance = 1.0, scale_tolerance = 0.001, window_size = WINDOW_SIZE):
+	''' returns the sorted indices of the control points to keep for a map of arrays (see path_arrays.recordsToArrays).
+	position_tolerance and scale_tolerance are absolute distances, angle_tolerance is given in degrees. '''
+	time = np.asarray(arrays["time"], dtype = np.float64)
+	n = len(time)
+	if n <= 2:
+		return np.arange(n)
+
+	position = np.asarray(arrays["position"], dtype = np.float64)
+	scale = np.asarray(arrays["scale"], dtype = np.float64)
+	quats = eulerToQuat(arrays["rotation"])
+
+	position_tolerance = max(position_tolerance, 1e-12)
+	scale_tolerance = max(scale_tolerance, 1e-12)
+	angle_tolerance = max(math.radians(angle_tolerance), 1e-12)
+
+	keep = np.zeros(n, dtype = bool)
+	keep[0] = True
+
+	stack = []
+	for start in range(0, n - 1, window_size):
+		end = min(start + window_size, n - 1)
+		keep[end] = True
+		stack.append((start, end))
+
+	while len(stack) > 0:
+		i, j = stack.pop()
+		if j - i < 2:
+			continue
+
+		k = np.arange(i + 1, j)
+		duration = time[j] - time[i]
+		if duration > 0.0:
+			u = (time[k] - time[i]) / duration
+		else:
+			u = np.zeros(len(k))
+
+		position_error = np.sqrt(np.sum((position[k] - (position[i] + u[:,None] * (position[j] - position[i])))**2, axis = 1))
+		scale_error = np.sqrt(np.sum((scale[k] - (scale[i] + u[:,None] * (scale[j] - scale[i])))**2, axis = 1))
+		angle_error = quatAngle(quats[k], slerp(quats[i][None], quats[j][None], u))
+
+		error = np.maximum(np.maximum(position_error / position_tolerance, angle_error / angle_tolerance), scale_error / scale_tolerance)
+		worst = int(np.argmax(error))
+		if error[worst] > 1.0:
+			split = i + 1 + worst
+			keep[split] = True
+			stack.append((i, split))
+			stack.append((split, j))
+
+	return np.flatnonzero(keep)
+
+def simplifyArrays(arrays, position_tolerance = 0.01, angle_tolerance = 1.0, scale_tolerance = 0.001):
+	''' returns the simplified map of arrays and the compression ratio (original / remaining control points) '''
+	indices = simplifyIndices(arrays, position_tolerance, angle_tolerance, scale_tolerance)
+	reduced = dict((key, np.asarray(arrays[key])[indices]) for key in arrays)
+	return reduced, compressionRatio(len(arrays["time"]), len(indices))
+
+def compressionRatio(original_count, reduced_count):
+	''' returns original_count / reduced_count (1.0 for empty paths) '''
+	if reduced_count == 0:
+		return 1.0
+	return original_count / float(reduced_count)
+
+def simplifyFile(file_name, out_file_name, position_tolerance = 0.01, angle_tolerance = 1.0, scale_tolerance = 0.001):
+	''' simplifies a path file and writes the result to out_file_name.
+	The output is a binary path file if out_file_name ends with path_store.BINARY_EXTENSION, otherwise a JSON txt file.
+	Returns the compression ratio. '''
+	reduced, ratio = simplifyArrays(loadPathArrays(file_name), position_tolerance, angle_tolerance, scale_tolerance)
+
+	if out_file_name.endswith(path_store.BINARY_EXTENSION):
+		path_store.writeBinary(out_file_name, reduced)
+	else:
+		path_store.writeJson(out_file_name, reduced)
+
+	return ratio
+
+if __name__ == '__main__':
+	import sys
+
+	if len(sys.argv) < 3:
+		print "usage: path_simplify.py <recording> <output> [position_tolerance] [angle_tolerance]"
+		sys.exit(1)
+
+	position_tolerance = 0.01
+	angle_tolerance = 1.0
+	if len(sys.argv) > 3:
+		position_tolerance = float(sys.argv[3])
+	if len(sys.argv) > 4:
+		angle_tolerance = float(sys.argv[4])
+
+	ratio = simplifyFile(sys.argv[1], sys.argv[2], position_tolerance, angle_tolerance)
+	print "Path simplified, compression ratio %.2f" % ratio
@@ -0,0 +1,223 @@
+﻿''' Columnar (structure of arrays) storage for recorded animation paths and its binary file format.
+
+Binary layout (little endian), all columns stored one after another:
+	header   magic "VPATH\0", uint16 version, uint16 reserved, uint64 record count, 16 bytes reserved
+	time     float64 (n,)
+	position float32 (n, 3)
+	rotation float32 (n, 3)
+	scale    float32 (n, 3)
+Time is kept in double precision, since float32 can't resolve frame times of recordings longer than a few hours. '''
+
+import mmap
+import struct
+import numpy as np
+
+from path_arrays import iterChunks
+
+# file extension of binary path files
+BINARY_EXTENSION = ".path"
+
+# initial number of records allocated by PathColumns
+BLOCK_SIZE = 4096
+
+_MAGIC = b'VPATH\0'
+_VERSION = 1
+_HEADER = struct.Struct('<6sHHQ16x')
+
+# column name, dtype, components per record (in file order)
+COLUMNS = (
+	("time", np.float64, 1),
+	("position", np.float32, 3),
+	("rotation", np.float32, 3),
+	("scale", np.float32, 3)
+)
+
+# JSON text of a single record, float32 columns are written with float32 precision
+_RECORD_FORMAT = '{"time": %r, "position": [%.7g, %.7g, %.7g], "rotation": [%.7g, %.7g, %.7g], "scale": [%.7g, %.7g, %.7g]}'
+
+def _columnShape(count, components):
+	if components == 1:
+		return (count,)
+	return (count, components)
+
+class PathColumns(object):
+	''' Growable columns holding time, position, rotation (euler) and scale of recorded samples.
+	Storage grows in amortized blocks, appending a sample doesn't allocate Python objects. '''
+
+	def __init__(self, capacity = BLOCK_SIZE):
+		# number of valid records
+		self._count = 0
+
+		# column arrays (capacity rows each)
+		self._columns = {}
+		self._allocate(max(int(capacity), 1))
+
+	def _allocate(self, capacity):
+		''' resizes all columns to the given capacity, keeping valid records '''
+		columns = {}
+		for name, dtype, components in COLUMNS:
+			columns[name] = np.zeros(_columnShape(capacity, components), dtype = dtype)
+			if name in self._columns:
+				columns[name][:self._count] = self._columns[name][:self._count]
+		self._columns = columns
+
+	def _reserve(self, count):
+		capacity = len(self._columns["time"])
+		if count > capacity:
+			self._allocate(max(count, capacity + capacity // 2))
+
+	def __len__(self):
+		return self._count
+
+	def append(self, time, position, rotation, scale):
+		''' appends a single sample '''
+		self._reserve(self._count + 1)
+		i = self._count
+		self._columns["time"][i] = time
+		self._columns["position"][i] = position
+		self._columns["rotation"][i] = rotation
+		self._columns["scale"][i] = scale
+		self._count += 1
+
+	def extend(self, arrays):
+		''' appends all samples of a map of arrays (see path_arrays.recordsToArrays) '''
+		n = len(arrays["time"])
+		self._reserve(self._count + n)
+		for name, dtype, components in COLUMNS:
+			self._columns[name][self._count:self._count+n] = arrays[name]
+		self._count += n
+
+	def clear(self):
+		''' removes all samples (allocated storage is kept) '''
+		self._count = 0
+
+	def getTime(self, index):
+		''' returns the time of a valid record, negative indices count from the last one '''
+		return float(self._columns["time"][:self._count][index])
+
+	def getArrays(self):
+		''' returns map of column name to array view of the valid records '''
+		return dict((name, self._columns[name][:self._count]) for name, dtype, components in COLUMNS)
+
+	def iterRecords(self, start = 0):
+		''' yields samples starting at index start as objects ({"time", "position", "rotation", "scale"}) as written to JSON files '''
+		return iterRecords(self._slice(start, self._count))
+
+	def copyRange(self, start, end = None):
+		''' returns map of column name to a copy of the records in range [start, end) '''
+		if end is None:
+			end = self._count
+		return dict((name, array.copy()) for name, array in self._slice(start, end).items())
+
+	def _slice(self, start, end):
+		return dict((name, self._columns[name][start:end]) for name, dtype, components in COLUMNS)
+
+def _iterRows(arrays, chunk_size = BLOCK_SIZE):
+	''' yields rows [time, px, py, pz, yaw, pitch, roll, sx, sy, sz] of a map of arrays, converted chunk by chunk '''
+	for start in range(0, len(arrays["time"]), chunk_size):
+		end = start + chunk_size
+		rows = np.hstack([
+			np.asarray(arrays["time"][start:end], dtype = np.float64)[:,None],
+			arrays["position"][start:end],
+			arrays["rotation"][start:end],
+			arrays["scale"][start:end]
+		]).tolist()
+		for row in rows:
+			yield row
+
+def iterRecords(arrays):
+	''' yields the records of a map of arrays as objects ({"time", "position", "rotation", "scale"}) '''
+	for row in _iterRows(arrays):
+		yield {"time" : row[0], "position" : row[1:4], "rotation" : row[4:7], "scale" : row[7:10]}
+
+def iterJson(arrays):
+	''' yields the JSON text of each record of a map of arrays '''
+	for row in _iterRows(arrays):
+		yield _RECORD_FORMAT % tuple(row)
+
+def writeJson(file_name, arrays, append = False):
+	''' writes a map of arrays to a JSON serialized txt file ({"path" : [record, ...]}) as read by AnimationPathLoader.
+	Records are formatted one by one, without building the JSON object in memory. '''
+	if not file_name.endswith(".txt"):
+		file_name += ".txt"
+
+	with open(file_name, 'a' if append else 'w') as data_file:
+		data_file.write('{"path": [')
+		for i, record in enumerate(iterJson(arrays)):
+			if i > 0:
+				data_file.write(', ')
+			data_file.write(record)
+		data_file.write(']}')
+
+def writeBinary(file_name, arrays):
+	''' writes a map of arrays (PathColumns.getArrays or path_arrays.recordsToArrays) to a binary path file '''
+	if not file_name.endswith(BINARY_EXTENSION):
+		file_name += BINARY_EXTENSION
+
+	count = len(arrays["time"])
+	with open(file_name, 'wb') as data_file:
+		data_file.write(_HEADER.pack(_MAGIC, _VERSION, 0, count))
+		for name, dtype, components in COLUMNS:
+			data_file.write(np.ascontiguousarray(arrays[name], dtype = dtype).tobytes())
+
+def openBinary(file_name):
+	''' opens a binary path file via mmap.
+	Returns map of column name to read only array, backed directly by the file (no copy is made). '''
+	if not file_name.endswith(BINARY_EXTENSION):
+		file_name += BINARY_EXTENSION
+
+	with open(file_name, 'rb') as data_file:
+		if len(data_file.read(1)) == 0:
+			raise IOError("empty binary path file: " + file_name)
+		mapped = mmap.mmap(data_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+	magic, version, reserved, count = _HEADER.unpack_from(mapped, 0)
+	if magic != _MAGIC or version != _VERSION:
+		raise IOError("not a binary path file: " + file_name)
+
+	arrays = {}
+	offset = _HEADER.size
+	for name, dtype, components in COLUMNS:
+		arrays[name] = np.frombuffer(mapped, dtype = dtype, count = count * components, offset = offset).reshape(_columnShape(count, components))
+		offset += count * components * np.dtype(dtype).itemsize
+	return arrays
+
+def convertToBinary(file_name, out_file_name, chunk_size = BLOCK_SIZE):
+	''' converts a JSON path file (see path_arrays) into a binary path file.
+	Records are streamed twice (count, then copy), so memory usage is bounded by chunk_size. '''
+	if not out_file_name.endswith(BINARY_EXTENSION):
+		out_file_name += BINARY_EXTENSION
+
+	count = sum(len(chunk["time"]) for chunk in iterChunks(file_name, chunk_size))
+
+	with open(out_file_name, 'wb') as data_file:
+		data_file.write(_HEADER.pack(_MAGIC, _VERSION, 0, count))
+		data_file.truncate(_HEADER.size + count * sum(np.dtype(dtype).itemsize * components for name, dtype, components in COLUMNS))
+
+	if count == 0:
+		return
+
+	columns = {}
+	offset = _HEADER.size
+	for name, dtype, components in COLUMNS:
+		columns[name] = np.memmap(out_file_name, dtype = dtype, mode = 'r+', offset = offset, shape = _columnShape(count, components))
+		offset += count * components * np.dtype(dtype).itemsize
+
+	start = 0
+	for chunk in iterChunks(file_name, chunk_size):
+		end = start + len(chunk["time"])
+		for name in columns:
+			columns[name][start:end] = chunk[name]
+		start = end
+
+	for name in columns:
+		columns[name].flush()
+
+if __name__ == '__main__':
+	import sys
+
+	if len(sys.argv) < 3:
+		print "usage: path_store.py <recording.txt> <output" + BINARY_EXTENSION + ">"
+		sys.exit(1)
+
+	convertToBinary(sys.argv[1], sys.argv[2])
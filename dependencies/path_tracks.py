@@ -0,0 +1,104 @@
+﻿''' Storage of many recorded paths sharing the same frames (one track per node, see RecorderManager),
+which doesn't require a Vizard session.
+
+Tracks are kept as one block of shape (frames, tracks, 9) holding position, euler rotation and scale per node,
+next to a single time column. Tracks added during a recording start at a later frame, earlier rows hold NaN.
+
+Multi track file layout (little endian):
+	magic "MTRACK", uint16 version, uint32 header length
+	JSON header (frame count, track names, first frame of each track, component layout)
+	padding up to a multiple of 64 bytes
+	time     float64 (frames,)
+	values   float32 (frames, tracks, 9) '''
+
+import json
+import mmap
+import struct
+import numpy as np
+
+# file extension of multi track files
+TRACKS_EXTENSION = ".tracks"
+
+# offset of each column within the 9 values of a track
+COMPONENTS = (("position", 0), ("rotation", 3), ("scale", 6))
+TRACK_WIDTH = 9
+
+_MAGIC = b'MTRACK'
+_VERSION = 1
+_PREFIX = struct.Struct('<6sHI')
+_ALIGNMENT = 64
+
+def trackArrays(time, values, track, start_frame = 0):
+	''' returns the track of a block as map of arrays (see path_arrays.recordsToArrays).
+	The arrays are views into the block (no copy is made), starting at the first frame of the track. '''
+	arrays = {"time" : time[start_frame:]}
+	for name, offset in COMPONENTS:
+		arrays[name] = values[start_frame:, track, offset:offset+3]
+	return arrays
+
+def writeTracks(file_name, time, values, names, start_frames):
+	''' writes a block of tracks (time (n,) and values (n, k, 9)) to a multi track file.
+	Contiguous float32 blocks are written as they are, without intermediate copies. '''
+	if not file_name.endswith(TRACKS_EXTENSION):
+		file_name += TRACKS_EXTENSION
+
+	header = {
+		"frames" : len(time),
+		"names" : list(names),
+		"start_frames" : [int(frame) for frame in start_frames],
+		"components" : [name for name, offset in COMPONENTS]
+	}
+	header_data = json.dumps(header, sort_keys = True).encode('utf-8')
+	padding = -(_PREFIX.size + len(header_data)) % _ALIGNMENT
+
+	with open(file_name, 'wb') as data_file:
+		data_file.write(_PREFIX.pack(_MAGIC, _VERSION, len(header_data) + padding))
+		data_file.write(header_data + b' ' * padding)
+		np.ascontiguousarray(time, dtype = '<f8').tofile(data_file)
+		np.ascontiguousarray(values, dtype = '<f4').tofile(data_file)
+	return file_name
+
+class TrackFile(object):
+	''' Read only, memory mapped access to a multi track file. '''
+
+	def __init__(self, file_name):
+		if not file_name.endswith(TRACKS_EXTENSION):
+			file_name += TRACKS_EXTENSION
+		self._file_name = file_name
+
+		with open(file_name, 'rb') as data_file:
+			magic, version, header_size = _PREFIX.unpack(data_file.read(_PREFIX.size))
+			if magic != _MAGIC or version != _VERSION:
+				raise IOError("not a multi track file: " + file_name)
+			self._header = json.loads(data_file.read(header_size).decode('utf-8'))
+			self._mapped = mmap.mmap(data_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+		frames = self._header["frames"]
+		tracks = len(self._header["names"])
+		offset = _PREFIX.size + header_size
+		self._time = np.frombuffer(self._mapped, dtype = '<f8', count = frames, offset = offset)
+		offset += frames * 8
+		self._values = np.frombuffer(self._mapped, dtype = '<f4', count = frames * tracks * TRACK_WIDTH,
+			offset = offset).reshape(frames, tracks, TRACK_WIDTH)
+
+	def getNames(self):
+		return [str(name) for name in self._header["names"]]
+
+	def getTrackCount(self):
+		return len(self._header["names"])
+
+	def getFrameCount(self):
+		return self._header["frames"]
+
+	def getTime(self):
+		return self._time
+
+	def getValues(self):
+		''' returns the block of all tracks (frames, tracks, 9) '''
+		return self._values
+
+	def getTrack(self, track):
+		''' returns a track (index or name) as map of arrays (see trackArrays) '''
+		if not isinstance(track, int):
+			track = self.getNames().index(track)
+		return trackArrays(self._time, self._values, track, self._header["start_frames"][track])
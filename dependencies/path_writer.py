@@ -0,0 +1,144 @@
+﻿import os
+import re
+import threading
+import Queue
+
+from path_store import iterJson
+
+# start of a path object as written by AnimationPathRecorder.writeToFile, and the end of a complete one
+# (records hold lists as well, so a record ends with ']}' too)
+_PATH_START = re.compile(br'\s*\{\s*"path"\s*:\s*\[')
+_PATH_END = re.compile(br'[\[}]\s*\]\s*\}$')
+
+def _rfind(data_file, char, start, end):
+	''' returns the position of the last occurrence of char (one byte) between start and end of a file or -1 '''
+	pos = end
+	while pos > start:
+		block = max(start, pos - 4096)
+		data_file.seek(block)
+		index = data_file.read(pos - block).rfind(char)
+		if index >= 0:
+			return block + index
+		pos = block
+	return -1
+
+def _repairTail(file_name):
+	''' prepares an existing path file for appending records line by line.
+	A complete last value (record or path object) is terminated by a newline,
+	an incomplete last record (left by an interrupted write) is removed.
+	A path object interrupted within its records keeps the complete ones and is closed. '''
+	with open(file_name, 'rb+') as data_file:
+		data_file.seek(0, os.SEEK_END)
+		end = data_file.tell()
+
+		# find the end of the last non whitespace character and the start of its line
+		pos = end
+		last = None
+		while pos > 0 and last is None:
+			start = max(0, pos - 4096)
+			data_file.seek(start)
+			data = data_file.read(pos - start).rstrip()
+			if len(data) > 0:
+				last = start + len(data)
+			pos = start
+
+		if last is None:
+			return
+		line_start = _rfind(data_file, b'\n', 0, last) + 1
+
+		data_file.seek(line_start)
+		path_start = _PATH_START.match(data_file.read(64))
+		data_file.seek(max(line_start, last - 64))
+		tail = data_file.read(last - max(line_start, last - 64))
+
+		if path_start is not None and _PATH_END.search(tail) is None:
+			# records don't contain nested objects, so the last '}' ends the last complete record
+			record_end = _rfind(data_file, b'}', line_start + path_start.end(), last)
+			if record_end < 0:
+				data_file.truncate(line_start)
+			else:
+				data_file.truncate(record_end + 1)
+				data_file.seek(record_end + 1)
+				data_file.write(b']}\n')
+		elif tail.endswith(b'}'):
+			# only a complete value ends with '}'
+			data_file.seek(end - 1)
+			if data_file.read(1) != b'\n':
+				data_file.seek(end)
+				data_file.write(b'\n')
+		else:
+			data_file.truncate(line_start)
+
+class PathStreamWriter(object):
+	''' Writes blocks of recorded samples to a line delimited path file (one JSON record per line)
+	from a background thread, such that the caller never waits for serialization or disk access.
+	Each block is flushed and synced to disk once written, so an interruption loses at most the block in flight.
+	Appending to an existing file keeps it readable by AnimationPathLoader, since records are just added as new lines. '''
+
+	def __init__(self, file_name, append = False):
+		if not file_name.endswith(".txt"):
+			file_name += ".txt"
+
+		self._file_name = file_name
+
+		# blocks waiting to be written (None signals the end of the stream)
+		self._queue = Queue.Queue()
+
+		# number of records written to disk so far
+		self._written = 0
+
+		# first error raised by the writer thread
+		self._error = None
+
+		if append and os.path.exists(self._file_name):
+			_repairTail(self._file_name)
+
+		self._file = open(self._file_name, 'a' if append else 'w')
+
+		self._thread = threading.Thread(target = self._run, name = "PathStreamWriter")
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _run(self):
+		''' writer thread main loop '''
+		while True:
+			block = self._queue.get()
+			if block is None:
+				break
+			if self._error is not None:
+				continue
+			try:
+				self._file.write("".join(text + "\n" for text in iterJson(block)))
+				self._file.flush()
+				os.fsync(self._file.fileno())
+				self._written += len(block["time"])
+			except (IOError, OSError) as e:
+				self._error = e
+		self._file.close()
+
+	def getFileName(self):
+		return self._file_name
+
+	def getWrittenCount(self):
+		''' returns the number of records written to disk so far '''
+		return self._written
+
+	def getError(self):
+		''' returns the error which stopped the writer thread, or None '''
+		return self._error
+
+	def isOpen(self):
+		return self._thread.is_alive()
+
+	def write(self, block):
+		''' hands a block of samples (map of arrays, see path_store.PathColumns.copyRange) to the writer thread.
+		The block must not be modified afterwards. Returns immediately. '''
+		if len(block["time"]) > 0:
+			self._queue.put(block)
+
+	def close(self, wait = False):
+		''' ends the stream once all pending blocks are written.
+		If wait is True, blocks until the file is closed. '''
+		self._queue.put(None)
+		if wait:
+			self._thread.join()
@@ -0,0 +1,269 @@
+﻿''' Lattice of offline view accumulation probes for participants walking through the scene.
+
+A single ViewAccumulatorCube is only correct near its center. A ProbeGrid places cube probes on a regular lattice,
+each path sample is assigned to the 8 probes around the eye with trilinear weights, and all probes are accumulated
+in one pass (the intensities of a direction are evaluated once and distributed to all probes, see accumulateFace).
+At display time the probes around a surface point are interpolated the same way (see sample and sampleMesh).
+
+Probe grid file layout (little endian):
+	magic "PGRID\0", uint16 version, uint32 header length
+	JSON header (origin, spacing, counts, resolution, dtype, face order, capture parameters)
+	padding up to a multiple of 64 bytes
+	probe data (probe count x 6 faces x resolution x resolution values) '''
+
+import json
+import mmap
+import struct
+import numpy as np
+
+from view_math import FACE_NAMES, forwardFromEuler, normalize
+from view_accumulator_offline import accumulateFace, frameIntensity, clamp
+from path_arrays import loadPathArrays
+from path_resample import iterResampled
+from cube_projection import cubeSampleTable, applyTable
+
+# file extension of probe grid files
+GRID_EXTENSION = ".pgrid"
+
+# number of path samples distributed to the probes at once
+SAMPLE_CHUNK = 4096
+
+_MAGIC = b'PGRID\0'
+_VERSION = 1
+_PREFIX = struct.Struct('<6sHI')
+_ALIGNMENT = 64
+
+class ProbeGrid(object):
+	''' Regular lattice of counts = (nx, ny, nz) cube probes starting at origin, spacing scene units apart.
+	Probe index of lattice point (i, j, k) is (i * ny + j) * nz + k.
+	frame_weight and aperture_scale have the same meaning as for ViewAccumulatorCube. '''
+
+	def __init__(self, origin, spacing, counts, frame_weight = 0.5, aperture_scale = 0.5, resolution = 128):
+		self._origin = np.asarray(origin, dtype = np.float64)
+		self._spacing = np.broadcast_to(np.asarray(spacing, dtype = np.float64), (3,)).copy()
+		self._counts = np.asarray(counts, dtype = np.int64)
+		self._frame_weight = clamp(frame_weight, 0.0, 1.0)
+		self._aperture_scale = clamp(aperture_scale, 0.0, 1.0)
+		self._resolution = resolution
+
+		# accumulated intensities per face, shape (res, res, probe count)
+		self._faces = {}
+
+		# summed trilinear weights of all samples per probe
+		self._probe_weights = None
+
+		self.clear()
+
+	@classmethod
+	def fromPositions(cls, positions, spacing, **kwargs):
+		''' returns a grid covering all given positions (e.g. the recorded path positions) '''
+		positions = np.asarray(positions, dtype = np.float64)
+		origin = positions.min(axis = 0)
+		extent = positions.max(axis = 0) - origin
+		counts = np.floor(extent / spacing + 1e-9).astype(np.int64) + 1
+		counts[extent > 0.0] = np.maximum(counts[extent > 0.0], 2)
+		return cls(origin, spacing, counts, **kwargs)
+
+	def clear(self):
+		''' resets all accumulated intensities '''
+		count = self.getProbeCount()
+		self._faces = dict((face, np.zeros((self._resolution, self._resolution, count), dtype = np.float32)) for face in FACE_NAMES)
+		self._probe_weights = np.zeros(count)
+
+	def getProbeCount(self):
+		return int(np.prod(self._counts))
+
+	def getCounts(self):
+		return tuple(int(c) for c in self._counts)
+
+	def getOrigin(self):
+		return self._origin.copy()
+
+	def getSpacing(self):
+		return self._spacing.copy()
+
+	def getResolution(self):
+		return self._resolution
+
+	def getProbePositions(self):
+		''' returns the positions of all probes (shape (probe count, 3)) '''
+		i, j, k = np.meshgrid(*[np.arange(c) for c in self._counts], indexing = 'ij')
+		lattice = np.stack([i.ravel(), j.ravel(), k.ravel()], axis = -1)
+		return self._origin + lattice * self._spacing
+
+	def getProbeWeights(self):
+		''' returns the summed sample weight (frames) accumulated by each probe '''
+		return self._probe_weights.copy()
+
+	def getProbeFaces(self, probe):
+		''' returns map of face name to float32 intensity array of a single probe '''
+		return dict((face, np.ascontiguousarray(self._faces[face][..., probe])) for face in FACE_NAMES)
+
+	def trilinearWeights(self, positions):
+		''' returns the indices and trilinear weights (shape (n, 8) each) of the probes around each position.
+		Positions outside the grid are clamped to its border. '''
+		positions = np.asarray(positions, dtype = np.float64).reshape(-1, 3)
+		cell = (positions - self._origin) / self._spacing
+		last = np.maximum(self._counts - 1, 0)
+		cell = np.clip(cell, 0.0, last)
+		base = np.minimum(np.floor(cell).astype(np.int64), np.maximum(last - 1, 0))
+		frac = cell - base
+
+		indices = np.empty((len(positions), 8), dtype = np.int64)
+		weights = np.empty((len(positions), 8))
+		for corner in range(8):
+			step = np.array([(corner >> 2) & 1, (corner >> 1) & 1, corner & 1])
+			lattice = np.minimum(base + step, last)
+			indices[:,corner] = (lattice[:,0] * self._counts[1] + lattice[:,1]) * self._counts[2] + lattice[:,2]
+			weights[:,corner] = np.prod(np.where(step == 1, frac, 1.0 - frac), axis = 1)
+		return indices, weights
+
+	def accumulateSamples(self, positions, directions):
+		''' accumulates view samples (eye positions and view directions, shape (n, 3) each) into the probes around each eye '''
+		directions = normalize(np.asarray(directions, dtype = np.float64).reshape(-1, 3))
+		count = self.getProbeCount()
+
+		for start in range(0, len(directions), SAMPLE_CHUNK):
+			indices, weights = self.trilinearWeights(positions[start:start+SAMPLE_CHUNK])
+
+			# identical directions (e.g. standing still) only need to be evaluated once
+			chunk, inverse = np.unique(directions[start:start+SAMPLE_CHUNK], axis = 0, return_inverse = True)
+			inverse = inverse.ravel()
+			probe_weights = np.zeros((len(chunk), count))
+			np.add.at(probe_weights, (np.repeat(inverse, 8), indices.ravel()), weights.ravel())
+			self._probe_weights += probe_weights.sum(axis = 0)
+
+			# only probes receiving any sample of this chunk are accumulated
+			used = np.flatnonzero(probe_weights.sum(axis = 0) > 0.0)
+			probe_weights = probe_weights[:,used] * frameIntensity(self._frame_weight)
+			for face in FACE_NAMES:
+				output = np.zeros((self._resolution, self._resolution, len(used)), dtype = np.float32)
+				accumulateFace(output, face, chunk, probe_weights, self._aperture_scale)
+				self._faces[face][..., used] += output
+
+	def accumulatePath(self, path, rate = None):
+		''' accumulates a path given as map of arrays (see path_arrays.recordsToArrays).
+		If rate is None, each recorded sample counts as one frame,
+		otherwise the path is resampled with the given number of frames per second (see path_resample). '''
+		if rate is None:
+			self.accumulateSamples(np.asarray(path["position"], dtype = np.float64), forwardFromEuler(path["rotation"]))
+			return
+
+		for chunk in iterResampled(path, rate):
+			self.accumulateSamples(chunk["position"], chunk["direction"])
+
+	def accumulateFile(self, file_name, rate = None):
+		''' accumulates an animation path file written by AnimationPathRecorder (see accumulatePath) '''
+		self.accumulatePath(loadPathArrays(file_name), rate)
+
+	def sample(self, points):
+		''' returns the intensity seen at surface points (shape (n, 3)):
+		each of the 8 probes around a point is sampled (bilinear) in the direction from the probe to the point,
+		and the results are blended with trilinear weights.
+		A point exactly at a probe has no direction from it, that probe contributes its mean intensity. '''
+		points = np.asarray(points, dtype = np.float64).reshape(-1, 3)
+		indices, weights = self.trilinearWeights(points)
+		probe_positions = self.getProbePositions()
+
+		# probe data as (probe, face, row, column), matching the stacked face layout of cube_projection
+		face_size = self._resolution * self._resolution
+		stacked = np.stack([self._faces[face] for face in FACE_NAMES])
+		source = np.ascontiguousarray(np.transpose(stacked, (3, 0, 1, 2))).ravel()
+
+		result = np.zeros(len(points))
+		for corner in range(8):
+			directions = points - probe_positions[indices[:,corner]]
+			at_probe = ~np.any(directions, axis = 1)
+			directions[at_probe] = (0.0, 0.0, 1.0)
+			table = cubeSampleTable(directions, self._resolution, indices[:,corner] * (len(FACE_NAMES) * face_size))
+			values = applyTable(source, table)
+			if np.any(at_probe):
+				values[at_probe] = stacked[..., indices[at_probe,corner]].mean(axis = (0, 1, 2))
+			result += values * weights[:,corner]
+		return result.astype(np.float32)
+
+	def sampleMesh(self, mesh):
+		''' returns the intensity at each vertex of a mesh (see mesh_io) '''
+		return self.sample(mesh["vertices"])
+
+	def getMetadata(self):
+		''' returns lattice, sample weights and capture parameters as dict '''
+		return {
+			"origin" : self._origin.tolist(),
+			"spacing" : self._spacing.tolist(),
+			"counts" : [int(c) for c in self._counts],
+			"probe_weights" : self._probe_weights.tolist(),
+			"frame_weight" : self._frame_weight,
+			"aperture_scale" : self._aperture_scale,
+			"resolution" : self._resolution
+		}
+
+	def save(self, file_name = "probes", dtype = np.float32):
+		''' writes all probes to a probe grid file (see module description) '''
+		if not file_name.endswith(GRID_EXTENSION):
+			file_name += GRID_EXTENSION
+
+		dtype = np.dtype(dtype)
+		header = self.getMetadata()
+		header.update({"dtype" : dtype.name, "faces" : list(FACE_NAMES)})
+		header_data = json.dumps(header, sort_keys = True).encode('utf-8')
+		padding = -(_PREFIX.size + len(header_data)) % _ALIGNMENT
+
+		with open(file_name, 'wb') as data_file:
+			data_file.write(_PREFIX.pack(_MAGIC, _VERSION, len(header_data) + padding))
+			data_file.write(header_data + b' ' * padding)
+			for probe in range(self.getProbeCount()):
+				for face in FACE_NAMES:
+					data_file.write(np.ascontiguousarray(self._faces[face][..., probe], dtype = dtype.newbyteorder('<')).tobytes())
+
+def loadGrid(file_name):
+	''' loads a probe grid file written by ProbeGrid.save '''
+	if not file_name.endswith(GRID_EXTENSION):
+		file_name += GRID_EXTENSION
+
+	with open(file_name, 'rb') as data_file:
+		magic, version, header_size = _PREFIX.unpack(data_file.read(_PREFIX.size))
+		if magic != _MAGIC or version != _VERSION:
+			raise IOError("not a probe grid file: " + file_name)
+		header = json.loads(data_file.read(header_size).decode('utf-8'))
+		mapped = mmap.mmap(data_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+	grid = ProbeGrid(header["origin"], header["spacing"], header["counts"],
+		header["frame_weight"], header["aperture_scale"], header["resolution"])
+
+	resolution = header["resolution"]
+	dtype = np.dtype(str(header["dtype"])).newbyteorder('<')
+	count = grid.getProbeCount() * len(header["faces"]) * resolution * resolution
+	data = np.frombuffer(mapped, dtype = dtype, count = count, offset = _PREFIX.size + header_size)
+	data = data.reshape(grid.getProbeCount(), len(header["faces"]), resolution, resolution)
+
+	for index, face in enumerate(header["faces"]):
+		grid._faces[str(face)] = np.ascontiguousarray(np.transpose(data[:, index], (1, 2, 0)), dtype = np.float32)
+	grid._probe_weights = np.asarray(header["probe_weights"], dtype = np.float64)
+	return grid
+
+if __name__ == '__main__':
+	import sys
+
+	if len(sys.argv) < 2:
+		print "usage: probe_grid.py <recording> [spacing] [mesh .obj/.ply]"
+		sys.exit(1)
+
+	spacing = 2.0
+	if len(sys.argv) > 2:
+		spacing = float(sys.argv[2])
+
+	path = loadPathArrays(sys.argv[1])
+	grid = ProbeGrid.fromPositions(path["position"], spacing)
+	grid.accumulatePath(path)
+	grid.save("probes")
+	print "Accumulated %d probes into probes%s" % (grid.getProbeCount(), GRID_EXTENSION)
+
+	if len(sys.argv) > 3:
+		from mesh_io import loadMesh, writePly
+		from surface_bake import intensityColors
+
+		mesh = loadMesh(sys.argv[3])
+		values = grid.sampleMesh(mesh)
+		writePly("probes_baked.ply", mesh, values, intensityColors(values))
+		print "Interpolated probe intensities saved to probes_baked.ply"
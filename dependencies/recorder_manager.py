@@ -0,0 +1,170 @@
+﻿import viz
+import numpy as np
+
+import path_store
+import update_profiler
+from path_tracks import TRACK_WIDTH, trackArrays, writeTracks
+
+# initial number of frames allocated
+BLOCK_SIZE = 4096
+
+class RecorderManager(object):
+	"""records position, rotation and scale of any number of nodes.
+	All nodes are captured by a single update callback into one preallocated block (see path_tracks),
+	instead of one AnimationPathRecorder (and callback) per node.
+	Nodes may be added while recording, their track starts at the current frame."""
+
+	def __init__(self, nodes = [], start = True, capacity = BLOCK_SIZE):
+		# captured nodes and their track names
+		self._nodes = []
+		self._names = []
+
+		# first frame of each track
+		self._start_frames = []
+
+		# frame times (capacity,) and transforms (capacity, nodes, 9)
+		self._time = np.zeros(max(int(capacity), 1))
+		self._values = np.zeros((len(self._time), 0, TRACK_WIDTH), dtype = np.float32)
+
+		# number of valid frames
+		self._count = 0
+
+		# flag that states if capture is currently stopped
+		self._stop = not start
+
+		for node in nodes:
+			self.addNode(node)
+
+		# reference to event function called each frame
+		self._on_update = update_profiler.onupdate(0, self._onUpdate)
+
+	def _onUpdate(self):
+		"""captures the transforms of all nodes"""
+		if self._stop or len(self._nodes) == 0:
+			return
+
+		self._reserve(self._count + 1)
+		self._time[self._count] = viz.getFrameTime()
+		self._values[self._count] = [node.getPosition() + node.getEuler() + node.getScale() for node in self._nodes]
+		self._count += 1
+
+	def _reserve(self, count):
+		"""grows the frame capacity of the block in amortized steps"""
+		capacity = len(self._time)
+		if count <= capacity:
+			return
+		capacity = max(count, capacity + capacity // 2)
+		time = np.zeros(capacity)
+		time[:self._count] = self._time[:self._count]
+		values = np.zeros((capacity,) + self._values.shape[1:], dtype = np.float32)
+		values[:self._count] = self._values[:self._count]
+		self._time = time
+		self._values = values
+
+	def addNode(self, node, name = None):
+		"""adds a node to capture, returns the index of its track.
+		name is used for its file (default: track<index>)."""
+		if name == None:
+			name = "track%d" % len(self._nodes)
+
+		# the block keeps exactly one column per node, such that written frames are contiguous
+		values = np.zeros((len(self._time), len(self._nodes) + 1, TRACK_WIDTH), dtype = np.float32)
+		values[:, :-1] = self._values
+		values[:self._count, -1] = np.nan
+		self._values = values
+
+		self._nodes.append(node)
+		self._names.append(name)
+		self._start_frames.append(self._count)
+		return len(self._nodes) - 1
+
+	def getNodeCount(self):
+		return len(self._nodes)
+
+	def getNames(self):
+		return list(self._names)
+
+	def getFrameCount(self):
+		return self._count
+
+	def start(self):
+		"""starts the recording"""
+		self._stop = False
+
+	def stop(self):
+		"""stops the recording"""
+		self._stop = True
+
+	def isRunning(self):
+		"""returns if the recording is currently running"""
+		return not self._stop
+
+	def clear(self):
+		"""clears all recorded frames, nodes are kept and their tracks start at the next frame"""
+		self._count = 0
+		self._start_frames = [0] * len(self._nodes)
+
+	def getBlock(self):
+		"""returns frame times (n,) and transforms (n, nodes, 9) of the recorded frames (views, no copy)"""
+		return self._time[:self._count], self._values[:self._count]
+
+	def getTrackArrays(self, track):
+		"""returns map of column name to arrays (views) of a single node (see path_tracks.trackArrays)"""
+		time, values = self.getBlock()
+		return trackArrays(time, values, track, self._start_frames[track])
+
+	def writeToFile(self, name):
+		"""writes all tracks into a single multi track file (see path_tracks), returns the file name"""
+		time, values = self.getBlock()
+		return writeTracks(name, time, values, self._names, self._start_frames)
+
+	def writeTrackFiles(self, prefix, binary = True):
+		"""writes one path file per node, named <prefix>_<track name>,
+		as binary path file (see path_store) or JSON txt file as read by AnimationPathLoader.
+		Returns the list of file names."""
+		files = []
+		for track, name in enumerate(self._names):
+			file_name = prefix + "_" + name
+			if binary:
+				path_store.writeBinary(file_name, self.getTrackArrays(track))
+				files.append(file_name + path_store.BINARY_EXTENSION)
+			else:
+				path_store.writeJson(file_name, self.getTrackArrays(track))
+				files.append(file_name + ".txt")
+		return files
+
+	def remove(self):
+		"""stops capturing and removes the update callback"""
+		self._stop = True
+		self._on_update.remove()
+
+if __name__ == '__main__':
+	import vizact
+	import vizcam
+
+	viz.setMultiSample(4)
+
+	viz.go()
+
+	vizcam.WalkNavigate()
+
+	piazza = viz.addChild("piazza.osgb")
+
+	# a crowd of walking avatars, all captured by one update callback
+	recorder = RecorderManager(start = False)
+	for i in range(50):
+		avatar = viz.addAvatar('vcc_male.cfg', pos = [i % 10 - 5, 0, i // 10 * 2])
+		avatar.state(2)
+		avatar.addAction(vizact.spin(0, 1, 0, 30 + i))
+		recorder.addNode(avatar, "avatar%d" % i)
+	recorder.addNode(viz.MainView, "main_view")
+
+	def toggleRecord():
+		if recorder.isRunning():
+			recorder.stop()
+			print "Saved %d frames of %d nodes to %s" % (recorder.getFrameCount(), recorder.getNodeCount(), recorder.writeToFile("crowd"))
+		else:
+			recorder.start()
+			print "Recording started."
+
+	vizact.onkeydown('r', toggleRecord)
@@ -0,0 +1,231 @@
+﻿''' Content addressed on-disk cache of accumulation results (e.g. the accumulated_*.bmp files of saveAll).
+
+Results are keyed by a hash of the recording contents and all accumulation parameters (see resultKey),
+so identical requests are served from the cache, while any change to the recording or a parameter misses.
+Each entry is a directory <cache directory>/<key>/ holding the result files and entry.json (parameters, size).
+The modification time of entry.json marks the last use of an entry. Once the total size of all entries
+exceeds the budget, the least recently used entries are evicted. '''
+
+import os
+import json
+import time
+import shutil
+import hashlib
+
+from view_math import FACE_NAMES
+from cube_io import facePaths
+from cube_hdr import HDR_EXTENSION
+from cube_mip import levelPrefix, MIN_SIZE
+
+# default size budget of the cache directory (bytes)
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# name of the file describing an entry
+ENTRY_FILE = "entry.json"
+
+# number of bytes hashed per read
+READ_SIZE = 1 << 20
+
+# file hashes by (file name, size, modification time), such that unchanged recordings are hashed once
+_file_hashes = {}
+
+def hashFile(file_name):
+	''' returns the SHA-1 hex digest of the contents of a file '''
+	status = os.stat(file_name)
+	memo_key = (os.path.abspath(file_name), status.st_size, status.st_mtime)
+	if memo_key not in _file_hashes:
+		digest = hashlib.sha1()
+		with open(file_name, 'rb') as data_file:
+			for block in iter(lambda: data_file.read(READ_SIZE), b''):
+				digest.update(block)
+		_file_hashes[memo_key] = digest.hexdigest()
+	return _file_hashes[memo_key]
+
+def resultKey(recording, parameters):
+	''' returns the cache key of accumulating recording (file name) with parameters (dict of JSON values,
+	e.g. frame_weight, aperture_scale, resolution, position) '''
+	digest = hashlib.sha1(hashFile(recording).encode('ascii'))
+	digest.update(json.dumps(parameters, sort_keys = True).encode('utf-8'))
+	return digest.hexdigest()
+
+def accumulationFiles(prefix = "accumulated", directory = "", resolution = 1024, mip_min_size = MIN_SIZE, hdr = False):
+	''' returns the file names written by saveAll of an accumulator with the given resolution, including the mip pyramid
+	(see cube_mip), and by saveHDR if hdr is True. These are the files to store as result of an accumulation. '''
+	prefixes = [prefix]
+	size = resolution // 2
+	while mip_min_size != None and size >= max(mip_min_size, 1):
+		prefixes.append(levelPrefix(prefix, size))
+		size //= 2
+
+	files = []
+	for level_prefix in prefixes:
+		paths = facePaths(level_prefix, directory)
+		files += [paths[face] for face in FACE_NAMES]
+		if hdr:
+			files.append(os.path.join(directory, level_prefix + HDR_EXTENSION))
+	return files
+
+def _directorySize(directory):
+	return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+class ResultCache(object):
+	''' LRU cache of result files below directory, bounded by max_bytes. '''
+
+	def __init__(self, directory = "result_cache", max_bytes = DEFAULT_MAX_BYTES):
+		self._directory = directory
+		self._max_bytes = max_bytes
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+		# size of each entry (bytes)
+		self._sizes = {}
+		for key in os.listdir(directory):
+			if not key.endswith(".partial") and os.path.isfile(os.path.join(directory, key, ENTRY_FILE)):
+				self._sizes[key] = _directorySize(os.path.join(directory, key))
+
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
+		self._evicted_bytes = 0
+
+	def getDirectory(self):
+		return self._directory
+
+	def setMaxBytes(self, max_bytes):
+		''' sets the size budget and evicts entries exceeding it '''
+		self._max_bytes = max_bytes
+		self._evict()
+
+	def getMaxBytes(self):
+		return self._max_bytes
+
+	def getSize(self):
+		''' returns the total size of all entries (bytes) '''
+		return sum(self._sizes.values())
+
+	def _entryDirectory(self, key):
+		return os.path.join(self._directory, key)
+
+	def contains(self, key):
+		''' returns True if an entry exists for key (not counted as hit or miss, the entry isn't marked as used) '''
+		return key in self._sizes
+
+	def getMetadata(self, key):
+		''' returns the description of the entry of key (metadata given to store, see ENTRY_FILE) or None '''
+		if key not in self._sizes:
+			return None
+		try:
+			with open(os.path.join(self._entryDirectory(key), ENTRY_FILE)) as entry_file:
+				return json.load(entry_file)
+		except (IOError, OSError, ValueError):
+			return None
+
+	def lookup(self, key):
+		''' returns the file names of the entry of key (marking it as used) or None '''
+		if key not in self._sizes:
+			self._misses += 1
+			return None
+		self._hits += 1
+		entry = self._entryDirectory(key)
+		os.utime(os.path.join(entry, ENTRY_FILE), None)
+		return [os.path.join(entry, name) for name in sorted(os.listdir(entry)) if name != ENTRY_FILE]
+
+	def restore(self, key, directory = ""):
+		''' copies the files of the entry of key into directory.
+		Returns the file names restored or None, if there is no entry. '''
+		files = self.lookup(key)
+		if files == None:
+			return None
+		restored = []
+		for file_name in files:
+			target = os.path.join(directory, os.path.basename(file_name))
+			shutil.copyfile(file_name, target)
+			restored.append(target)
+		return restored
+
+	def store(self, key, files, metadata = None):
+		''' stores copies of files (flat, by base name) as entry of key, along with metadata (dict).
+		Least recently used entries are evicted afterwards to respect the size budget.
+		Returns the file names within the entry. '''
+		entry = self._entryDirectory(key)
+		partial = entry + ".partial"
+		if os.path.isdir(partial):
+			shutil.rmtree(partial)
+		os.makedirs(partial)
+
+		stored = []
+		for file_name in files:
+			target = os.path.join(partial, os.path.basename(file_name))
+			shutil.copyfile(file_name, target)
+			stored.append(os.path.join(entry, os.path.basename(file_name)))
+
+		description = dict(metadata or {})
+		description.update({"key" : key, "files" : [os.path.basename(file_name) for file_name in files], "created" : time.time()})
+		with open(os.path.join(partial, ENTRY_FILE), 'w') as entry_file:
+			json.dump(description, entry_file, indent = 1, sort_keys = True)
+
+		if os.path.isdir(entry):
+			shutil.rmtree(entry)
+		os.rename(partial, entry)
+		self._sizes[key] = _directorySize(entry)
+
+		self._evict(keep = key)
+		return stored
+
+	def _lastUse(self, key):
+		try:
+			return os.path.getmtime(os.path.join(self._entryDirectory(key), ENTRY_FILE))
+		except OSError:
+			return 0.0
+
+	def _evict(self, keep = None):
+		''' removes least recently used entries (except keep) until the size budget is met '''
+		size = self.getSize()
+		if size <= self._max_bytes:
+			return
+		for key in sorted(self._sizes, key = self._lastUse):
+			if size <= self._max_bytes:
+				break
+			if key == keep:
+				continue
+			shutil.rmtree(self._entryDirectory(key), ignore_errors = True)
+			size -= self._sizes[key]
+			self._evictions += 1
+			self._evicted_bytes += self._sizes.pop(key)
+
+	def remove(self, key):
+		''' removes the entry of key (if any) '''
+		if key in self._sizes:
+			shutil.rmtree(self._entryDirectory(key), ignore_errors = True)
+			del self._sizes[key]
+
+	def clear(self):
+		''' removes all entries '''
+		for key in list(self._sizes):
+			self.remove(key)
+
+	def getStats(self):
+		''' returns {"hits", "misses", "evictions", "evicted_bytes", "entries", "bytes", "max_bytes"},
+		counted since this cache object was created '''
+		return {
+			"hits" : self._hits,
+			"misses" : self._misses,
+			"evictions" : self._evictions,
+			"evicted_bytes" : self._evicted_bytes,
+			"entries" : len(self._sizes),
+			"bytes" : self.getSize(),
+			"max_bytes" : self._max_bytes
+		}
+
+if __name__ == '__main__':
+	import sys
+
+	directory = "result_cache"
+	if len(sys.argv) > 1:
+		directory = sys.argv[1]
+
+	cache = ResultCache(directory)
+	if len(sys.argv) > 2:
+		cache.setMaxBytes(int(sys.argv[2]))
+	stats = cache.getStats()
+	print "%d entries, %.1f of %.1f MB" % (stats["entries"], stats["bytes"] / 1024.0 ** 2, stats["max_bytes"] / 1024.0 ** 2)
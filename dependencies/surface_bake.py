@@ -0,0 +1,191 @@
+﻿''' Offline baking of view intensities onto scene geometry, which doesn't require a Vizard session.
+
+Instead of projecting cube textures from a single center (see HeatmapVisualizer), the intensity is computed
+for each mesh vertex or lightmap texel directly: every path sample adds the intensity of the view cone
+(same model as view_accumulator_offline) to the points it sees, visibility is tested with rays against the mesh (see mesh_bvh).
+Samples are grouped by eye position, such that rays are only cast once while the viewer stands still. '''
+
+import numpy as np
+
+from view_math import forwardFromEuler
+from view_accumulator_offline import frameIntensity, intensityFromCos, coneAngle
+from path_arrays import loadPathArrays
+from path_resample import resamplePath
+from mesh_io import loadMesh, writePly
+from mesh_bvh import MeshBVH
+from face_schedule import NEAR_CLIP
+
+# far clip distance of the projector frustum (see ViewAccumulator)
+FAR_CLIP = 100.0
+
+# number of path samples evaluated against all points at once
+SAMPLE_CHUNK = 64
+
+def lightmapPoints(mesh, size):
+	''' returns the surface points covered by the texel centers of a size x size lightmap,
+	using the texture coordinates of the mesh (v = 0 is the bottom row of the image).
+	Returns points (k, 3) and the row and column of each point. Texels covered by several triangles use the last one. '''
+	if mesh["uvs"] is None:
+		raise ValueError("mesh has no texture coordinates")
+
+	vertices = np.asarray(mesh["vertices"])
+	uv = np.asarray(mesh["uvs"])[mesh["uv_triangles"]] * size
+	corners = vertices[mesh["triangles"]]
+
+	# candidate texels: all texel centers inside the uv bounding box of each triangle
+	lo = np.floor(uv.min(axis = 1) - 0.5).astype(np.int64) + 1
+	hi = np.floor(uv.max(axis = 1) - 0.5).astype(np.int64)
+	lo = np.clip(lo, 0, size - 1)
+	hi = np.clip(hi, -1, size - 1)
+	extent = np.maximum(hi - lo + 1, 0)
+	counts = extent[:,0] * extent[:,1]
+
+	triangle = np.repeat(np.arange(len(uv)), counts)
+	local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+	width = np.maximum(extent[triangle,0], 1)
+	x = lo[triangle,0] + local % width
+	y = lo[triangle,1] + local // width
+
+	# barycentric coordinates of the texel centers
+	p = np.stack([x + 0.5, y + 0.5], axis = -1)
+	a = uv[triangle,0]
+	e1 = uv[triangle,1] - a
+	e2 = uv[triangle,2] - a
+	d = p - a
+	det = e1[:,0] * e2[:,1] - e1[:,1] * e2[:,0]
+	valid = np.abs(det) > 1e-12
+	det = np.where(valid, det, 1.0)
+	b1 = (d[:,0] * e2[:,1] - d[:,1] * e2[:,0]) / det
+	b2 = (e1[:,0] * d[:,1] - e1[:,1] * d[:,0]) / det
+	inside = valid & (b1 >= 0.0) & (b2 >= 0.0) & (b1 + b2 <= 1.0)
+
+	triangle, b1, b2, x, y = triangle[inside], b1[inside], b2[inside], x[inside], y[inside]
+	c = corners[triangle]
+	points = c[:,0] + b1[:,None] * (c[:,1] - c[:,0]) + b2[:,None] * (c[:,2] - c[:,0])
+	return points, size - 1 - y, x
+
+class SurfaceBaker(object):
+	''' Bakes view intensities of recorded paths onto the vertices or lightmap texels of a mesh (see mesh_io).
+	frame_weight and aperture_scale have the same meaning as for ViewAccumulatorCube.
+	position_tolerance (scene units) specifies how far the eye may move before visibility is computed again. '''
+
+	def __init__(self, mesh, frame_weight = 0.5, aperture_scale = 0.5, position_tolerance = 0.01):
+		self._mesh = mesh
+		self._bvh = MeshBVH(mesh["vertices"], mesh["triangles"])
+		self._frame_weight = frame_weight
+		self._aperture_scale = aperture_scale
+		self._position_tolerance = position_tolerance
+
+	def getMesh(self):
+		return self._mesh
+
+	def getBVH(self):
+		return self._bvh
+
+	def _samples(self, path, rate):
+		''' returns eye positions and view directions of a path (resampled at rate if given) '''
+		if rate is None:
+			return np.asarray(path["position"], dtype = np.float64), forwardFromEuler(path["rotation"])
+		resampled = resamplePath(path, rate)
+		return resampled["position"], resampled["direction"]
+
+	def _cosines(self, to_point, distance, directions, cos_cone):
+		''' returns cosines between directions to the points (rows) and view directions (columns),
+		0 outside the view cones and the projector clip range '''
+		cos_angle = np.dot(to_point, directions.T)
+		depth = cos_angle * distance[:,None]
+		cos_angle[(cos_angle <= cos_cone) | (depth < NEAR_CLIP) | (depth > FAR_CLIP)] = 0.0
+		return cos_angle
+
+	def bakePoints(self, points, path, rate = None):
+		''' returns the accumulated intensity (float32) of each point for a path given as map of arrays
+		(see path_arrays.recordsToArrays). If rate is given, the path is resampled with that many samples per second. '''
+		points = np.asarray(points, dtype = np.float64)
+		result = np.zeros(len(points), dtype = np.float64)
+		positions, directions = self._samples(path, rate)
+		if len(positions) == 0 or len(points) == 0:
+			return result.astype(np.float32)
+
+		cos_cone = np.cos(coneAngle(self._aperture_scale))
+		intensity_scale = frameIntensity(self._frame_weight)
+
+		# group samples by (quantized) eye position
+		keys = np.floor(positions / max(self._position_tolerance, 1e-9)).astype(np.int64)
+		unique_keys, group = np.unique(keys, axis = 0, return_inverse = True)
+		order = np.argsort(group, kind = 'mergesort')
+		bounds = np.searchsorted(group[order], np.arange(len(unique_keys) + 1))
+
+		for g in range(len(unique_keys)):
+			samples = order[bounds[g]:bounds[g+1]]
+			eye = positions[samples[0]]
+			offset = points - eye
+			distance = np.sqrt(np.sum(offset * offset, axis = 1))
+			to_point = offset / np.maximum(distance, 1e-12)[:,None]
+
+			# points inside any view cone of the group
+			candidates = np.zeros(len(points), dtype = bool)
+			for start in range(0, len(samples), SAMPLE_CHUNK):
+				candidates |= np.any(self._cosines(to_point, distance, directions[samples[start:start+SAMPLE_CHUNK]], cos_cone) > 0.0, axis = 1)
+
+			index = np.flatnonzero(candidates)
+			if len(index) == 0:
+				continue
+			index = index[self._bvh.visible(eye, points[index])]
+
+			for start in range(0, len(samples), SAMPLE_CHUNK):
+				cos_angle = self._cosines(to_point[index], distance[index], directions[samples[start:start+SAMPLE_CHUNK]], cos_cone)
+				result[index] += np.sum(intensityFromCos(cos_angle, self._aperture_scale), axis = 1) * intensity_scale
+
+		return result.astype(np.float32)
+
+	def bakeVertices(self, path, rate = None):
+		''' returns the accumulated intensity of each mesh vertex (see bakePoints) '''
+		return self.bakePoints(self._mesh["vertices"], path, rate)
+
+	def bakeLightmap(self, path, size = 512, rate = None):
+		''' returns a size x size lightmap (float32, row 0 = top) of accumulated intensities (see bakePoints),
+		using the texture coordinates of the mesh. Texels not covered by any triangle stay 0. '''
+		points, rows, columns = lightmapPoints(self._mesh, size)
+		lightmap = np.zeros((size, size), dtype = np.float32)
+		lightmap[rows, columns] = self.bakePoints(points, path, rate)
+		return lightmap
+
+def intensityColors(values, exposure = 1.0):
+	''' returns greyscale colors ((n, 3) uint8) for intensities scaled by exposure, clamped like the 8 bit textures '''
+	grey = np.round(np.clip(np.asarray(values) * exposure, 0.0, 1.0) * 255.0).astype(np.uint8)
+	return np.repeat(grey[:,None], 3, axis = 1)
+
+def bakeFile(mesh_file, path_file, out_file_name, rate = None, lightmap_size = None, frame_weight = 0.5, aperture_scale = 0.5):
+	''' bakes a recorded path file onto a mesh file.
+	Writes a PLY file with per vertex intensities and colors, or a lightmap .bmp if lightmap_size is given.
+	Returns the baked intensities. '''
+	mesh = loadMesh(mesh_file)
+	baker = SurfaceBaker(mesh, frame_weight, aperture_scale)
+	path = loadPathArrays(path_file)
+
+	if lightmap_size is not None:
+		from cube_io import writeBmp
+		lightmap = baker.bakeLightmap(path, lightmap_size, rate)
+		writeBmp(out_file_name, lightmap)
+		return lightmap
+
+	values = baker.bakeVertices(path, rate)
+	writePly(out_file_name, mesh, values, intensityColors(values))
+	return values
+
+if __name__ == '__main__':
+	import sys
+
+	if len(sys.argv) < 4:
+		print "usage: surface_bake.py <mesh .obj/.ply> <recording> <output .ply/.bmp> [samples per second] [lightmap size]"
+		sys.exit(1)
+
+	rate = None
+	if len(sys.argv) > 4:
+		rate = float(sys.argv[4])
+	lightmap_size = None
+	if len(sys.argv) > 5:
+		lightmap_size = int(sys.argv[5])
+
+	bakeFile(sys.argv[1], sys.argv[2], sys.argv[3], rate, lightmap_size)
+	print "Baked view intensities saved to " + sys.argv[3]
@@ -0,0 +1,296 @@
+﻿''' Time windowed view intensities.
+Face intensities are accumulated per time bucket and stored as prefix sums, such that the intensities
+of any window of buckets are the difference of two stored cubes (one subtraction per texel).
+
+File layout (little endian):
+	magic "TCUBE\0", uint16 version, uint32 header length, uint64 bucket count
+	JSON header (resolution, bucket duration, start time, face order and capture parameters)
+	padding up to a multiple of 64 bytes
+	bucket count + 1 cumulative cubes (6 faces x resolution x resolution float32 values each),
+	cube b holds the sum of all buckets before b (cube 0 is zero) '''
+
+import os
+import json
+import math
+import mmap
+import struct
+import numpy as np
+
+from view_math import FACE_NAMES, forwardFromEuler
+from view_accumulator_offline import OfflineViewAccumulatorCube
+from path_arrays import loadPathArrays
+from path_resample import resamplePath
+
+# default face resolution of time buckets, a lower resolution keeps the file small
+# (6 x 256 x 256 float32 values, 1.5 MB per bucket instead of 25 MB at 1024)
+BUCKET_RESOLUTION = 256
+
+# file extension of time bucket files
+TIME_EXTENSION = ".tcube"
+
+_MAGIC = b'TCUBE\0'
+_VERSION = 1
+_PREFIX = struct.Struct('<6sHIQ')
+_COUNT_OFFSET = 12
+_ALIGNMENT = 64
+
+def _fileName(file_name):
+	if not file_name.endswith(TIME_EXTENSION):
+		file_name += TIME_EXTENSION
+	return file_name
+
+class TimeBucketWriter(object):
+	''' Appends buckets to a time bucket file. The file is valid after each bucket,
+	so a capture can be interrupted or read while it is still running. '''
+
+	def __init__(self, file_name, resolution, bucket_duration, start_time = 0.0, metadata = None):
+		self._file_name = _fileName(file_name)
+		self._resolution = resolution
+
+		header = dict(metadata or {})
+		header.update({
+			"resolution" : resolution,
+			"bucket_duration" : bucket_duration,
+			"start_time" : start_time,
+			"dtype" : "float32",
+			"faces" : list(FACE_NAMES)
+		})
+		header_data = json.dumps(header, sort_keys = True).encode('utf-8')
+		padding = -(_PREFIX.size + len(header_data)) % _ALIGNMENT
+
+		# running sum of all buckets written so far
+		self._total = np.zeros((len(FACE_NAMES), resolution, resolution))
+		self._count = 0
+
+		self._file = open(self._file_name, 'wb')
+		self._file.write(_PREFIX.pack(_MAGIC, _VERSION, len(header_data) + padding, 0))
+		self._file.write(header_data + b' ' * padding)
+		self._file.write(self._total.astype('<f4').tobytes())
+		self._file.flush()
+
+	def getFileName(self):
+		return self._file_name
+
+	def getBucketCount(self):
+		return self._count
+
+	def addBucket(self, faces):
+		''' appends the intensities (map of face name to array) accumulated during the next bucket '''
+		for index, face in enumerate(FACE_NAMES):
+			self._total[index] += faces[face]
+		self._writeTotal()
+
+	def addCumulative(self, faces):
+		''' appends the intensities accumulated from the start up to the end of the next bucket
+		(e.g. a snapshot of a running accumulator) '''
+		for index, face in enumerate(FACE_NAMES):
+			self._total[index] = faces[face]
+		self._writeTotal()
+
+	def _writeTotal(self):
+		self._file.seek(0, 2)
+		self._file.write(self._total.astype('<f4').tobytes())
+		self._count += 1
+		self._file.seek(_COUNT_OFFSET)
+		self._file.write(struct.pack('<Q', self._count))
+		self._file.flush()
+
+	def close(self):
+		self._file.close()
+
+class TimeBucketStore(object):
+	''' Read only, memory mapped access to a time bucket file. '''
+
+	def __init__(self, file_name):
+		self._file_name = _fileName(file_name)
+		with open(self._file_name, 'rb') as data_file:
+			magic, version, header_size, count = _PREFIX.unpack(data_file.read(_PREFIX.size))
+			if magic != _MAGIC or version != _VERSION:
+				raise IOError("not a time bucket file: " + self._file_name)
+			self._header = json.loads(data_file.read(header_size).decode('utf-8'))
+			self._mapped = mmap.mmap(data_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+		resolution = self._header["resolution"]
+		self._faces = [str(face) for face in self._header["faces"]]
+		self._count = int(count)
+		self._cumulative = np.frombuffer(self._mapped, dtype = '<f4', count = (self._count + 1) * len(self._faces) * resolution * resolution,
+			offset = _PREFIX.size + header_size).reshape(self._count + 1, len(self._faces), resolution, resolution)
+
+	def getHeader(self):
+		return dict(self._header)
+
+	def getBucketCount(self):
+		return self._count
+
+	def getBucketDuration(self):
+		return self._header["bucket_duration"]
+
+	def getStartTime(self):
+		return self._header["start_time"]
+
+	def getDuration(self):
+		return self._count * self.getBucketDuration()
+
+	def getResolution(self):
+		return self._header["resolution"]
+
+	def bucketRange(self, start_time, end_time):
+		''' returns the range [first, last) of buckets overlapping the time window (clamped to the recording) '''
+		duration = self.getBucketDuration()
+		first = int(math.floor((start_time - self.getStartTime()) / duration + 1e-9))
+		last = int(math.ceil((end_time - self.getStartTime()) / duration - 1e-9))
+		first = min(max(first, 0), self._count)
+		last = min(max(last, first), self._count)
+		return first, last
+
+	def bucketWindow(self, first, last):
+		''' returns map of face name to float32 intensities accumulated in buckets [first, last) '''
+		window = self._cumulative[last] - self._cumulative[first]
+		return dict((face, window[index]) for index, face in enumerate(self._faces))
+
+	def window(self, start_time, end_time):
+		''' returns map of face name to float32 intensities accumulated between start_time and end_time (seconds).
+		The window is widened to whole buckets. '''
+		first, last = self.bucketRange(start_time, end_time)
+		return self.bucketWindow(first, last)
+
+	def total(self):
+		''' returns the intensities of the whole recording '''
+		return self.bucketWindow(0, self._count)
+
+def captureTimeBuckets(path, file_name, bucket_duration = 10.0, rate = None, frame_weight = 0.5, aperture_scale = 0.5, resolution = BUCKET_RESOLUTION):
+	''' accumulates a path (see path_arrays.recordsToArrays) on the CPU into a time bucket file,
+	one OfflineViewAccumulatorCube pass per bucket of bucket_duration seconds.
+	If rate is given, the path is resampled with the given number of frames per second. Returns the number of buckets. '''
+	if rate is not None:
+		path = resamplePath(path, rate)
+		directions = path["direction"]
+	else:
+		directions = forwardFromEuler(path["rotation"])
+	time = np.asarray(path["time"], dtype = np.float64)
+	order = np.argsort(time, kind = 'mergesort')
+	time = time[order]
+	directions = directions[order]
+
+	start_time = time[0] if len(time) > 0 else 0.0
+	count = int(math.floor((time[-1] - start_time) / bucket_duration)) + 1 if len(time) > 0 else 0
+	bounds = np.searchsorted(time, start_time + np.arange(count + 1) * bucket_duration)
+	bounds[-1] = len(time)
+
+	accumulator = OfflineViewAccumulatorCube(frame_weight, aperture_scale, resolution)
+	metadata = accumulator.getMetadata()
+	metadata["sample_count"] = len(time)
+	writer = TimeBucketWriter(file_name, resolution, bucket_duration, float(start_time), metadata)
+	for bucket in range(count):
+		accumulator.clear()
+		accumulator.accumulateDirections(directions[bounds[bucket]:bounds[bucket+1]])
+		writer.addBucket(accumulator.getOutputFaces())
+	writer.close()
+	return count
+
+def captureTimeBucketsFile(path_file, file_name, bucket_duration = 10.0, rate = None, **kwargs):
+	''' accumulates an animation path file written by AnimationPathRecorder into a time bucket file (see captureTimeBuckets) '''
+	return captureTimeBuckets(loadPathArrays(path_file), file_name, bucket_duration, rate, **kwargs)
+
+class TimeWindowSource(object):
+	''' Feeds the intensities of a time window of a TimeBucketStore to a HeatmapVisualizer (requires Vizard).
+	Intensities are multiplied by exposure before being converted to 8 bit textures
+	(by default chosen with cube_hdr.hdrExposure for the whole recording, so windows are comparable).
+	The faces of each window are written to one temporary directory per source under names never used before
+	(textures are cached by file name) and deleted once loaded, the directory is removed by remove(). '''
+
+	def __init__(self, store, visualizer = None, exposure = None):
+		from cube_hdr import hdrExposure
+
+		self._store = store
+		self._visualizer = visualizer
+		self._exposure = exposure
+		if self._exposure is None:
+			self._exposure = hdrExposure(store.total())
+		self._textures = None
+		self._range = None
+		self._directory = None
+		self._loads = 0
+
+	def getStore(self):
+		return self._store
+
+	def setVisualizer(self, visualizer):
+		''' sets the HeatmapVisualizer receiving the textures of the current window '''
+		self._visualizer = visualizer
+		if self._visualizer is not None and self._textures is not None:
+			self._visualizer.setTextures(self._textures)
+
+	def getTextures(self):
+		''' returns the textures of the current window (map of viz cube face constant to texture) or None '''
+		return self._textures
+
+	def getRange(self):
+		''' returns the bucket range [first, last) currently displayed '''
+		return self._range
+
+	def setWindow(self, start_time, end_time):
+		''' displays the intensities between start_time and end_time (seconds).
+		Textures are only replaced if the window covers other buckets than before. '''
+		import tempfile
+		from cube_io import toVizTextures, facePaths
+
+		bucket_range = self._store.bucketRange(start_time, end_time)
+		if bucket_range == self._range:
+			return
+		self._range = bucket_range
+
+		if self._directory is None:
+			self._directory = tempfile.mkdtemp(prefix = "time_window_")
+
+		# a new prefix per load, such that the texture cache can't return the images of an earlier window
+		prefix = "window%d" % self._loads
+		self._loads += 1
+		faces = self._store.bucketWindow(*bucket_range)
+		textures = toVizTextures(dict((face, faces[face] * np.float32(self._exposure)) for face in FACE_NAMES), prefix, self._directory)
+		for path in facePaths(prefix, self._directory).values():
+			os.remove(path)
+
+		# the textures of the previous window are removed once replaced
+		if self._visualizer is not None:
+			self._visualizer.setTextures(textures)
+		if self._textures is not None:
+			for texture in self._textures.values():
+				texture.remove()
+		self._textures = textures
+
+	def setWindowFraction(self, start, end):
+		''' displays a window given as fractions [0.0,1.0] of the recording (e.g. slider positions) '''
+		begin = self._store.getStartTime()
+		duration = self._store.getDuration()
+		self.setWindow(begin + min(start, end) * duration, begin + max(start, end) * duration)
+
+	def remove(self):
+		''' removes the textures of the current window and the temporary directory '''
+		import shutil
+
+		if self._textures is not None:
+			for texture in self._textures.values():
+				texture.remove()
+		self._textures = None
+		self._range = None
+		if self._directory is not None:
+			shutil.rmtree(self._directory, ignore_errors = True)
+			self._directory = None
+
+if __name__ == '__main__':
+	import sys
+
+	if len(sys.argv) < 2:
+		print "usage: time_store.py <recording> [bucket duration] [output]"
+		sys.exit(1)
+
+	bucket_duration = 10.0
+	if len(sys.argv) > 2:
+		bucket_duration = float(sys.argv[2])
+	file_name = "accumulated"
+	if len(sys.argv) > 3:
+		file_name = sys.argv[3]
+
+	count = captureTimeBucketsFile(sys.argv[1], file_name, bucket_duration)
+	print "Accumulated %d buckets of %.1f s into %s" % (count, bucket_duration, _fileName(file_name))
@@ -0,0 +1,90 @@
+﻿''' Dirty tracking for per frame update callbacks.
+Values derived from matrices (e.g. GL conversions, inverses) are only recomputed
+when one of their source matrices changed, and uniforms / effect properties
+are only uploaded when their value changed since the last upload. '''
+
+def matrixKey(mat):
+	''' returns a hashable snapshot of a viz.Matrix (or a sequence of values) used to detect changes '''
+	if hasattr(mat, 'get'):
+		mat = mat.get()
+	return tuple(mat)
+
+class TransformCache(object):
+	''' Caches derived values by key and tracks hits and misses per frame.
+	A single cache may be shared by several nodes (e.g. the faces of a ViewAccumulatorCube),
+	values derived from common sources (like the main view matrix) are then computed once per frame. '''
+
+	def __init__(self):
+		# key -> (source snapshot, derived value)
+		self._derived = {}
+
+		# key -> last uploaded value snapshot
+		self._uploaded = {}
+
+		# frame the per frame counters refer to
+		self._frame = None
+
+		# per frame and total counters
+		self._frame_stats = self._emptyStats()
+		self._total_stats = self._emptyStats()
+
+	def _emptyStats(self):
+		return {"hits" : 0, "misses" : 0, "uploads" : 0, "skipped" : 0}
+
+	def _count(self, name):
+		self._frame_stats[name] += 1
+		self._total_stats[name] += 1
+
+	def beginFrame(self, frame = None):
+		''' resets the per frame counters.
+		If frame (e.g. viz.getFrameNumber()) is given, counters are only reset once per frame,
+		such that all users of a shared cache can call this at the start of their update. '''
+		if frame is not None and frame == self._frame:
+			return
+		self._frame = frame
+		self._frame_stats = self._emptyStats()
+
+	def derive(self, key, sources, compute):
+		''' returns the value cached for key and whether it was recomputed.
+		sources is a sequence of matrices the value depends on, compute is called without arguments
+		if any of them changed since the last call for this key. '''
+		snapshot = tuple(matrixKey(source) for source in sources)
+		entry = self._derived.get(key)
+		if entry is not None and entry[0] == snapshot:
+			self._count("hits")
+			return entry[1], False
+
+		self._count("misses")
+		value = compute()
+		self._derived[key] = (snapshot, value)
+		return value, True
+
+	def upload(self, key, value, setter):
+		''' calls setter(value) unless the same value was uploaded for key before.
+		Returns True if the value was uploaded. '''
+		snapshot = matrixKey(value) if hasattr(value, 'get') or isinstance(value, (list, tuple)) else value
+		if key in self._uploaded and self._uploaded[key] == snapshot:
+			self._count("skipped")
+			return False
+
+		setter(value)
+		self._uploaded[key] = snapshot
+		self._count("uploads")
+		return True
+
+	def invalidate(self, key = None):
+		''' forgets cached values and uploads for key (or all keys if None), forcing the next update '''
+		if key is None:
+			self._derived.clear()
+			self._uploaded.clear()
+			return
+		self._derived.pop(key, None)
+		self._uploaded.pop(key, None)
+
+	def getFrameStats(self):
+		''' returns counters of the current frame as dict (hits, misses, uploads, skipped) '''
+		return dict(self._frame_stats)
+
+	def getTotalStats(self):
+		''' returns counters accumulated since construction as dict (hits, misses, uploads, skipped) '''
+		return dict(self._total_stats)
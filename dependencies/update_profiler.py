@@ -0,0 +1,273 @@
+﻿''' Opt-in profiling of the callbacks called once per frame (vizact.onupdate).
+
+Modules register their per frame callbacks through onupdate() of this module. While profiling is disabled
+(the default) this is plain vizact.onupdate and costs nothing. After enableProfiling(), callbacks registered
+from then on are timed, and the durations of the last calls of each callback are kept in fixed size ring buffers,
+along with the duration and number of render passes (see countPasses) of the last frames.
+getReport() summarizes the buffers (percentiles, frames exceeding the frame budget),
+writeTrace() dumps them as Chrome trace file (chrome://tracing, Perfetto). '''
+
+import json
+import timeit
+import numpy as np
+
+# high resolution wall clock (time.clock on Windows, time.time elsewhere)
+_timer = timeit.default_timer
+
+# number of calls kept per callback
+DEFAULT_CAPACITY = 4096
+
+# duration of a frame at the target frame rate (seconds)
+FRAME_BUDGET = 1.0 / 60.0
+
+# percentiles reported for each callback and for frames
+PERCENTILES = (50, 90, 99)
+
+# update priority of the frame marker, called before all other callbacks
+FRAME_PRIORITY = -1000
+
+class RingBuffer(object):
+	''' Keeps the last capacity entries of (start time, duration, frame number). '''
+
+	def __init__(self, capacity = DEFAULT_CAPACITY):
+		self._start = np.zeros(capacity)
+		self._duration = np.zeros(capacity)
+		self._frame = np.zeros(capacity, dtype = np.int64)
+		self._index = 0
+		self._count = 0
+
+	def append(self, start, duration, frame):
+		i = self._index
+		self._start[i] = start
+		self._duration[i] = duration
+		self._frame[i] = frame
+		self._index = (i + 1) % len(self._start)
+		self._count += 1
+
+	def getCount(self):
+		''' returns the number of entries appended so far (including overwritten ones) '''
+		return self._count
+
+	def getArrays(self):
+		''' returns start times, durations and frame numbers of the kept entries, oldest first '''
+		if self._count < len(self._start):
+			kept = slice(0, self._count)
+			return self._start[kept].copy(), self._duration[kept].copy(), self._frame[kept].copy()
+		order = np.roll(np.arange(len(self._start)), -self._index)
+		return self._start[order], self._duration[order], self._frame[order]
+
+def _callbackName(func):
+	''' returns Class.method for bound methods, the function name otherwise '''
+	owner = getattr(func, '__self__', None)
+	if owner is not None:
+		return type(owner).__name__ + "." + func.__name__
+	return getattr(func, '__name__', repr(func))
+
+def _summary(durations, frame_budget):
+	''' returns count, mean, max and percentiles (milliseconds) of durations (seconds) and the number exceeding frame_budget '''
+	summary = {"count" : len(durations), "over_budget" : int(np.sum(durations > frame_budget))}
+	if len(durations) == 0:
+		return summary
+	summary["mean_ms"] = float(durations.mean() * 1000.0)
+	summary["max_ms"] = float(durations.max() * 1000.0)
+	for percentile, value in zip(PERCENTILES, np.percentile(durations, PERCENTILES)):
+		summary["p%d_ms" % percentile] = float(value * 1000.0)
+	return summary
+
+class UpdateProfiler(object):
+	''' Times wrapped callbacks (see wrap) and frames (see beginFrame).
+	frame_budget (seconds) is the frame duration regarded as overrun when exceeded. '''
+
+	def __init__(self, capacity = DEFAULT_CAPACITY, frame_budget = FRAME_BUDGET):
+		self._capacity = capacity
+		self._frame_budget = frame_budget
+		self._enabled = True
+
+		# ring buffer per callback name, in registration order
+		self._callbacks = {}
+		self._names = []
+
+		# frames: ring buffer of frame durations and render passes per frame
+		self._frames = RingBuffer(capacity)
+		self._frame_passes = np.zeros(capacity, dtype = np.int64)
+		self._frame = 0
+		self._frame_start = None
+		self._passes = 0
+
+		# total render passes per source name
+		self._pass_totals = {}
+
+	def setEnabled(self, enabled):
+		''' pauses (False) or resumes (True) timing, wrapped callbacks are still called '''
+		self._enabled = enabled
+
+	def isEnabled(self):
+		return self._enabled
+
+	def getFrameBudget(self):
+		return self._frame_budget
+
+	def wrap(self, name, func):
+		''' returns func wrapped such that each call is timed under name.
+		Names registered more than once (e.g. one callback per face) are numbered. '''
+		if name in self._callbacks:
+			count = 2
+			while "%s#%d" % (name, count) in self._callbacks:
+				count += 1
+			name = "%s#%d" % (name, count)
+		buffer = RingBuffer(self._capacity)
+		self._callbacks[name] = buffer
+		self._names.append(name)
+
+		def profiled(*args):
+			if not self._enabled:
+				return func(*args)
+			start = _timer()
+			try:
+				return func(*args)
+			finally:
+				buffer.append(start, _timer() - start, self._frame)
+		return profiled
+
+	def beginFrame(self):
+		''' closes the previous frame (duration since its begin, render passes counted) and starts the next one '''
+		now = _timer()
+		if self._enabled and self._frame_start is not None:
+			self._frame_passes[self._frames._index] = self._passes
+			self._frames.append(self._frame_start, now - self._frame_start, self._frame)
+		self._frame_start = now
+		self._frame += 1
+		self._passes = 0
+
+	def countPasses(self, name, count = 1):
+		''' counts render passes issued in the current frame by the given source '''
+		if not self._enabled:
+			return
+		self._passes += count
+		self._pass_totals[name] = self._pass_totals.get(name, 0) + count
+
+	def getCallbackNames(self):
+		return list(self._names)
+
+	def getDurations(self, name):
+		''' returns the kept durations (seconds) of a callback, oldest first '''
+		return self._callbacks[name].getArrays()[1]
+
+	def getReport(self):
+		''' returns a summary of all callbacks and frames:
+		{
+			"callbacks" : {name : {"count", "mean_ms", "max_ms", "p50_ms", ..., "over_budget"}},
+			"frames" : {"count", "mean_ms", ..., "over_budget", "mean_passes", "max_passes"},
+			"passes" : {source name : total render passes},
+			"frame_budget_ms" : budget
+		}
+		Statistics cover the entries kept in the ring buffers, counts all calls. '''
+		callbacks = {}
+		for name in self._names:
+			summary = _summary(self.getDurations(name), self._frame_budget)
+			summary["count"] = self._callbacks[name].getCount()
+			callbacks[name] = summary
+
+		frames = _summary(self._frames.getArrays()[1], self._frame_budget)
+		frames["count"] = self._frames.getCount()
+		passes = self._keptPasses()
+		if len(passes) > 0:
+			frames["mean_passes"] = float(passes.mean())
+			frames["max_passes"] = int(passes.max())
+
+		return {
+			"callbacks" : callbacks,
+			"frames" : frames,
+			"passes" : dict(self._pass_totals),
+			"frame_budget_ms" : self._frame_budget * 1000.0
+		}
+
+	def _keptPasses(self):
+		''' returns the render passes of the kept frames, oldest first '''
+		count = self._frames.getCount()
+		if count < self._capacity:
+			return self._frame_passes[:count].copy()
+		return np.roll(self._frame_passes, -self._frames._index)
+
+	def printReport(self):
+		''' prints the report (see getReport), slowest callbacks first '''
+		report = self.getReport()
+		frames = report["frames"]
+		print "frames: %d, over budget (%.1f ms): %d" % (frames["count"], report["frame_budget_ms"], frames["over_budget"])
+		if "mean_ms" in frames:
+			print "  frame time ms: mean %.2f, p50 %.2f, p90 %.2f, p99 %.2f, max %.2f" % (
+				frames["mean_ms"], frames["p50_ms"], frames["p90_ms"], frames["p99_ms"], frames["max_ms"])
+		if "mean_passes" in frames:
+			print "  render passes per frame: mean %.1f, max %d" % (frames["mean_passes"], frames["max_passes"])
+
+		callbacks = sorted(report["callbacks"].items(), key = lambda item: -item[1].get("mean_ms", 0.0))
+		for name, summary in callbacks:
+			if "mean_ms" not in summary:
+				continue
+			print "%-40s calls %7d  mean %7.3f  p50 %7.3f  p99 %7.3f  max %7.3f ms" % (
+				name, summary["count"], summary["mean_ms"], summary["p50_ms"], summary["p99_ms"], summary["max_ms"])
+
+	def writeTrace(self, file_name = "update_trace.json"):
+		''' writes the kept callback calls and frames as Chrome trace file (JSON), with the report as metadata '''
+		events = []
+		starts, durations, numbers = self._frames.getArrays()
+		passes = self._keptPasses()
+		for start, duration, number, count in zip(starts, durations, numbers, passes):
+			events.append({"name" : "frame", "ph" : "X", "pid" : 0, "tid" : 0,
+				"ts" : start * 1e6, "dur" : duration * 1e6, "args" : {"frame" : int(number), "passes" : int(count)}})
+
+		for tid, name in enumerate(self._names):
+			starts, durations, numbers = self._callbacks[name].getArrays()
+			events.append({"name" : "thread_name", "ph" : "M", "pid" : 0, "tid" : tid + 1, "args" : {"name" : name}})
+			for start, duration, number in zip(starts, durations, numbers):
+				events.append({"name" : name, "ph" : "X", "pid" : 0, "tid" : tid + 1,
+					"ts" : start * 1e6, "dur" : duration * 1e6, "args" : {"frame" : int(number)}})
+
+		with open(file_name, 'w') as trace_file:
+			json.dump({"traceEvents" : events, "displayTimeUnit" : "ms", "metadata" : self.getReport()}, trace_file)
+
+# active profiler (None while profiling is disabled)
+_profiler = None
+
+# update event of the frame marker
+_frame_event = None
+
+def enableProfiling(capacity = DEFAULT_CAPACITY, frame_budget = FRAME_BUDGET):
+	''' starts profiling callbacks registered from now on (see onupdate) and frames.
+	Returns the profiler (requires Vizard). '''
+	import vizact
+	global _profiler, _frame_event
+
+	disableProfiling()
+	_profiler = UpdateProfiler(capacity, frame_budget)
+	_frame_event = vizact.onupdate(FRAME_PRIORITY, _profiler.beginFrame)
+	return _profiler
+
+def disableProfiling():
+	''' stops profiling, callbacks wrapped so far are called without timing '''
+	global _profiler, _frame_event
+
+	if _profiler is not None:
+		_profiler.setEnabled(False)
+	if _frame_event is not None:
+		_frame_event.remove()
+	_profiler = None
+	_frame_event = None
+
+def getProfiler():
+	''' returns the active profiler or None '''
+	return _profiler
+
+def onupdate(priority, func, *args, **kwargs):
+	''' registers func to be called each frame (see vizact.onupdate).
+	While profiling is enabled, calls are timed under kwargs "name" (default Class.method). '''
+	import vizact
+
+	if _profiler is None:
+		return vizact.onupdate(priority, func, *args)
+	return vizact.onupdate(priority, _profiler.wrap(kwargs.get("name") or _callbackName(func), func), *args)
+
+def countPasses(name, count = 1):
+	''' counts render passes issued in the current frame (ignored while profiling is disabled) '''
+	if _profiler is not None:
+		_profiler.countPasses(name, count)
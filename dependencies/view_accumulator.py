@@ -1,15 +1,17 @@
 ﻿import viz
-import vizact
 
 from view_projector import *
+import update_profiler
 
 class ViewAccumulator(viz.VizNode):
 	''' Captures view intensities compiled by a ViewProjector.
 	Computed output can be retrieved by getOutputTexture(). 
 	Transformation of this node is linked to the transformation of the capture node.
-	frame_weight specifies a scaling factor for the accumulation of view intensities.'''
+	frame_weight specifies a scaling factor for the accumulation of view intensities.
+	resolution specifies the size (in pixels) of the square output texture.
+	transform_cache (see transform_cache.TransformCache) may be shared between accumulators.'''
 	
-	def __init__(self, frame_weight = 0.5, aperture_scale = 0.5, node = None, **kwargs):
+	def __init__(self, frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024, transform_cache = None, node = None, **kwargs):
 		# node to reference this instance in the scenegraph
 		self._node = node
 		if self._node == None:
@@ -23,7 +25,8 @@ class ViewAccumulator(viz.VizNode):
 		
 		### INIT CAMERA
 		# Create render node for camera
-		self._cam = viz.addRenderNode(size=(1024, 1024))
+		self._resolution = resolution
+		self._cam = viz.addRenderNode(size=(resolution, resolution))
 		self._cam.renderOnlyToWindows([viz.MainWindow])
 		self._cam.setInheritView(False)
 		self._cam.drawOrder(1000)
@@ -37,14 +40,36 @@ class ViewAccumulator(viz.VizNode):
 		viz.link(self._node, self._cam)
 		
 		# affect camera so its render texture will be computed using the defined shading pipeline
-		self._projector = ViewProjector()
+		self._projector = ViewProjector(transform_cache)
 		self._projector.setFrameWeight(frame_weight)
 		self._projector.setApertureScale(aperture_scale)
+		self._projector.setResolution(resolution)
 		self._projector.affect(self._cam)
+		
+		# projection of the projector (constant)
+		self._proj = viz.Matrix.perspective(60.0,1.0,0.1,100.0)
 
-		self._update_event = vizact.onupdate(100, self.update)
+		# inactive accumulators neither render nor swap textures, keeping their output
+		self._active = True
+		
+		self._update_event = update_profiler.onupdate(100, self.update)
+		
+	def setActive(self, active):
+		''' suspends (False) or resumes (True) rendering and accumulation.
+		The accumulated output is kept while suspended. '''
+		if active == self._active:
+			return
+		self._active = active
+		self._cam.visible(active)
+		self._projector.setEnabled(active)
+		
+	def isActive(self):
+		return self._active
 		
 	def update(self):
+		if not self._active:
+			return
+		
 		# swap textures
 		temp = self._output_texture
 		self._output_texture = self._last_frame_texture
@@ -56,8 +81,10 @@ class ViewAccumulator(viz.VizNode):
 
 		# update transforms for projector
 		mat = viz.MainView.getMatrix()
-		proj = viz.Matrix.perspective(60.0,1.0,0.1,100.0)
-		self._projector.update(self.getMatrix(), mat, proj)
+		self._projector.update(self.getMatrix(), mat, self._proj)
+		
+		# accumulation and projector depth pass
+		update_profiler.countPasses("ViewAccumulator", 2)
 
 	def setFrameWeight(self, weight):
 		''' set scaling factor for per frame view accumulation.
@@ -77,7 +104,15 @@ class ViewAccumulator(viz.VizNode):
 	def getApertureScale(self):
 		''' gets the aperture_scale (scaling factor for the view cone aperture).
 		value is float in range [0.0,1.0]. '''
-		return self._projector.getApertureScale(ap_scale)
+		return self._projector.getApertureScale()
+		
+	def getResolution(self):
+		''' gets the size (in pixels) of the square output texture. '''
+		return self._resolution
+		
+	def getTransformCache(self):
+		''' returns the cache tracking transform changes between updates (see transform_cache) '''
+		return self._projector.getTransformCache()
 		
 	def getOutputTexture(self):
 		return self._output_texture
@@ -1,15 +1,24 @@
 ﻿import viz
+import vizmat
 
 from view_accumulator import *
+from transform_cache import TransformCache
+from face_schedule import visibleFaces, toCubeDirection, NEAR_CLIP
+from cube_io import vizFaceKeys
+from cube_io import loadFaces
+from cube_mip import savePyramid, MIN_SIZE
+import update_profiler
 
 class ViewAccumulatorCube(viz.VizNode):
 	''' Captures view intensities using a cube setup.
 	Each face is represented by a ViewAccumulator.
 	Computed output can be retrieved by getOutputTexture(face).
 	All textures can be stored calling saveAll(...).
-	Transformation of this node is linked to transformation of the center of the cube. '''
+	Transformation of this node is linked to transformation of the center of the cube.
+	resolution specifies the size (in pixels) of each face.
+	Faces the main view can't add intensity to in a frame are suspended (see face_schedule and setFaceScheduling). '''
 	
-	def __init__(self, frame_weight = 0.5, aperture_scale = 0.5, node = None, **kwargs):
+	def __init__(self, frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024, node = None, **kwargs):
 		# node to reference this instance in the scenegraph
 		self._node = node
 		if self._node == None:
@@ -17,14 +26,18 @@ class ViewAccumulatorCube(viz.VizNode):
 			
 		viz.VizNode.__init__(self, id = self._node.id, **kwargs)
 		
+		# transform cache shared by all faces, such that the main view is converted once per frame
+		self._transform_cache = TransformCache()
+		
 		# init intensity capture for each face
+		self._resolution = resolution
 		self._capture_faces = {
-			viz.POSITIVE_X : ViewAccumulator(frame_weight = 0.5, aperture_scale = 0.5),
-			viz.NEGATIVE_X : ViewAccumulator(frame_weight = 0.5, aperture_scale = 0.5),
-			viz.POSITIVE_Y : ViewAccumulator(frame_weight = 0.5, aperture_scale = 0.5),
-			viz.NEGATIVE_Y : ViewAccumulator(frame_weight = 0.5, aperture_scale = 0.5),
-			viz.POSITIVE_Z : ViewAccumulator(frame_weight = 0.5, aperture_scale = 0.5),
-			viz.NEGATIVE_Z : ViewAccumulator(frame_weight = 0.5, aperture_scale = 0.5)
+			viz.POSITIVE_X : ViewAccumulator(frame_weight, aperture_scale, resolution, self._transform_cache),
+			viz.NEGATIVE_X : ViewAccumulator(frame_weight, aperture_scale, resolution, self._transform_cache),
+			viz.POSITIVE_Y : ViewAccumulator(frame_weight, aperture_scale, resolution, self._transform_cache),
+			viz.NEGATIVE_Y : ViewAccumulator(frame_weight, aperture_scale, resolution, self._transform_cache),
+			viz.POSITIVE_Z : ViewAccumulator(frame_weight, aperture_scale, resolution, self._transform_cache),
+			viz.NEGATIVE_Z : ViewAccumulator(frame_weight, aperture_scale, resolution, self._transform_cache)
 		}
 		
 		cube_euler = {
@@ -40,7 +53,67 @@ class ViewAccumulatorCube(viz.VizNode):
 		for face in self._capture_faces:
 			self._capture_faces[face].setEuler(cube_euler[face])
 			viz.grab(self,self._capture_faces[face])
+		
+		# map of face name (see view_math.FACE_NAMES) to viz cube face constant
+		self._face_keys = vizFaceKeys()
+		
+		# face scheduling settings, surfaces closer than min_distance to the viewer are assumed to receive no intensity
+		self._face_scheduling = True
+		self._min_distance = NEAR_CLIP
+		
+		# scheduling statistics (totals and faces skipped in the last frame)
+		self._schedule_stats = {"frames" : 0, "rendered" : 0, "skipped" : 0}
+		self._skipped_faces = []
+		
+		# schedule before the face accumulators update
+		self._schedule_event = update_profiler.onupdate(99, self._scheduleFaces)
+		
+	def _scheduleFaces(self):
+		''' activates the faces the main view may add intensity to and suspends the others '''
+		active = set(self._capture_faces.keys())
+		if self._face_scheduling:
+			view_mat = viz.MainView.getMatrix()
+			direction = toCubeDirection(view_mat.getForward(), self.getEuler(viz.ABS_GLOBAL))
+			offset = vizmat.Distance(view_mat.getPosition(), self.getPosition(viz.ABS_GLOBAL))
+			visible = visibleFaces(direction, self.getApertureScale(), offset, self._min_distance)
+			active = set(self._face_keys[face] for face in visible)
+		
+		self._skipped_faces = []
+		for face in self._capture_faces:
+			self._capture_faces[face].setActive(face in active)
+			if face not in active:
+				self._skipped_faces.append(face)
+		
+		self._schedule_stats["frames"] += 1
+		self._schedule_stats["rendered"] += len(self._capture_faces) - len(self._skipped_faces)
+		self._schedule_stats["skipped"] += len(self._skipped_faces)
+		
+	def setFaceScheduling(self, enabled, min_distance = NEAR_CLIP):
+		''' enables or disables suspending faces the main view can't add intensity to.
+		min_distance specifies the smallest distance between viewer and scene surfaces,
+		larger values allow skipping faces while the viewer is away from the cube center. '''
+		self._face_scheduling = enabled
+		self._min_distance = min_distance
+		
+	def getFaceScheduling(self):
+		return self._face_scheduling
+		
+	def getScheduleStats(self):
+		''' returns scheduling statistics as dict:
+		"frames", "rendered" and "skipped" (face counts summed over all frames),
+		"last_skipped" (list of viz cube face constants suspended in the last frame) '''
+		stats = dict(self._schedule_stats)
+		stats["last_skipped"] = list(self._skipped_faces)
+		return stats
 			
+	def getResolution(self):
+		''' gets the size (in pixels) of each face. '''
+		return self._resolution
+		
+	def getTransformCache(self):
+		''' returns the transform cache shared by all faces (see transform_cache) '''
+		return self._transform_cache
+		
 	def getOutputTexture(self, face = viz.POSITIVE_Z):
 		return self._capture_faces[face].getOutputTexture()
 		
@@ -64,12 +137,13 @@ class ViewAccumulatorCube(viz.VizNode):
 	def getApertureScale(self, face = viz.POSITIVE_Z):
 		''' gets the aperture_scale (scaling factor for the view cone aperture).
 		value is float in range [0.0,1.0]. '''
-		return self._capture_faces[face].getApertureScale(ap_scale)
+		return self._capture_faces[face].getApertureScale()
 		
-	def saveAll(self, prefix = "accumulated", directory = ""):
+	def saveAll(self, prefix = "accumulated", directory = "", mip_min_size = MIN_SIZE):
 		''' saves all cube face captures to .bmp file.
 		"prefix" denotes the filename prefix for each file. 
 		"directory" specifies the output directory. 
+		"mip_min_size" specifies the smallest level of the mip pyramid saved along (see cube_mip), None skips the pyramid.
 		Returns full path of files saved. '''
 		if len(directory) > 0 and not directory.endswith('/'):
 			directory += "/"
@@ -85,8 +159,14 @@ class ViewAccumulatorCube(viz.VizNode):
 		
 		for face in self._capture_faces:
 			self._capture_faces[face].getOutputTexture().save(paths[face])
+		
+		if mip_min_size != None:
+			savePyramid(loadFaces(prefix, directory), prefix, directory, mip_min_size)
+		
+		return paths
 	
 	def remove(self):
+		self._schedule_event.remove()
 		for face in self._capture_faces:
 			self._capture_faces[face].remove()
 		viz.VizNode.remove(self)
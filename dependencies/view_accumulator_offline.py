@@ -0,0 +1,293 @@
+﻿''' Offline (CPU) counterpart of ViewAccumulatorCube.
+Reproduces the intensity falloff of view_projector.frag without a Vizard session.
+
+The projector (main view) and the cube capture are assumed to share the same center,
+which is how captureViewIntensity sets them up. The length of the reprojected
+fragment coordinate then only depends on the angle between view direction and texel direction:
+	length(dividedCoord.xy) = tan(angle) / tan(PROJECTOR_FOV/2)
+Occlusion (depth test) is not modelled, all surfaces are assumed to be visible from the center. '''
+
+import math
+import numpy as np
+
+from view_math import *
+from path_arrays import loadPathArrays
+from path_resample import iterResampled
+from cube_io import saveFaces
+from cube_hdr import writeHDR, HDR_EXTENSION
+from cube_mip import savePyramid, MIN_SIZE
+
+# edge length (in texels) of the tiles used to cull samples per face
+TILE_SIZE = 32
+
+# number of samples processed per batch (bounds temporary memory)
+SAMPLE_CHUNK = 4096
+
+# number of points used to approximate the outline of a view cone on a face
+CONE_SEGMENTS = 16
+
+def clamp(value, min_v, max_v):
+	return max(min(value, max_v), min_v)
+
+def distScale(aperture_scale):
+	''' distance factor computed from aperture_scale (see view_projector.frag) '''
+	return aperture_scale + (1.0-aperture_scale)*10.0
+
+def frameIntensity(frame_weight):
+	''' maximum intensity added per frame for the given frame_weight (see view_projector.frag) '''
+	return 0.1 * (frame_weight + (1.0-frame_weight)*0.1)
+
+def coneAngle(aperture_scale):
+	''' half angle (radians) of the view cone receiving non-zero intensity '''
+	focal = 1.0 / math.tan(math.radians(PROJECTOR_FOV) * 0.5)
+	return math.atan(1.0 / (focal * distScale(aperture_scale)))
+
+def intensityFromCos(cos_angle, aperture_scale):
+	''' returns intensity (before frame weighting) for the cosine of the angle
+	between view direction and texel direction. Vectorized over cos_angle. '''
+	cos_angle = np.asarray(cos_angle, dtype = np.float64)
+	focal = 1.0 / math.tan(math.radians(PROJECTOR_FOV) * 0.5)
+	scale = focal * distScale(aperture_scale)
+	cos_safe = np.maximum(cos_angle, 1e-6)
+	tan_angle = np.sqrt(np.maximum(1.0 - cos_safe*cos_safe, 0.0)) / cos_safe
+	return np.where(cos_angle > 0.0, np.maximum(1.0 - tan_angle*scale, 0.0), 0.0)
+
+def _coneTileBounds(face, directions, cone_angle, resolution, tile_size):
+	''' returns tile index ranges [x0, x1], [y0, y1] covering the view cones on a face
+	and a mask of cones touching the face at all. '''
+	local = np.dot(directions, eulerToMatrix(FACE_EULER[face]))
+
+	# orthonormal basis around each view direction
+	helper = np.zeros_like(local)
+	use_x = np.abs(local[:,1]) > 0.9
+	helper[use_x, 0] = 1.0
+	helper[~use_x, 1] = 1.0
+	e1 = normalize(np.cross(local, helper))
+	e2 = np.cross(local, e1)
+
+	# slightly enlarged outline, such that the polygon encloses the projected cone
+	outer = math.atan(math.tan(cone_angle) / math.cos(math.pi / CONE_SEGMENTS) * 1.01)
+	phi = np.linspace(0.0, 2.0*math.pi, CONE_SEGMENTS, endpoint = False)
+	ring = np.cos(phi)[None,:,None] * e1[:,None,:] + np.sin(phi)[None,:,None] * e2[:,None,:]
+	outline = math.cos(outer) * local[:,None,:] + math.sin(outer) * ring
+
+	z = outline[...,2]
+	all_front = np.all(z > 1e-6, axis = 1)
+	any_front = np.any(z > 1e-6, axis = 1)
+
+	z_safe = np.where(z > 1e-6, z, 1.0)
+	a = outline[...,0] / z_safe
+	b = outline[...,1] / z_safe
+
+	# cones crossing the face plane are not bounded after projection, use the whole face
+	a_min = np.where(all_front, a.min(axis = 1), -1.0)
+	a_max = np.where(all_front, a.max(axis = 1), 1.0)
+	b_min = np.where(all_front, b.min(axis = 1), -1.0)
+	b_max = np.where(all_front, b.max(axis = 1), 1.0)
+
+	# the face covers directions up to FACE_ANGLE away from its axis
+	near_face = local[:,2] > math.cos(min(FACE_ANGLE + outer, math.pi))
+
+	valid = near_face & any_front & (a_max >= -1.0) & (a_min <= 1.0) & (b_max >= -1.0) & (b_min <= 1.0)
+
+	# face coordinates to texel coordinates (row 0 = top), padded by one texel
+	tiles = (resolution + tile_size - 1) // tile_size
+	to_texel = resolution * 0.5
+	x0 = np.floor(((np.clip(a_min, -1.0, 1.0) + 1.0) * to_texel - 1.0) / tile_size)
+	x1 = np.floor(((np.clip(a_max, -1.0, 1.0) + 1.0) * to_texel + 1.0) / tile_size)
+	y0 = np.floor(((1.0 - np.clip(b_max, -1.0, 1.0)) * to_texel - 1.0) / tile_size)
+	y1 = np.floor(((1.0 - np.clip(b_min, -1.0, 1.0)) * to_texel + 1.0) / tile_size)
+
+	bounds = [np.clip(v, 0, tiles-1).astype(np.int64) for v in (x0, x1, y0, y1)]
+	return bounds[0], bounds[1], bounds[2], bounds[3], valid
+
+def accumulateFace(output, face, directions, weights, aperture_scale, tile_size = TILE_SIZE):
+	''' adds view intensities for all (normalized) view directions to the face array "output".
+	weights scale the contribution of each direction (e.g. frame intensity times number of frames).
+	weights of shape (n, k) accumulate k outputs at once into output of shape (res, res, k),
+	the intensities are then only evaluated once for all outputs. '''
+	resolution = output.shape[0]
+	tile_size = min(tile_size, resolution)
+	tiles = (resolution + tile_size - 1) // tile_size
+	texels = faceDirections(face, resolution).astype(np.float32)
+	cone_scale = distScale(aperture_scale) / math.tan(math.radians(PROJECTOR_FOV) * 0.5)
+
+	for start in range(0, len(directions), SAMPLE_CHUNK):
+		chunk = directions[start:start+SAMPLE_CHUNK].astype(np.float32)
+		chunk_weights = weights[start:start+SAMPLE_CHUNK].astype(np.float32)
+
+		x0, x1, y0, y1, valid = _coneTileBounds(face, chunk, coneAngle(aperture_scale), resolution, tile_size)
+		if not np.any(valid):
+			continue
+		samples = np.flatnonzero(valid)
+		x0, x1, y0, y1 = x0[valid], x1[valid], y0[valid], y1[valid]
+
+		# expand to (tile, sample) pairs
+		width = x1 - x0 + 1
+		counts = width * (y1 - y0 + 1)
+		pair_sample = np.repeat(np.arange(len(samples)), counts)
+		offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		pair_tile = (y0[pair_sample] + offset // width[pair_sample]) * tiles + x0[pair_sample] + offset % width[pair_sample]
+
+		order = np.argsort(pair_tile, kind = 'mergesort')
+		pair_tile = pair_tile[order]
+		pair_sample = samples[pair_sample[order]]
+		splits = np.flatnonzero(np.diff(pair_tile)) + 1
+
+		for group_tile, group in zip(pair_tile[np.r_[0, splits]], np.split(pair_sample, splits)):
+			row = (group_tile // tiles) * tile_size
+			col = (group_tile % tiles) * tile_size
+			block = texels[row:row+tile_size, col:col+tile_size]
+
+			# intensity = max(1 - tan(angle) * cone_scale, 0), evaluated in place
+			cos_angle = np.dot(block.reshape(-1, 3), chunk[group].T)
+			np.maximum(cos_angle, 1e-6, out = cos_angle)
+			intensity = cos_angle * cos_angle
+			np.subtract(1.0, intensity, out = intensity)
+			np.maximum(intensity, 0.0, out = intensity)
+			np.sqrt(intensity, out = intensity)
+			intensity /= cos_angle
+			intensity *= -cone_scale
+			intensity += 1.0
+			np.maximum(intensity, 0.0, out = intensity)
+			output[row:row+tile_size, col:col+tile_size] += np.dot(intensity, chunk_weights[group]).reshape(block.shape[:2] + chunk_weights.shape[1:])
+
+class OfflineViewAccumulatorCube(object):
+	''' Computes the view intensities captured by ViewAccumulatorCube on the CPU.
+	Accumulated faces can be retrieved by getOutputFace(face), where face is one of FACE_NAMES.
+	All faces can be stored calling saveAll(...), using the same file names as ViewAccumulatorCube.
+	Each accumulated sample corresponds to one rendered frame of the real time capture. '''
+
+	def __init__(self, frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024):
+		self._frame_weight = clamp(frame_weight, 0.0, 1.0)
+		self._aperture_scale = clamp(aperture_scale, 0.0, 1.0)
+		self._resolution = resolution
+
+		# accumulated float intensities per face
+		self._faces = {}
+
+		# number of samples (frames) accumulated
+		self._sample_count = 0
+
+		self.clear()
+
+	def clear(self):
+		''' resets all accumulated intensities '''
+		self._faces = dict((face, np.zeros((self._resolution, self._resolution), dtype = np.float32)) for face in FACE_NAMES)
+		self._sample_count = 0
+
+	def setFrameWeight(self, weight):
+		''' set scaling factor for per frame view accumulation.
+		Float value will be clamped to range [0.0,1.0].'''
+		self._frame_weight = clamp(weight, 0.0, 1.0)
+
+	def getFrameWeight(self):
+		''' get scaling factor for per frame view accumulation.
+		Float value returned is in range [0.0,1.0].'''
+		return self._frame_weight
+
+	def setApertureScale(self, ap_scale):
+		''' sets the aperture_scale (scaling factor for the view cone aperture).
+		value has to be float in range [0.0,1.0]. '''
+		self._aperture_scale = clamp(ap_scale, 0.0, 1.0)
+
+	def getApertureScale(self):
+		''' gets the aperture_scale (scaling factor for the view cone aperture).
+		value is float in range [0.0,1.0]. '''
+		return self._aperture_scale
+
+	def getResolution(self):
+		return self._resolution
+
+	def getSampleCount(self):
+		''' returns the number of samples accumulated so far '''
+		return self._sample_count
+
+	def getOutputFace(self, face = 'p_z'):
+		return self._faces[face]
+
+	def getOutputFaces(self):
+		''' returns map of face name to float32 intensity array '''
+		return self._faces
+
+	def accumulateDirections(self, directions, weights = None):
+		''' accumulates view directions (shape (n, 3)).
+		Optional weights (shape (n,)) count how many frames each direction is held. '''
+		directions = normalize(np.asarray(directions, dtype = np.float64).reshape(-1, 3))
+		if weights is None:
+			weights = np.ones(len(directions))
+		weights = np.asarray(weights, dtype = np.float64)
+		if len(directions) == 0:
+			return
+
+		# identical directions (e.g. standing still) only need to be evaluated once
+		directions, inverse = np.unique(directions, axis = 0, return_inverse = True)
+		weights = np.bincount(inverse.ravel(), weights = weights, minlength = len(directions))
+		weights *= frameIntensity(self._frame_weight)
+
+		for face in FACE_NAMES:
+			accumulateFace(self._faces[face], face, directions, weights, self._aperture_scale)
+
+		self._sample_count += len(inverse)
+
+	def accumulateRotations(self, euler, weights = None):
+		''' accumulates view orientations given as euler angles (shape (n, 3)) '''
+		self.accumulateDirections(forwardFromEuler(euler), weights)
+
+	def accumulatePath(self, path, rate = None):
+		''' accumulates a path given as map of arrays (see path_arrays.recordsToArrays).
+		If rate is None, each recorded sample counts as one frame,
+		otherwise the path is resampled with the given number of frames per second (see path_resample). '''
+		if rate is None:
+			self.accumulateRotations(path["rotation"])
+			return
+
+		for chunk in iterResampled(path, rate):
+			self.accumulateDirections(chunk["direction"])
+
+	def accumulateFile(self, file_name, rate = None):
+		''' accumulates an animation path file written by AnimationPathRecorder (see accumulatePath) '''
+		self.accumulatePath(loadPathArrays(file_name), rate)
+
+	def saveAll(self, prefix = "accumulated", directory = "", mip_min_size = MIN_SIZE):
+		''' saves all cube faces to .bmp file (clamped to 8 bit like ViewAccumulatorCube.saveAll).
+		"prefix" denotes the filename prefix for each file.
+		"directory" specifies the output directory.
+		"mip_min_size" specifies the smallest level of the mip pyramid saved along (see cube_mip), None skips the pyramid.
+		Returns full path of files saved. '''
+		paths = saveFaces(self._faces, prefix, directory)
+		if mip_min_size != None:
+			savePyramid(self._faces, prefix, directory, mip_min_size)
+		return paths
+	
+	def saveHDR(self, file_name = "accumulated", dtype = np.float32, mip_min_size = MIN_SIZE):
+		''' saves all cube faces unclamped to an HDR cube file (see cube_hdr),
+		along with sample count and capture parameters and the mip pyramid (see cube_mip). '''
+		writeHDR(file_name, self._faces, self.getMetadata(), dtype)
+		if mip_min_size != None:
+			if file_name.endswith(HDR_EXTENSION):
+				file_name = file_name[:-len(HDR_EXTENSION)]
+			savePyramid(self._faces, file_name, min_size = mip_min_size, hdr = True)
+	
+	def getMetadata(self):
+		''' returns sample count and capture parameters as dict '''
+		return {
+			"sample_count" : self._sample_count,
+			"frame_weight" : self._frame_weight,
+			"aperture_scale" : self._aperture_scale,
+			"resolution" : self._resolution
+		}
+
+if __name__ == '__main__':
+	import sys
+	import time
+
+	file_name = "test_animation.txt"
+	if len(sys.argv) > 1:
+		file_name = sys.argv[1]
+
+	start = time.time()
+	accumulator = OfflineViewAccumulatorCube(frame_weight = 0.5, aperture_scale = 0.5)
+	accumulator.accumulateFile(file_name)
+	accumulator.saveAll()
+	print "Accumulated %d samples in %.2f s." % (accumulator.getSampleCount(), time.time() - start)
@@ -0,0 +1,133 @@
+﻿''' Vectorized transformation helpers, which don't require a Vizard session.
+Conventions follow Vizard: left handed coordinates, x = right, y = up, z = forward,
+euler angles in degrees given as [yaw, pitch, roll]. '''
+
+import numpy as np
+
+# vertical field of view used by ViewAccumulator.update for the projector frustum
+PROJECTOR_FOV = 60.0
+
+# cube faces in the order used for file suffixes by ViewAccumulatorCube.saveAll
+FACE_NAMES = ('p_x', 'n_x', 'p_y', 'n_y', 'p_z', 'n_z')
+
+# orientation of each face capture (same values as in ViewAccumulatorCube)
+FACE_EULER = {
+	'p_x' : [90,0,0],
+	'n_x' : [-90,0,0],
+	'p_y' : [0,-90,0],
+	'n_y' : [0,90,0],
+	'p_z' : [0,0,0],
+	'n_z' : [-180,0,0]
+}
+
+# angle (radians) between a face axis and the directions through the corners of the face
+FACE_ANGLE = np.arccos(1.0 / np.sqrt(3.0))
+
+def eulerToMatrix(euler):
+	''' returns rotation matrices (shape (..., 3, 3)) for euler angles of shape (..., 3).
+	Columns of each matrix are the local x, y and z axis in world coordinates,
+	such that world = M * local. '''
+	euler = np.radians(np.asarray(euler, dtype = np.float64))
+	cy, sy = np.cos(euler[...,0]), np.sin(euler[...,0])
+	cp, sp = np.cos(euler[...,1]), np.sin(euler[...,1])
+	cr, sr = np.cos(euler[...,2]), np.sin(euler[...,2])
+
+	mat = np.empty(euler.shape[:-1] + (3, 3))
+	# M = R_yaw * R_pitch * R_roll
+	mat[...,0,0] = cy*cr + sy*sp*sr
+	mat[...,0,1] = -cy*sr + sy*sp*cr
+	mat[...,0,2] = sy*cp
+	mat[...,1,0] = cp*sr
+	mat[...,1,1] = cp*cr
+	mat[...,1,2] = -sp
+	mat[...,2,0] = -sy*cr + cy*sp*sr
+	mat[...,2,1] = sy*sr + cy*sp*cr
+	mat[...,2,2] = cy*cp
+	return mat
+
+def forwardFromEuler(euler):
+	''' returns the view direction (local +z axis, shape (..., 3)) for euler angles of shape (..., 3). '''
+	euler = np.radians(np.asarray(euler, dtype = np.float64))
+	yaw = euler[...,0]
+	pitch = euler[...,1]
+	return np.stack([
+		np.sin(yaw) * np.cos(pitch),
+		-np.sin(pitch),
+		np.cos(yaw) * np.cos(pitch)
+	], axis = -1)
+
+def normalize(vec):
+	''' normalizes vectors along the last axis. Zero vectors are returned unchanged. '''
+	vec = np.asarray(vec, dtype = np.float64)
+	length = np.sqrt(np.sum(vec*vec, axis = -1))[...,None]
+	return vec / np.where(length > 0.0, length, 1.0)
+
+_face_direction_cache = {}
+
+def faceDirections(face, resolution):
+	''' returns normalized world directions for each texel center of a cube face (shape (res, res, 3)).
+	Row 0 is the top row of the image, column 0 the left column (image order as saved to file).
+	Results are cached per face and resolution. '''
+	key = (face, resolution)
+	if key not in _face_direction_cache:
+		coords = (np.arange(resolution) + 0.5) / resolution * 2.0 - 1.0
+		local = np.empty((resolution, resolution, 3))
+		local[...,0] = coords[None,:]
+		local[...,1] = -coords[:,None]
+		local[...,2] = 1.0
+		world = np.dot(normalize(local), eulerToMatrix(FACE_EULER[face]).T)
+		world.flags.writeable = False
+		_face_direction_cache[key] = world
+	return _face_direction_cache[key]
+
+def eulerToQuat(euler):
+	''' returns unit quaternions [x, y, z, w] (shape (..., 4)) for euler angles of shape (..., 3).
+	The quaternions describe the same rotation as eulerToMatrix. '''
+	half = np.radians(np.asarray(euler, dtype = np.float64)) * 0.5
+	cy, sy = np.cos(half[...,0]), np.sin(half[...,0])
+	cp, sp = np.cos(half[...,1]), np.sin(half[...,1])
+	cr, sr = np.cos(half[...,2]), np.sin(half[...,2])
+
+	# q = q_yaw * q_pitch * q_roll
+	return np.stack([
+		cy*sp*cr + sy*cp*sr,
+		sy*cp*cr - cy*sp*sr,
+		cy*cp*sr - sy*sp*cr,
+		cy*cp*cr + sy*sp*sr
+	], axis = -1)
+
+def quatAngle(q0, q1):
+	''' returns the angle (radians) of the rotation between unit quaternions q0 and q1 (shape (..., 4)) '''
+	dot = np.abs(np.sum(np.asarray(q0) * np.asarray(q1), axis = -1))
+	return 2.0 * np.arccos(np.minimum(dot, 1.0))
+
+def slerp(q0, q1, u):
+	''' spherical linear interpolation between unit quaternions q0 and q1 (shape (..., 4))
+	at parameter u (shape (...)). The shorter arc is used. '''
+	q0 = np.asarray(q0, dtype = np.float64)
+	q1 = np.asarray(q1, dtype = np.float64)
+	u = np.asarray(u, dtype = np.float64)[...,None]
+
+	dot = np.sum(q0 * q1, axis = -1)[...,None]
+	q1 = np.where(dot < 0.0, -q1, q1)
+	dot = np.abs(dot)
+
+	angle = np.arccos(np.minimum(dot, 1.0))
+	sin_angle = np.sin(angle)
+
+	# fall back to linear interpolation for (nearly) identical rotations
+	small = sin_angle < 1e-6
+	sin_safe = np.where(small, 1.0, sin_angle)
+	w0 = np.where(small, 1.0 - u, np.sin((1.0 - u) * angle) / sin_safe)
+	w1 = np.where(small, u, np.sin(u * angle) / sin_safe)
+	return normalize(w0 * q0 + w1 * q1)
+
+def forwardFromQuat(quat):
+	''' returns the view direction (local +z axis, shape (..., 3)) for unit quaternions [x, y, z, w] of shape (..., 4) '''
+	quat = np.asarray(quat, dtype = np.float64)
+	x, y, z, w = quat[...,0], quat[...,1], quat[...,2], quat[...,3]
+	return np.stack([
+		2.0 * (x*z + y*w),
+		2.0 * (y*z - x*w),
+		1.0 - 2.0 * (x*x + y*y)
+	], axis = -1)
@@ -4,6 +4,7 @@ uniform sampler2D depth_tex;
 uniform sampler2D prev_frame_tex;
 uniform float frame_weight;
 uniform float aperture_scale;
+uniform float resolution;
 
 void main (void)
 {
@@ -14,7 +15,7 @@ void main (void)
 	// init color to match last frames projection
 	// new color will be added on top
 	vec4 lastColor;
-	lastColor.rgb = texture2D(prev_frame_tex, gl_FragCoord.xy/1024.0);
+	lastColor.rgb = texture2D(prev_frame_tex, gl_FragCoord.xy/resolution);
 	gl_FragColor.rgb = lastColor.rgb;
 	
 	dividedCoord /= dividedCoord.w;
@@ -3,6 +3,8 @@ import os
 import vizmat
 import math
 
+from transform_cache import TransformCache
+
 def toGL(mat):
 	pos = mat.getPosition()
 	mat.setPosition(pos[0], pos[1], -pos[2])
@@ -16,7 +18,7 @@ def clamp(value, min_v, max_v):
 class ViewProjector(object):
 	''' Implements a shader effect used to accumulate view intensities. '''
 	
-	def __init__(self):
+	def __init__(self, transform_cache = None):
 		# open the fragment shader, assuming it's relative to this code file
 		vertCode = ""
 		with open(os.path.join(os.path.dirname(__file__), 'view_projector.vert'), 'r') as vertFile:
@@ -57,6 +59,9 @@ class ViewProjector(object):
 		# specifies a scaling factor for the view cone aperture (value range [0.0,1.0])
 		self._aperture_scale_uni = viz.addUniformFloat('aperture_scale', 1.0)
 		
+		# size (in pixels) of the render target, used to look up the previous frame
+		self._resolution_uni = viz.addUniformFloat('resolution', 1024.0)
+		
 		# attach all uniforms
 		self._shader.attach([
 			self._inv_view_uni,
@@ -65,7 +70,8 @@ class ViewProjector(object):
 			self._depth_texture_uni, 
 			self._prev_texture_uni,
 			self._frame_weight_uni,
-			self._aperture_scale_uni
+			self._aperture_scale_uni,
+			self._resolution_uni
 		])
 		
 		# Camera used to capture the depth texture.
@@ -74,6 +80,12 @@ class ViewProjector(object):
 		self._depth_cam.setAutoClip(False)
 		self._depth_cam.setRenderTexture(viz.addRenderTexture(format=viz.TEX_DEPTH), buffer=viz.RENDER_DEPTH)
 		
+		# Cache skipping matrix conversions and uploads while the inputs of update don't change.
+		# May be shared between projectors, the main view conversion is then computed once per frame.
+		self._cache = transform_cache
+		if self._cache == None:
+			self._cache = TransformCache()
+		
 	def _getDepthTexture(self):
 		return self._depth_cam.getRenderTexture(viz.RENDER_DEPTH)
 	
@@ -97,6 +109,14 @@ class ViewProjector(object):
 		value is float in range [0.0,1.0]. '''
 		return self._aperture_scale_uni.get()
 
+	def setResolution(self, resolution):
+		''' sets the size (in pixels) of the square render target affected by the projector. '''
+		self._resolution_uni.set(float(resolution))
+	
+	def getResolution(self):
+		''' gets the size (in pixels) of the square render target affected by the projector. '''
+		return self._resolution_uni.get()
+
 	def affect(self, model):
 		"""Allows a model (VizNode) to be specified as a target for texture projection.
 
@@ -106,17 +126,34 @@ class ViewProjector(object):
 		self._model.apply(self._shader)
 		self._model.texture(self._getDepthTexture(), unit=3)
 
+	def setEnabled(self, enabled):
+		''' enables or disables rendering of the depth texture (disable while the affected model isn't rendered) '''
+		self._depth_cam.visible(enabled)
+
+	def getTransformCache(self):
+		''' returns the cache tracking changes of the update inputs (see transform_cache) '''
+		return self._cache
+
 	def update(self, main_view_mat, view_mat, proj, clusterMask=viz.ALLCLIENTS):
 		"""
 		@args vizmat.Transform(), vizmat.Transform(), vizmat.Transform(), int
+		Conversions and uploads are skipped for matrices which didn't change since the last update.
 		"""
+		self._cache.beginFrame(viz.getFrameNumber())
+		key = id(self)
+		
 		# set matrix of depth camera to match this frames projector matrix
-		self._depth_cam.setMatrix(view_mat)
-		self._depth_cam.setProjectionMatrix(proj)
+		self._cache.upload((key, 'depth_view'), view_mat, self._depth_cam.setMatrix)
+		self._cache.upload((key, 'depth_proj'), proj, self._depth_cam.setProjectionMatrix)
+		
+		# view_mat is usually the main view, shared by all projectors using the same cache
+		inv_view, _ = self._cache.derive((key, 'mainViewMat_inv'), [main_view_mat], lambda: toGL(viz.Matrix(main_view_mat)).get())
+		view, _ = self._cache.derive('viewMat', [view_mat], lambda: toGL(viz.Matrix(view_mat)).inverse().get())
+		
 		# update uniform matrices
-		self._inv_view_uni.set(toGL(main_view_mat).get())
-		self._view_uni.set(toGL(view_mat).inverse().get())
-		self._proj_uni.set(proj.get())
+		self._cache.upload((key, 'mainViewMat_inv'), inv_view, self._inv_view_uni.set)
+		self._cache.upload((key, 'viewMat'), view, self._view_uni.set)
+		self._cache.upload((key, 'projMat'), proj, lambda proj: self._proj_uni.set(proj.get()))
 
 	def remove(self):
 		self._shader.remove()
\ No newline at end of file
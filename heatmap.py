@@ -3,11 +3,21 @@ from dependencies.animation_path_recorder import *
 from dependencies.animation_path_player import *
 #from dependencies.omnistereo_frame_recorder import *
 from dependencies.view_accumulator_cube import *
+from dependencies.view_accumulator_offline import *
 from dependencies.heatmap_visualizer import *
+from dependencies.heatmap_aggregator import *
+from dependencies.cube_io import *
+from dependencies.cube_hdr import *
+from dependencies.surface_bake import *
+from dependencies.probe_grid import *
+from dependencies.time_store import *
+from dependencies.heat_colors import *
+from dependencies.batch_pipeline import processDirectory
+from dependencies.result_cache import ResultCache, resultKey, accumulationFiles, hashFile
+from dependencies.accumulation_checkpoint import Checkpoint, openCheckpoint, mergeCheckpointFiles
+from dependencies.update_profiler import enableProfiling, getProfiler
 
-_capture_done = False
-
-def recordViewAnimation():
+def recordViewAnimation(adaptive = False):
 	### replace with your own application setup
 	import viz
 	import vizcam
@@ -27,24 +37,34 @@ def recordViewAnimation():
 	 Create an AnimationPathRecorder and link it to any node, which needs to have it's transformation documented.
 	 If 'start' is set to True the recording will start automatically, otherwise you need to start manually.
 	 you can specify the file name under which the animation will be saved. '.txt' is automatically added.
+	 If 'adaptive' is set to True, frames are only stored while the view moves (see AnimationPathRecorder.setAdaptiveCapture).
 	'''
 	rec = AnimationPathRecorder(start = False)
+	rec.setAdaptiveCapture(adaptive)
 	viz.link(viz.MainView, rec)
+	
+	# recorded samples are written to 'test_animation.txt' in the background while recording
+	rec.streamToFile("test_animation")
 
-	# toggle path recording and saving finished recording to a file named 'test_animation.txt'
+	# toggle path recording, stopping waits until the background writer has written all samples
 	def toggleRecord(rec):
 		if rec.isRunning():
 			rec.stop()
-			rec.writeToFile("test_animation")
+			rec.closeStream(wait = True)
 			print "Animation path saved to test_animation.txt"
+			stats = rec.getCaptureStats()
+			print "%d frames captured, %d samples stored (reduction %.1fx)" % (stats["frames"], stats["samples"], stats["reduction"])
 		else:
+			# recording again continues the file
+			if rec.getStreamWriter() == None:
+				rec.streamToFile("test_animation", append = True)
 			rec.start()
 			print "Animation path recording started."
 
 	vizact.onkeydown('r', toggleRecord, rec)
 	###
 
-def captureViewIntensity():
+def captureViewIntensity(profile = False, cache_directory = None, checkpoint_file = None):
 	### replace with your own application setup
 	import viz
 	import vizact
@@ -63,20 +83,73 @@ def captureViewIntensity():
 	 - While the loaded animation path is playing the accumulator will accumulate view intensity values.
 	 - After the animation player finished playing these intensities will be saved to a cubemap
 	 - The intensity images is then used for final heatmap computation
+	 - profile = True times the per frame callbacks and writes capture_trace.json when done
+	 - If cache_directory is given, results are kept there (see result_cache). A capture of the same recording
+	   with the same parameters is then restored from the cache instead of played back.
+	 - If checkpoint_file is given, the captured intensities are folded into that checkpoint (see accumulation_checkpoint),
+	   which sums up all sessions captured so far.
 	'''
 
+	# time the per frame callbacks of the capture (see update_profiler)
+	if profile:
+		enableProfiling()
+	
 	# load animation path
+	# The path is advanced by a fixed step per frame, such that every run captures the same views
+	# and rendering isn't bound to real time (vsync off).
+	viz.vsync(viz.OFF)
+	
+	# capture parameters, the cache key is built from them and from the accumulator
+	# (the capture position is the main view position before the path is linked)
+	fixed_step = 1.0 / 60.0
+	capture_position = viz.MainView.getPosition()
+	
+	global accumulator
+	accumulator = ViewAccumulatorCube(frame_weight = 0.5, aperture_scale = 0.5, resolution = 1024)
+	
+	# adds the captured intensities to the checkpoint, fold(checkpoint, source) folds them in
+	# (live captures are clamped at 1.0, so they go into a checkpoint of their own, see accumulation_checkpoint)
+	def foldIntoCheckpoint(fold):
+		checkpoint = openCheckpoint(checkpoint_file, accumulator.getFrameWeight(), accumulator.getApertureScale(), accumulator.getResolution(), clamped = True)
+		source = hashFile("test_animation.txt")
+		if checkpoint.contains(source):
+			print "Recording already folded into", checkpoint_file
+		else:
+			fold(checkpoint, source)
+			print "Folded into %s (%d sessions)." % (checkpoint.save(checkpoint_file), len(checkpoint.getSources()))
+	
+	cache = None
+	if cache_directory != None:
+		cache = ResultCache(cache_directory)
+		cache_key = resultKey("test_animation.txt", {
+			"capture" : "ViewAccumulatorCube",
+			"frame_weight" : accumulator.getFrameWeight(),
+			"aperture_scale" : accumulator.getApertureScale(),
+			"resolution" : accumulator.getResolution(),
+			"position" : capture_position,
+			"fixed_step" : fixed_step
+		})
+		# folding a restored capture into the checkpoint needs its frame count (stored along with the entry)
+		entry = cache.getMetadata(cache_key)
+		if entry != None and (checkpoint_file == None or "frames" in entry) and cache.restore(cache_key) != None:
+			print "Intensity capture restored from cache.", cache.getStats()
+			if checkpoint_file != None:
+				parameters = {
+					"frame_weight" : accumulator.getFrameWeight(),
+					"aperture_scale" : accumulator.getApertureScale(),
+					"resolution" : accumulator.getResolution(),
+					"clamped" : True
+				}
+				foldIntoCheckpoint(lambda checkpoint, source: checkpoint.foldFaces(loadFaces("accumulated"), entry["frames"], source, parameters))
+			accumulator.remove()
+			return
+	
 	loader = AnimationPathLoader("test_animation.txt")
-	player = AnimationPathPlayer(path = loader.getAnimationPath())
+	player = AnimationPathPlayer(path = loader.getAnimationPath(), fixed_step = fixed_step)
 	path_link = viz.link(loader.getAnimationPath(), viz.MainView)
 	
-	global accumulator
-	accumulator = ViewAccumulatorCube(frame_weight = 0.5, aperture_scale = 0.5)
-	accumulator.setPosition(viz.MainView.getPosition())
+	accumulator.setPosition(capture_position)
 
-	global _capture_done
-	_capture_done = False
-	
 	cube_textures = {
 		viz.POSITIVE_X : accumulator.getOutputTexture(viz.POSITIVE_X),
 		viz.NEGATIVE_X : accumulator.getOutputTexture(viz.NEGATIVE_X),
@@ -90,26 +163,122 @@ def captureViewIntensity():
 	heat_projector.setPosition(viz.MainView.getPosition())
 	heat_projector.affect(piazza)
 	
-	# update function capturing accumulating view intensity
-	def updateFct(player, accumulator):
-		global _capture_done
+	# saves the accumulated view intensity once the player reached the end of the path
+	def onCaptureDone():
+		accumulator.saveAll()
+		print "Intensity capture done."
+		path_link.remove()
 		
-		if not player.isPlaying():
-			if not _capture_done:
-				accumulator.saveAll()
-				_capture_done = True
-				print "Intensity capture done."
-			elif accumulator != None:
-				accumulator.remove()
-				accumulator = None
-				path_link.remove()
-
-	update = vizact.onupdate(1, updateFct, player, accumulator)
+		frames = accumulator.getScheduleStats()["frames"]
+		if cache != None:
+			cache.store(cache_key, accumulationFiles(resolution = accumulator.getResolution()), {"recording" : "test_animation.txt", "frames" : frames})
+			print "Stored in cache.", cache.getStats()
+		
+		if checkpoint_file != None:
+			foldIntoCheckpoint(lambda checkpoint, source: checkpoint.foldLive(accumulator, frames, source))
+		
+		if getProfiler() != None:
+			getProfiler().printReport()
+			getProfiler().writeTrace("capture_trace.json")
+			print "Callback timings saved to capture_trace.json"
+		
+		# the accumulator is removed after its update of the current frame
+		vizact.ontimer2(0, 0, accumulator.remove)
+
+	player.setCompletionCallback(onCaptureDone)
+	
+def captureViewIntensityOffline(file_name = "test_animation.txt", samples_per_second = None, bucket_duration = None, cache_directory = None, checkpoint_file = None):
+	'''
+	 - Load an animation file and accumulate view intensities on the CPU (no Vizard session needed).
+	 - Each recorded sample counts as one frame of the real time capture,
+	   unless samples_per_second is given (the path is then resampled at a fixed rate, see path_resample).
+	 - Intensities are saved to the same cubemap files as captureViewIntensity() produces,
+	   and unclamped to 'accumulated.hcube' (see cube_hdr).
+	 - If bucket_duration (seconds) is given, intensities per time bucket are saved to 'accumulated.tcube' as well,
+	   such that displayHeatmap(time_file = 'accumulated.tcube') can show any time window (see time_store).
+	 - If cache_directory is given, cube files are restored from there when the recording and parameters are unchanged
+	   (see result_cache).
+	 - If checkpoint_file is given, the intensities are folded into that checkpoint (see accumulation_checkpoint),
+	   such that adding a session doesn't recompute the ones folded in before.
+	'''
+	accumulator = OfflineViewAccumulatorCube(frame_weight = 0.5, aperture_scale = 0.5)
+	
+	cache = None
+	if cache_directory != None:
+		cache = ResultCache(cache_directory)
+		cache_key = resultKey(file_name, {
+			"capture" : "OfflineViewAccumulatorCube",
+			"frame_weight" : accumulator.getFrameWeight(),
+			"aperture_scale" : accumulator.getApertureScale(),
+			"resolution" : accumulator.getResolution(),
+			"rate" : samples_per_second
+		})
 	
-def displayHeatmap(project = True):
+	if cache != None and cache.restore(cache_key) != None:
+		print "Intensity capture restored from cache.", cache.getStats()
+	else:
+		accumulator.accumulateFile(file_name, samples_per_second)
+		accumulator.saveAll()
+		accumulator.saveHDR("accumulated")
+		print "Intensity capture done (%d samples)." % accumulator.getSampleCount()
+		if cache != None:
+			cache.store(cache_key, accumulationFiles(resolution = accumulator.getResolution(), hdr = True), {"recording" : file_name})
+			print "Stored in cache.", cache.getStats()
+
+	if checkpoint_file != None:
+		checkpoint = openCheckpoint(checkpoint_file, accumulator.getFrameWeight(), accumulator.getApertureScale(), accumulator.getResolution())
+		source = hashFile(file_name)
+		if checkpoint.contains(source):
+			print "Recording already folded into", checkpoint_file
+		else:
+			faces, header = readHDR("accumulated")
+			checkpoint.foldFaces(faces, header["sample_count"], source, header)
+			print "Folded into %s (%d sessions)." % (checkpoint.save(checkpoint_file), len(checkpoint.getSources()))
+
+	if bucket_duration != None:
+		# buckets are kept at a lower resolution (see time_store.BUCKET_RESOLUTION)
+		count = captureTimeBucketsFile(file_name, "accumulated", bucket_duration, samples_per_second)
+		print "Time buckets saved (%d buckets)." % count
+
+def captureViewIntensityBatch(directory = "recordings", output_directory = None, processes = 1):
+	'''
+	 - Accumulate view intensities of every recording below 'directory' (see batch_pipeline),
+	   one session per recording in 'output_directory' (default: <directory>/sessions).
+	 - Runs in a single process, as pool workers would import (and run) main.py again.
+	   For all CPUs run the batch outside Vizard: python dependencies/batch_pipeline.py <directory> [<output directory>]
+	 - Sessions which are up to date are skipped, an interrupted batch continues where it stopped when run again.
+	 - Show the mean of all sessions with displayHeatmap(sessions_directory = ...).
+	'''
+	result = processDirectory(directory, output_directory, processes, frame_weight = 0.5, aperture_scale = 0.5)
+	print "Batch capture done (%d processed, %d up to date, %d failed)." % (len(result["done"]), len(result["skipped"]), len(result["failed"]))
+
+def captureProbeGridOffline(file_name = "test_animation.txt", spacing = 2.0, mesh_file = None):
+	'''
+	 - Load an animation file and accumulate view intensities into a lattice of probes covering the walked area
+	   (probes 'spacing' units apart, see probe_grid), such that the heatmap stays correct away from the start position.
+	 - Probes are saved to 'probes.pgrid'.
+	 - If the scene geometry is given as .obj/.ply (mesh_file), the probes around each vertex are interpolated
+	   and saved to 'probes_baked.ply', which can be shown with displayBakedHeatmap().
+	'''
+	path = loadPathArrays(file_name)
+	grid = ProbeGrid.fromPositions(path["position"], spacing)
+	grid.accumulatePath(path)
+	grid.save("probes")
+	print "Probe capture done (%d probes)." % grid.getProbeCount()
+
+	if mesh_file != None:
+		mesh = loadMesh(mesh_file)
+		values = grid.sampleMesh(mesh)
+		writePly("probes_baked.ply", mesh, values, intensityColors(values))
+
+def displayHeatmap(project = True, sessions_directory = None, hdr_file = None, time_file = None, colormap = 'heat'):
 	'''
 	 - Load accumulated view textures
+	   (or the mean of all sessions found below sessions_directory, see heatmap_aggregator)
+	   (or an HDR cube file, normalized such that intensities don't saturate, see cube_hdr)
+	   (or a time bucket file, the displayed time window is chosen with two sliders, see time_store)
 	 - Add cube projector with given textures and shader converting intensities to heat map colors
+	   (colormap names a color table of heat_colors, which also renders report images without Vizard)
 	 - Let projector affect scene
 	 - auto_update = True will set the shader uniforms automatically each frame
 	'''
@@ -126,19 +295,35 @@ def displayHeatmap(project = True):
 	if project:
 		piazza = viz.addChild('piazza.osgb')
 
-		cube_textures = {
-			viz.POSITIVE_X : viz.addTexture('accumulated_p_x.bmp'),
-			viz.NEGATIVE_X : viz.addTexture('accumulated_n_x.bmp'),
-			viz.POSITIVE_Y : viz.addTexture('accumulated_p_y.bmp'),
-			viz.NEGATIVE_Y : viz.addTexture('accumulated_n_y.bmp'),
-			viz.POSITIVE_Z : viz.addTexture('accumulated_p_z.bmp'),
-			viz.NEGATIVE_Z : viz.addTexture('accumulated_n_z.bmp')
-		}
+		time_source = None
+		if time_file != None:
+			time_source = TimeWindowSource(TimeBucketStore(time_file))
+			vizact.onexit(time_source.remove)
+			time_source.setWindowFraction(0.0, 1.0)
+			cube_textures = time_source.getTextures()
+		elif hdr_file != None:
+			cube_textures = hdrToVizTextures(hdr_file)
+		elif sessions_directory == None:
+			cube_textures = {
+				viz.POSITIVE_X : viz.addTexture('accumulated_p_x.bmp'),
+				viz.NEGATIVE_X : viz.addTexture('accumulated_n_x.bmp'),
+				viz.POSITIVE_Y : viz.addTexture('accumulated_p_y.bmp'),
+				viz.NEGATIVE_Y : viz.addTexture('accumulated_n_y.bmp'),
+				viz.POSITIVE_Z : viz.addTexture('accumulated_p_z.bmp'),
+				viz.NEGATIVE_Z : viz.addTexture('accumulated_n_z.bmp')
+			}
+		else:
+			# single process, pool workers would import (and run) main.py again
+			faces = aggregateSessions(findSessions(sessions_directory), mode = 'mean', processes = 1)
+			cube_textures = toVizTextures(faces)
 		
-		heat_projector = HeatmapVisualizer(cube_textures, auto_update = True)
+		heat_projector = HeatmapVisualizer(cube_textures, auto_update = True, colormap = colormap)
 		heat_projector.setPosition(viz.MainView.getPosition())
 		heat_projector.affect(piazza)
 		
+		if time_source != None:
+			time_source.setVisualizer(heat_projector)
+		
 		## GUI for manipulation of the output heatmap
 		
 		i_slider = viz.addSlider()
@@ -154,10 +339,30 @@ def displayHeatmap(project = True):
 			0.0
 		])
 		i_text.setScale([0.4, 0.4, 1.0])
+		
+		# start and end of the displayed time window (fractions of the recording)
+		time_sliders = []
+		if time_source != None:
+			for row, (label, value) in enumerate([('window end', 1.0), ('window start', 0.0)]):
+				t_slider = viz.addSlider()
+				t_y = i_y + (row+1) * 1.5 * t_slider.getBoundingBox().height
+				t_slider.setPosition([i_x, t_y, 0])
+				t_slider.set(value)
+				
+				t_text = viz.addText(label, parent = viz.SCREEN)
+				t_text.setPosition([
+					i_x-t_text.getBoundingBox().width/2-t_slider.getBoundingBox().width/2,
+					t_y-i_y+0.01,
+					0.0
+				])
+				t_text.setScale([0.4, 0.4, 1.0])
+				time_sliders.append(t_slider)
 				
 		def onSlider(obj,pos):
 			if obj == i_slider:
 				heat_projector.setIntensityScale(pos+0.5)
+			elif obj in time_sliders:
+				time_source.setWindowFraction(time_sliders[1].get(), time_sliders[0].get())
 				
 		viz.callback(viz.SLIDER_EVENT, onSlider)
 	else:
@@ -166,4 +371,21 @@ def displayHeatmap(project = True):
 		env = viz.addEnvironmentMap('accumulated.bmp', faces = ['_p_x', '_n_x', '_p_y', '_n_y', '_p_z', '_n_z'])
 
 		sb = vizshape.addSkyBox()
-		sb.texture(env)
\ No newline at end of file
+		sb.texture(env)
+
+def displayBakedHeatmap(file_name = "baked.ply"):
+	'''
+	 - Load scene geometry with view intensities baked into its vertex colors (see surface_bake)
+	 - No projector, depth cameras or shader are needed, intensities are part of the geometry
+	'''
+	import viz
+	import vizcam
+
+	viz.setMultiSample(4)
+
+	viz.go()
+
+	#vizcam.WalkNavigate()
+
+	baked = viz.addChild(file_name)
+	baked.disable(viz.LIGHTING)
@@ -11,8 +11,44 @@
 
 #captureViewIntensity()
 
+#   - profile = True reports which per frame callbacks cost capture frame rate (capture_trace.json)
+
+#captureViewIntensity(profile = True)
+
+#   - cache_directory keeps results, an unchanged recording with unchanged parameters is restored instead of captured again
+
+#captureViewIntensity(cache_directory = "result_cache")
+
+#   - alternatively accumulate on the CPU, without playing back the animation in real time
+
+#captureViewIntensityOffline()
+
+#   - checkpoint_file sums up all sessions captured so far, a new recording only adds its own intensities
+#     (checkpoints merge with: python dependencies/accumulation_checkpoint.py merge all.hcube a.hcube b.hcube)
+
+#captureViewIntensityOffline(checkpoint_file = "sessions.hcube")
+
+#   - or accumulate every recording below a directory (resumes where an interrupted batch stopped)
+#     on all CPUs, run it outside Vizard: python dependencies/batch_pipeline.py recordings
+
+#captureViewIntensityBatch("recordings")
+
+#   - or accumulate into a grid of probes, if participants walk around (see probe_grid)
+
+#captureProbeGridOffline(mesh_file = "piazza.obj")
+
 # 3.) render heatmap based on view intensities
 #   - choose project = True to display heatmap projected onto geometry
 #   - choose project = False to view environment map of intensity values (greyscale)
 
-displayHeatmap(project = True)
\ No newline at end of file
+displayHeatmap(project = True)
+
+#   - choose time_file to select the displayed time window with sliders
+#     (requires captureViewIntensityOffline(bucket_duration = 10.0))
+
+#displayHeatmap(time_file = "accumulated.tcube")
+
+#   - alternatively bake intensities onto the scene geometry exported as .obj/.ply
+#     (python dependencies/surface_bake.py piazza.obj test_animation.txt baked.ply) and display the result
+
+#displayBakedHeatmap("baked.ply")
\ No newline at end of file